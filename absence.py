@@ -0,0 +1,161 @@
+"""Absence watchdog: notices target devices that have stopped advertising"""
+import heapq
+import itertools
+import time
+
+DEFAULT_INTERVAL_FACTOR = 4.0
+
+# Listening seconds after the watchdog starts before it reports anyone, while
+# the scanner settles and each device is heard from for the first time
+DEFAULT_GRACE = 10.0
+
+# Weight of the newest gap in each device's learned advert interval
+_INTERVAL_ALPHA = 0.1
+
+
+class _Watch:
+    __slots__ = ("key", "last_seen", "last_real", "interval", "heard", "absent")
+
+    def __init__(self, key, listened, now):
+        self.key = key
+        self.last_seen = listened
+        self.last_real = now
+        self.interval = None
+        self.heard = False
+        self.absent = False
+
+
+class AbsenceWatchdog:
+    """One deadline heap for every watched device, checked by whoever owns the clock
+
+    seen() is the per-advert part: it moves the device's last-seen time
+    and learns its typical gap between adverts, with no heap work after
+    the device's first advert, which arms it. A device that has never
+    been heard from is never reported. Each armed device keeps exactly one
+    heap entry, which may be stale-early; expire() pops the due entries,
+    pushes back those heard from since, and reports a device as silent
+    when it has been quiet longer than max(timeout, factor x its learned
+    interval) -- and again every such limit for as long as the silence
+    lasts, so each report stands for one missed reading, not a verdict.
+    Nothing is reported in the first grace seconds of listening.
+
+    Silence is measured in listening time: while set_listening(False)
+    says the radio is resting, no advert could have been heard, so the
+    clock stops. All times are seconds on clock (any monotonic clock; the
+    benchmark passes a virtual one), and every method also takes now
+    explicitly. Not thread-safe: call it from the thread that delivers
+    the adverts, as ProximityScanner does from the monitor loop.
+    """
+
+    def __init__(self, keys, timeout, factor=DEFAULT_INTERVAL_FACTOR, clock=time.monotonic,
+                 grace=DEFAULT_GRACE, listening=True):
+        if timeout <= 0 or factor <= 0:
+            raise ValueError("timeout and factor must be positive")
+        self.timeout = timeout
+        self.factor = factor
+        self.grace = grace
+        self.clock = clock
+        self._listening = listening
+        self._listened = 0.0
+        self._on_since = clock()
+        self._watches = {key: _Watch(key, 0.0, self._on_since) for key in keys}
+        self._heap = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._watches)
+
+    @property
+    def listening(self):
+        return self._listening
+
+    def _push(self, deadline, watch):
+        heapq.heappush(self._heap, (deadline, next(self._seq), watch))
+
+    def _listen_time(self, now):
+        if self._listening:
+            return self._listened + (now - self._on_since)
+        return self._listened
+
+    def limit(self, key):
+        """Seconds of silence after which key counts as absent"""
+        interval = self._watches[key].interval
+        if interval is None:
+            return self.timeout
+        return max(self.timeout, self.factor * interval)
+
+    def set_limits(self, timeout, factor):
+        if timeout <= 0 or factor <= 0:
+            raise ValueError("timeout and factor must be positive")
+        self.timeout = timeout
+        self.factor = factor
+
+    def set_listening(self, listening, now=None):
+        """Stop (False) or restart (True) the silence clock as the radio rests and listens"""
+        if listening == self._listening:
+            return
+        now = self.clock() if now is None else now
+        if listening:
+            self._on_since = now
+        else:
+            self._listened += now - self._on_since
+        self._listening = listening
+
+    def seen(self, key, now=None):
+        """Record an advert from key"""
+        watch = self._watches.get(key)
+        if watch is None:
+            return
+        if now is None:
+            now = self.clock()
+        listened = self._listened + (now - self._on_since) if self._listening else self._listened
+        if not watch.heard:
+            watch.heard = True
+            self._push(listened + self.timeout, watch)
+        elif watch.absent:
+            # The gap through a silence is not an advert interval
+            watch.absent = False
+        elif watch.interval is None:
+            watch.interval = listened - watch.last_seen
+        else:
+            watch.interval += _INTERVAL_ALPHA * (listened - watch.last_seen - watch.interval)
+        watch.last_seen = listened
+        watch.last_real = now
+
+    def expire(self, now=None):
+        """[(key, real time of its last advert)] for devices silent for another limit"""
+        now = self.clock() if now is None else now
+        if not self._listening:
+            return []
+        listened = self._listen_time(now)
+        if listened < self.grace:
+            return []
+        heap = self._heap
+        timeout = self.timeout
+        factor = self.factor
+        fired = []
+        while heap and heap[0][0] <= listened:
+            watch = heapq.heappop(heap)[2]
+            limit = timeout if watch.interval is None else max(timeout, factor * watch.interval)
+            deadline = watch.last_seen + limit
+            if deadline <= listened:
+                watch.absent = True
+                fired.append((watch.key, watch.last_real))
+                # Report it again after another limit of silence
+                deadline = listened + limit
+            self._push(deadline, watch)
+        return fired
+
+    def next_deadline(self, now=None):
+        """Seconds until expire() may next report something, or None while not listening"""
+        if not self._listening or not self._heap:
+            return None
+        now = self.clock() if now is None else now
+        return max(0.0, max(self._heap[0][0], self.grace) - self._listen_time(now))
+
+
+def watchdog_from_config(config, keys, clock=time.monotonic, listening=True):
+    """AbsenceWatchdog over keys from device_timeout and absence_interval_factor, or None when it is off"""
+    if not config.absence_watchdog:
+        return None
+    return AbsenceWatchdog(keys, config.device_timeout, config.absence_interval_factor, clock, listening=listening)
@@ -0,0 +1,200 @@
+"""Background execution of lock/unlock actions with intent coalescing"""
+import threading
+import time
+from collections import deque
+
+from metrics import ACTION_BUCKETS, get_metrics
+from tracing import get_tracer, now as trace_now
+
+LOCK = "lock"
+UNLOCK = "unlock"
+
+_metrics = get_metrics()
+_attempts = _metrics.counter("proxilock_action_attempts_total", "Lock/unlock actions run, by action", ("action",))
+_failures = _metrics.counter("proxilock_action_failures_total", "Lock/unlock actions that failed, by action", ("action",))
+_not_run = _metrics.counter(
+    "proxilock_action_not_run_total", "Lock/unlock intents cancelled, expired or dropped before running", ("action",)
+)
+_latency = _metrics.histogram(
+    "proxilock_action_latency_seconds",
+    "Time from the decision to the action finishing, by action",
+    ("action",),
+    buckets=ACTION_BUCKETS
+)
+_tracer = get_tracer()
+
+
+class _Intent:
+    __slots__ = ("kind", "created_at", "callbacks", "decision", "traced_at")
+
+    def __init__(self, kind, created_at):
+        self.kind = kind
+        self.created_at = created_at
+        self.callbacks = []
+        # Tracing: the decision that asked for this, and when (perf_counter)
+        self.decision = None
+        self.traced_at = 0.0
+
+
+class ActionExecutor:
+    """Runs lock/unlock actions on a worker thread so BLE callbacks never block
+
+    - a submit matching an intent that is already pending coalesces into it
+    - a lock removes any pending unlock (locking always wins)
+    - intents older than max_age when the worker reaches them are dropped
+    - at most max_pending intents wait; beyond that the oldest is dropped
+
+    actions maps a kind to a zero-argument callable returning True on
+    success. on_done callbacks receive that result, or None when the
+    intent never ran (cancelled, expired or dropped), and run on the
+    worker thread or the cancelling thread.
+    """
+
+    def __init__(self, actions, max_pending=4, max_age=3.0, clock=time.monotonic):
+        self.actions = dict(actions)
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self._clock = clock
+        self._pending = deque()
+        self._running_kind = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.stats = {
+            "submitted": 0,
+            "coalesced": 0,
+            "preempted": 0,
+            "expired": 0,
+            "dropped": 0,
+            "executed": 0,
+        }
+
+    def submit(self, kind, on_done=None):
+        """Queue an intent; returns False if it coalesced into a pending one"""
+        if kind not in self.actions:
+            raise ValueError(f"Unknown action: {kind}")
+
+        cancelled = []
+        with self._condition:
+            self.stats["submitted"] += 1
+            for intent in self._pending:
+                if intent.kind == kind:
+                    if on_done is not None:
+                        intent.callbacks.append(on_done)
+                    self.stats["coalesced"] += 1
+                    if _tracer.enabled:
+                        _tracer.instant("coalesced", _tracer.current(), action=kind, into=intent.decision)
+                    return False
+
+            if kind == LOCK:
+                for intent in [i for i in self._pending if i.kind == UNLOCK]:
+                    self._pending.remove(intent)
+                    cancelled.append(intent)
+                    self.stats["preempted"] += 1
+
+            intent = _Intent(kind, self._clock())
+            if _tracer.enabled:
+                intent.decision = _tracer.current()
+                intent.traced_at = trace_now()
+            if on_done is not None:
+                intent.callbacks.append(on_done)
+            self._pending.append(intent)
+            while len(self._pending) > self.max_pending:
+                cancelled.append(self._pending.popleft())
+                self.stats["dropped"] += 1
+
+            self._ensure_worker()
+            self._condition.notify()
+
+        self._finish(cancelled, None)
+        return True
+
+    def cancel(self, kind):
+        """Drop a pending (not yet running) intent of this kind"""
+        with self._condition:
+            cancelled = [i for i in self._pending if i.kind == kind]
+            for intent in cancelled:
+                self._pending.remove(intent)
+        self._finish(cancelled, None)
+        return bool(cancelled)
+
+    def is_busy(self, kind=None):
+        """Whether an intent (optionally of this kind) is pending or running"""
+        with self._condition:
+            if kind is None:
+                return bool(self._pending) or self._running_kind is not None
+            return self._running_kind == kind or any(i.kind == kind for i in self._pending)
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def start(self):
+        with self._condition:
+            self._ensure_worker()
+
+    def stop(self, timeout=None):
+        with self._condition:
+            self._stopping = True
+            cancelled = list(self._pending)
+            self._pending.clear()
+            self._condition.notify_all()
+            thread = self._thread
+        self._finish(cancelled, None)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if self._stopping or self._thread is not threading.current_thread():
+                    return
+                intent = self._pending.popleft()
+                if self._clock() - intent.created_at > self.max_age:
+                    self.stats["expired"] += 1
+                    expired = True
+                else:
+                    self._running_kind = intent.kind
+                    expired = False
+
+            if expired:
+                self._finish([intent], None)
+                continue
+
+            _attempts.labels(intent.kind).inc()
+            if intent.decision is not None:
+                _tracer.complete("queued", intent.traced_at, trace_now(), intent.decision, action=intent.kind)
+                _tracer.flow_end(intent.decision)
+                _tracer.set_current(intent.decision)
+            with _tracer.span(intent.kind) as span:
+                try:
+                    result = bool(self.actions[intent.kind]())
+                except Exception as e:
+                    print(f"Action {intent.kind} failed: {e}")
+                    result = False
+                finally:
+                    with self._condition:
+                        self._running_kind = None
+                        self.stats["executed"] += 1
+                span.set(ok=result)
+            _tracer.set_current(None)
+            if not result:
+                _failures.labels(intent.kind).inc()
+            _latency.labels(intent.kind).observe(self._clock() - intent.created_at)
+            self._finish([intent], result)
+
+    @staticmethod
+    def _finish(intents, result):
+        for intent in intents:
+            if result is None:
+                _not_run.labels(intent.kind).inc()
+            for callback in intent.callbacks:
+                try:
+                    callback(result)
+                except Exception as e:
+                    print(f"Action callback failed: {e}")
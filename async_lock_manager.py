@@ -0,0 +1,211 @@
+"""asyncio counterparts of lock_manager for use on the monitor's event loop"""
+import asyncio
+import contextvars
+import os
+import plistlib
+import subprocess
+import weakref
+
+from config import get_config
+from lock_manager import (
+    FN_KEY_SCRIPT, LOCK_SCREEN_ACTIVE_SCRIPT, LOCK_SHORTCUT_SCRIPT, SCREEN_SAVER_SCRIPT, unlock_script
+)
+from lock_state import get_lock_state_service
+from metrics import time_spawn
+from script_executor import AsyncPersistentScriptRunner
+from secret_provider import get_secret_provider
+from tracing import get_tracer
+
+_runners = weakref.WeakKeyDictionary()
+_background = set()
+_tracer = get_tracer()
+
+# Decision behind the action running in this task. Spans name it explicitly
+# because the tracer's current decision is per thread, and the monitor loop's
+# thread serves every decision; tasks started by gather() inherit it.
+_decision = contextvars.ContextVar("decision", default=None)
+
+
+def _span(name, **args):
+    return _tracer.span(name, _decision.get(), **args)
+
+
+async def run_command(argv, timeout):
+    """Run a command without blocking the loop and return its stdout bytes
+
+    Raises the same exceptions as subprocess.run(check=True, timeout=...).
+    The child is killed if the timeout expires or the caller is cancelled.
+    """
+    with time_spawn(os.path.basename(argv[0])):
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise subprocess.TimeoutExpired(argv, timeout)
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, argv, stdout, stderr)
+        return stdout
+
+
+def get_async_script_runner():
+    """Warm script host for the running event loop"""
+    loop = asyncio.get_running_loop()
+    runner = _runners.get(loop)
+    if runner is None:
+        runner = _runners[loop] = AsyncPersistentScriptRunner()
+    return runner
+
+
+def set_async_script_runner(runner):
+    """Use this runner for the running event loop (e.g. a stand-in host on Linux)"""
+    _runners[asyncio.get_running_loop()] = runner
+
+
+async def run_applescript(script, timeout):
+    try:
+        return await get_async_script_runner().run(script, timeout)
+    except FileNotFoundError:
+        output = await run_command(["osascript", "-e", script], timeout)
+        return output.decode("utf-8", errors="ignore").strip()
+
+
+async def probe_screen_locked():
+    """One ioreg spawn, parsed in-process instead of through sh and PlistBuddy"""
+    try:
+        output = await run_command(["ioreg", "-n", "Root", "-d1", "-a"], timeout=2)
+        root = plistlib.loads(output)
+        return bool(root["IOConsoleUsers"][0].get("CGSSessionScreenIsLocked", False))
+    except (subprocess.SubprocessError, FileNotFoundError, plistlib.InvalidFileException,
+            ValueError, KeyError, IndexError, TypeError):
+        return False
+
+
+async def is_screen_locked(max_age=None):
+    with _span("is_screen_locked", max_age=max_age) as span:
+        service = get_lock_state_service()
+        locked = service.cached_state(max_age)
+        if locked is None:
+            locked = await probe_screen_locked()
+            service.record_probe(locked)
+        span.set(locked=locked)
+    return locked
+
+
+async def _activate_screen_saver():
+    try:
+        with _span("screensaver_activate"):
+            await run_applescript(SCREEN_SAVER_SCRIPT, timeout=1)
+        return True
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+        return False
+
+
+async def lock_mac_screen(decision=None):
+    """decision: trace ID the lock stages are recorded under"""
+    _decision.set(decision)
+    config = get_config()
+
+    if config.use_screen_saver_lock and await _activate_screen_saver():
+        get_lock_state_service().expect_change()
+        return True
+
+    try:
+        with _span("lock_shortcut"):
+            await run_applescript(LOCK_SHORTCUT_SCRIPT, timeout=2)
+        get_lock_state_service().expect_change()
+        return True
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+        pass
+
+    if not config.use_screen_saver_lock and await _activate_screen_saver():
+        get_lock_state_service().expect_change()
+        return True
+
+    return False
+
+
+async def is_lock_screen_active():
+    if not await is_screen_locked():
+        return False
+
+    try:
+        return "true" in (await run_applescript(LOCK_SCREEN_ACTIVE_SCRIPT, timeout=2)).lower()
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+        return await is_screen_locked()
+
+
+async def _quietly(name, coro):
+    try:
+        with _span(name):
+            await coro
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+        pass
+
+
+async def wake_display():
+    """Wake the display with caffeinate, pmset and a key press all at once
+
+    caffeinate -u -t 2 holds a user-activity assertion for two seconds; it
+    is left running in the background instead of being waited for.
+    """
+    with _span("wake_display"):
+        caffeinate = asyncio.get_running_loop().create_task(
+            _quietly("caffeinate", run_command(["caffeinate", "-u", "-t", "2"], timeout=3))
+        )
+        _background.add(caffeinate)
+        caffeinate.add_done_callback(_background.discard)
+
+        await asyncio.gather(
+            _quietly("pmset", run_command(["pmset", "wake"], timeout=2)),
+            _quietly("fn_key", run_applescript(FN_KEY_SCRIPT, timeout=2)),
+        )
+
+
+async def unlock_mac_screen(decision=None):
+    """decision: trace ID the unlock stages are recorded under"""
+    _decision.set(decision)
+    screen_was_locked, _ = await asyncio.gather(is_screen_locked(), wake_display())
+
+    # verify screen is locked (after waking)
+    if not await is_screen_locked(max_age=0):
+        if not screen_was_locked:
+            return False
+        with _span("settle_wait"):
+            await asyncio.sleep(1.0)
+        if not await is_screen_locked(max_age=0):
+            return False
+
+    with _span("is_lock_screen_active") as span:
+        lock_screen_verified = await is_lock_screen_active()
+        span.set(active=lock_screen_verified)
+    if not lock_screen_verified:
+        if not await is_screen_locked():
+            return False
+
+    # Only now take the password: take() wipes the prefetched copy, which an
+    # early return above must leave for the next attempt
+    with _span("keychain") as span:
+        provider = get_secret_provider()
+        span.set(cached=provider.is_cached())
+        password = await asyncio.get_running_loop().run_in_executor(None, provider.take)
+    if not password:
+        return False
+
+    try:
+        with _span("type_password"):
+            await run_applescript(unlock_script(password), timeout=5)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+        return False
+
+    get_lock_state_service().expect_change()
+    return True
@@ -0,0 +1,230 @@
+"""Shared helpers for the benchmark scripts"""
+import argparse
+import atexit
+import contextlib
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# Metrics where a larger number is an improvement
+_HIGHER_IS_BETTER = ("adverts_per_sec", "ops_per_sec")
+
+
+def isolated_config(**overrides):
+    """ProxiLockConfig backed by a throwaway file so benchmarks never touch the user's settings"""
+    from config import ProxiLockConfig
+
+    fd, path = tempfile.mkstemp(prefix="proxi_lock_bench_", suffix=".json")
+    os.close(fd)
+    os.remove(path)
+    config = ProxiLockConfig(path)
+
+    def cleanup():
+        config.flush()
+        if os.path.exists(path):
+            os.remove(path)
+
+    atexit.register(cleanup)
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    return config
+
+
+@contextlib.contextmanager
+def quiet():
+    """Send print() and stdout log output to /dev/null while still paying its formatting cost"""
+    from ring_log import get_logger
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            yield
+        finally:
+            get_logger().drain()
+
+
+class RecordingExecutor:
+    """Stands in for main._action_executor: remembers what would have run, and when"""
+
+    def __init__(self):
+        self.submitted = []
+        self.submitted_at = []
+
+    def submit(self, kind, on_done=None):
+        self.submitted.append(kind)
+        self.submitted_at.append(time.perf_counter())
+        return True
+
+    def is_busy(self, kind=None):
+        return False
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+@contextlib.contextmanager
+def _only_caller_allocates(func):
+    """Hold the ring-log drain threads and the cyclic GC while allocations are counted
+
+    Draining frees the records func logged, on another thread, and a GC
+    pass frees garbage from earlier calls; either makes the counts
+    negative. The default logger and the one func belongs to (if it is a
+    RingLogger method) are drained first, then kept from draining, and
+    stdout is flushed so its buffer starts the window empty.
+    """
+    from ring_log import RingLogger, get_logger
+
+    loggers = [get_logger()]
+    owner = getattr(func, "__self__", None)
+    if isinstance(owner, RingLogger) and owner is not loggers[0]:
+        loggers.append(owner)
+    held = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        sys.stdout.flush()
+        for logger in loggers:
+            logger.drain()
+            if logger._thread is None:
+                # The first record would start the thread, which takes the lock held below
+                logger._start()
+            logger._drain_lock.acquire()
+            held.append(logger)
+        yield
+    finally:
+        for logger in held:
+            logger._drain_lock.release()
+        if gc_enabled:
+            gc.enable()
+
+
+def measure(func, calls, alloc_samples=2000):
+    """Run func(*args) for every args tuple in calls and return throughput, latency and allocation stats"""
+    for args in calls[:min(len(calls), 1000)]:
+        func(*args)
+
+    started = time.perf_counter()
+    for args in calls:
+        func(*args)
+    elapsed = time.perf_counter() - started
+
+    clock = time.perf_counter_ns
+    latencies = []
+    append = latencies.append
+    for args in calls:
+        t0 = clock()
+        func(*args)
+        append(clock() - t0)
+    latencies.sort()
+
+    sample = calls[:alloc_samples]
+    with _only_caller_allocates(func):
+        tracemalloc.start()
+        try:
+            peak_total = 0
+            blocks_before = sys.getallocatedblocks()
+            for args in sample:
+                current, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                func(*args)
+                peak_total += tracemalloc.get_traced_memory()[1] - current
+            blocks_after = sys.getallocatedblocks()
+        finally:
+            tracemalloc.stop()
+    assert peak_total >= 0 and blocks_after >= blocks_before, (
+        f"negative allocation ({peak_total} B, {blocks_after - blocks_before} blocks): another thread freed memory"
+    )
+
+    count = len(calls)
+    return {
+        "adverts": count,
+        "adverts_per_sec": count / elapsed if elapsed > 0 else float("inf"),
+        "p50_ns": percentile(latencies, 0.50),
+        "p99_ns": percentile(latencies, 0.99),
+        "alloc_bytes_per_advert": peak_total / len(sample) if sample else 0.0,
+        "net_blocks_per_advert": (blocks_after - blocks_before) / len(sample) if sample else 0.0,
+    }
+
+
+def print_results(results):
+    names = sorted(results)
+    width = max(len(n) for n in names) if names else 10
+    print(f"{'benchmark':<{width}}  {'adverts/s':>12}  {'p50 ns':>9}  {'p99 ns':>9}  {'alloc B':>8}  {'net blk':>8}")
+    for name in names:
+        r = results[name]
+        print(
+            f"{name:<{width}}  {r['adverts_per_sec']:>12,.0f}  {r['p50_ns']:>9,.0f}  "
+            f"{r['p99_ns']:>9,.0f}  {r['alloc_bytes_per_advert']:>8.1f}  {r['net_blocks_per_advert']:>8.2f}"
+        )
+
+
+def _baseline_path(name):
+    if os.sep in name or name.endswith(".json"):
+        return name
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_baseline(name, results):
+    path = _baseline_path(name)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2, sort_keys=True)
+    print(f"Saved baseline to {path}")
+
+
+def compare_baseline(name, results, tolerance):
+    """Print deltas against a saved baseline and return the list of regressions"""
+    path = _baseline_path(name)
+    with open(path, "r") as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    for bench, metrics in sorted(results.items()):
+        old = baseline.get(bench)
+        if not old:
+            continue
+        for metric in ("adverts_per_sec", "p50_ns", "p99_ns"):
+            if metric not in metrics or metric not in old or not old[metric]:
+                continue
+            change = (metrics[metric] - old[metric]) / old[metric]
+            worse = -change if metric in _HIGHER_IS_BETTER else change
+            marker = "REGRESSION" if worse > tolerance else ""
+            print(f"{bench:<28} {metric:<16} {old[metric]:>14,.0f} -> {metrics[metric]:>14,.0f} ({change:+.1%}) {marker}")
+            if marker:
+                regressions.append((bench, metric, change))
+    return regressions
+
+
+def run_suite(description, suite, argv=None):
+    """Parse the common command line, run suite(args) -> results, then save/compare baselines"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--count", type=int, default=50000, help="adverts per benchmark")
+    parser.add_argument("--save", metavar="NAME", help="save results as a baseline")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown before --compare fails")
+    parser.add_argument("--trace", metavar="PATH", help="use a recorded trace instead of synthetic adverts")
+    args = parser.parse_args(argv)
+
+    results = suite(args)
+    print_results(results)
+
+    if args.save:
+        save_baseline(args.save, results)
+    if args.compare:
+        if compare_baseline(args.compare, results, args.tolerance):
+            sys.exit(1)
+    return results
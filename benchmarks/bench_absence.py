@@ -0,0 +1,170 @@
+"""Absence watchdog: time to lock when the target goes silent, and cost with many tracked devices
+
+The first part runs a ProximityScanner through main.proximity_callback
+(lock actions recorded, not run): the target advertises every 100 ms,
+then stops as if Bluetooth had been switched off, while a loop calls
+check_absence() when it asks to be called, as the monitor loop does.
+It runs without the watchdog (the Mac never locks), and with it in
+count mode (each silence limit is one FAR reading) and time mode (FAR
+has held since the last advert); the startup grace period is skipped.
+The second part runs the watchdog alone on a virtual clock with
+--devices tracked devices advertising every 20 ms to 1.5 s (5% of
+adverts lost), silences a tenth of them halfway through, and reports
+the per-advert and per-check cost, how long each silence took to
+notice, and any device wrongly reported absent.
+
+    python benchmarks/bench_absence.py --devices 1000 --seconds 60
+"""
+import argparse
+import heapq
+import random
+import time
+
+import _common
+
+from absence import AbsenceWatchdog
+from bench_hot_path import TARGET_ADDRESS, stub_lock_actions
+from hysteresis import HYSTERESIS_COUNT, HYSTERESIS_TIME
+
+
+class _Submissions:
+    """Stands in for main's ActionExecutor and records when each action was submitted"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, kind, on_done=None):
+        self.submitted.append((kind, time.perf_counter()))
+
+    def is_busy(self, kind=None):
+        return False
+
+
+def silent_target(watchdog_on, hysteresis_mode, device_timeout, give_up):
+    """Seconds from the target's last advert to the lock being submitted, or None"""
+    import config
+    from ble_trace import TraceAdvertisement, TraceDevice
+    from scanner import ProximityScanner
+
+    with stub_lock_actions() as main, _common.quiet():
+        config._config = _common.isolated_config(
+            target_address=TARGET_ADDRESS, device_timeout=device_timeout, absence_watchdog=watchdog_on,
+            hysteresis_mode=hysteresis_mode
+        )
+        saved = (main._action_executor, main.last_proximity)
+        submissions = _Submissions()
+        main._action_executor = submissions
+        main.last_proximity = None
+        scanner = ProximityScanner(main.proximity_callback)
+        main._monitor_instance.scanner_instance = scanner
+        if scanner.watchdog is not None:
+            scanner.watchdog.grace = 0.0
+        target = TraceDevice(TARGET_ADDRESS, "Phone")
+        try:
+            for _ in range(20):
+                time.sleep(0.1)
+                scanner._detection_callback(target, TraceAdvertisement(-30, None, {}, 0.0))
+            last_advert = time.perf_counter()
+            while not submissions.submitted and time.perf_counter() - last_advert < give_up:
+                wait = scanner.check_absence()
+                time.sleep(give_up / 10 if wait is None else min(wait, give_up))
+        finally:
+            main._action_executor, main.last_proximity = saved
+            main._monitor_instance.scanner_instance = None
+    if not submissions.submitted:
+        return None
+    return submissions.submitted[0][1] - last_advert
+
+
+class _VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def many_devices(devices, seconds, timeout, factor, check_every, seed):
+    rng = random.Random(seed)
+    clock = _VirtualClock()
+    keys = list(range(devices))
+    intervals = {key: rng.uniform(0.02, 1.5) for key in keys}
+    silenced = set(rng.sample(keys, max(1, devices // 10)))
+    silence_at = seconds / 2
+    watchdog = AbsenceWatchdog(keys, timeout, factor, clock)
+
+    # Next advert per device: its interval plus up to 10 ms of advDelay jitter, with
+    # about 5% of adverts missed, as on a busy channel
+    upcoming = [(rng.uniform(0, intervals[key]), key) for key in keys]
+    heapq.heapify(upcoming)
+    seen_seconds = 0.0
+    adverts = 0
+    check_seconds = 0.0
+    checks = 0
+    detected = {}
+    false_absences = 0
+    next_check = check_every
+    while clock.now < seconds:
+        t, key = upcoming[0]
+        if next_check <= t:
+            clock.now = next_check
+            started = time.perf_counter()
+            fired = watchdog.expire(next_check)
+            check_seconds += time.perf_counter() - started
+            checks += 1
+            for absent, _ in fired:
+                if absent in silenced and next_check >= silence_at:
+                    detected.setdefault(absent, next_check - silence_at)
+                else:
+                    false_absences += 1
+            next_check += check_every
+            continue
+        clock.now = t
+        heapq.heapreplace(upcoming, (t + intervals[key] + rng.uniform(0, 0.01), key))
+        if (key in silenced and t >= silence_at) or rng.random() < 0.05:
+            continue
+        started = time.perf_counter()
+        watchdog.seen(key, t)
+        seen_seconds += time.perf_counter() - started
+        adverts += 1
+    delays = sorted(detected.values())
+    return {
+        "adverts": adverts,
+        "seen_ns": seen_seconds / max(1, adverts) * 1e9,
+        "check_us": check_seconds / max(1, checks) * 1e6,
+        "silenced": len(silenced),
+        "detected": len(delays),
+        "delay_p50": _common.percentile(delays, 0.5),
+        "delay_max": delays[-1] if delays else 0.0,
+        "false": false_absences,
+        "heap": len(watchdog._heap),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=60.0, help="virtual seconds to simulate")
+    parser.add_argument("--device-timeout", type=float, default=3.0)
+    parser.add_argument("--factor", type=float, default=4.0, help="silence limit in learned advert intervals")
+    parser.add_argument("--check-every", type=float, default=0.1, help="virtual seconds between expire() calls")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    give_up = 8.0
+    for watchdog_on, mode in ((False, HYSTERESIS_COUNT), (True, HYSTERESIS_COUNT), (True, HYSTERESIS_TIME)):
+        delay = silent_target(watchdog_on, mode, 1.0, give_up)
+        outcome = (f"never locked (gave up after {give_up:g} s)" if delay is None
+                   else f"lock submitted {delay:.2f} s after the last advert")
+        print(f"target silenced, device_timeout 1 s, watchdog {'on' if watchdog_on else 'off'}, {mode} mode: {outcome}")
+
+    print(f"{'devices':>8} {'adverts':>10} {'seen ns':>8} {'check us':>9} {'silenced':>9} {'noticed':>8} "
+          f"{'delay p50/max s':>16} {'false':>6} {'heap':>6}")
+    for devices in sorted({10, args.devices}):
+        r = many_devices(devices, args.seconds, args.device_timeout, args.factor, args.check_every, args.seed)
+        print(f"{devices:>8,} {r['adverts']:>10,} {r['seen_ns']:>8.0f} {r['check_us']:>9.1f} {r['silenced']:>9} "
+              f"{r['detected']:>8} {r['delay_p50']:>7.2f}/{r['delay_max']:<8.2f} {r['false']:>6} {r['heap']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Advert callback latency while lock/unlock automation is slow
+
+Drives walk-away/return cycles through main.proximity_callback with lock
+and unlock stubbed to sleep like the real AppleScript paths, once with the
+actions run inline (the old behaviour) and once through ActionExecutor.
+
+    python benchmarks/bench_action_executor.py --lock-seconds 0.5 --unlock-seconds 2
+"""
+import argparse
+import contextlib
+import time
+
+import _common
+
+
+class InlineExecutor:
+    """Runs each intent synchronously inside the advert callback"""
+
+    def __init__(self, actions):
+        self.actions = actions
+
+    def submit(self, kind, on_done=None):
+        result = bool(self.actions[kind]())
+        if on_done is not None:
+            on_done(result)
+        return True
+
+    def is_busy(self, kind=None):
+        return False
+
+
+@contextlib.contextmanager
+def slow_actions(main, lock_seconds, unlock_seconds):
+    state = {"locked": False}
+
+    def lock():
+        time.sleep(lock_seconds)
+        state["locked"] = True
+        return True
+
+    def unlock():
+        time.sleep(unlock_seconds)
+        state["locked"] = False
+        return True
+
+    saved = {name: getattr(main, name) for name in ("lock_mac_screen", "unlock_mac_screen", "is_screen_locked")}
+    main.lock_mac_screen = lock
+    main.unlock_mac_screen = unlock
+    main.is_screen_locked = lambda max_age=None: state["locked"]
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(main, name, value)
+
+
+def run(main, executor, cycles, advert_interval, required):
+    saved_executor = main._action_executor
+    main._action_executor = executor
+    latencies = []
+    try:
+        for _ in range(cycles):
+            sequence = ["FAR"] * (required + 40) + ["NEAR"] * 60
+            far_count = 0
+            for proximity in sequence:
+                far_count = far_count + 1 if proximity == "FAR" else 0
+                started = time.perf_counter()
+                main.proximity_callback(proximity, -80 if proximity == "FAR" else -35, far_count)
+                elapsed = time.perf_counter() - started
+                latencies.append(elapsed * 1000.0)
+                time.sleep(max(0.0, advert_interval - elapsed))
+    finally:
+        main._action_executor = saved_executor
+    latencies.sort()
+    return latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=2)
+    parser.add_argument("--advert-interval", type=float, default=0.02)
+    parser.add_argument("--lock-seconds", type=float, default=0.5)
+    parser.add_argument("--unlock-seconds", type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    import config
+    import main as app
+    from action_executor import ActionExecutor, LOCK, UNLOCK
+
+    config._config = _common.isolated_config(consecutive_far_required=5)
+    actions = {LOCK: lambda: app.lock_mac_screen(), UNLOCK: lambda: app.unlock_mac_screen()}
+
+    print(f"{'mode':<10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>9}")
+    with slow_actions(app, args.lock_seconds, args.unlock_seconds), _common.quiet():
+        results = {}
+        for name, executor in (("inline", InlineExecutor(actions)), ("executor", ActionExecutor(actions))):
+            results[name] = run(app, executor, args.cycles, args.advert_interval, config._config.consecutive_far_required)
+            if isinstance(executor, ActionExecutor):
+                executor.stop(timeout=args.unlock_seconds + 1)
+    for name, latencies in results.items():
+        print(f"{name:<10} {_common.percentile(latencies, 0.5):>8.3f} "
+              f"{_common.percentile(latencies, 0.99):>8.3f} {latencies[-1]:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""End-to-end unlock time: blocking lock_manager vs async_lock_manager
+
+Every external command is replaced by a sleep of a modelled duration, so
+the comparison shows what overlapping independent steps buys without
+needing macOS. The screen is reported locked throughout and the password
+is not prefetched unless --prefetched is given.
+
+    python benchmarks/bench_async_unlock.py --runs 5 --caffeinate-ms 2000
+"""
+import argparse
+import asyncio
+import contextlib
+import plistlib
+import subprocess
+import time
+
+import _common
+
+LOCKED_IOREG = plistlib.dumps({"IOConsoleUsers": [{"CGSSessionScreenIsLocked": True}]})
+
+
+class SlowLockedBackend:
+    spawns_per_probe = 3
+    pushes_notifications = False
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def probe(self):
+        time.sleep(self.seconds)
+        return True
+
+    def subscribe(self, callback):
+        pass
+
+    def unsubscribe(self):
+        pass
+
+
+class SlowSecretBackend:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def fetch(self):
+        time.sleep(self.seconds)
+        return bytearray(b"hunter2")
+
+
+def script_seconds(script, costs):
+    if "keystroke \"q\"" in script or "key code 63" in script:
+        return costs["applescript"]
+    if "frontmost" in script:
+        return costs["frontmost"]
+    if "keystroke" in script:
+        return costs["typing"]
+    return costs["applescript"]
+
+
+def command_seconds(argv, costs):
+    return costs.get(argv[0], 0.0)
+
+
+@contextlib.contextmanager
+def modelled_commands(costs):
+    import async_lock_manager
+    import lock_manager
+
+    def fake_run(argv, *args, **kwargs):
+        time.sleep(command_seconds(argv, costs))
+        return subprocess.CompletedProcess(argv, 0, b"", b"")
+
+    def fake_applescript(script, timeout):
+        time.sleep(script_seconds(script, costs))
+        return "true"
+
+    async def fake_run_command(argv, timeout):
+        await asyncio.sleep(command_seconds(argv, costs))
+        return LOCKED_IOREG if argv[0] == "ioreg" else b"hunter2\n"
+
+    async def fake_async_applescript(script, timeout):
+        await asyncio.sleep(script_seconds(script, costs))
+        return "true"
+
+    saved = (subprocess.run, lock_manager.run_applescript,
+             async_lock_manager.run_command, async_lock_manager.run_applescript)
+    subprocess.run = fake_run
+    lock_manager.run_applescript = fake_applescript
+    async_lock_manager.run_command = fake_run_command
+    async_lock_manager.run_applescript = fake_async_applescript
+    try:
+        yield
+    finally:
+        (subprocess.run, lock_manager.run_applescript,
+         async_lock_manager.run_command, async_lock_manager.run_applescript) = saved
+
+
+def reset_state(costs, prefetched):
+    from lock_state import LockStateService, set_lock_state_service
+    from secret_provider import SecretProvider, set_secret_provider
+
+    set_lock_state_service(LockStateService(SlowLockedBackend(costs["ioreg"])))
+    provider = SecretProvider(SlowSecretBackend(costs["security"]))
+    if prefetched:
+        provider.prefetch(blocking=True)
+    set_secret_provider(provider)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--prefetched", action="store_true", help="password already cached by a script lock")
+    parser.add_argument("--caffeinate-ms", type=float, default=2000.0)
+    parser.add_argument("--pmset-ms", type=float, default=60.0)
+    parser.add_argument("--ioreg-ms", type=float, default=40.0)
+    parser.add_argument("--security-ms", type=float, default=120.0)
+    parser.add_argument("--applescript-ms", type=float, default=60.0)
+    parser.add_argument("--frontmost-ms", type=float, default=90.0)
+    parser.add_argument("--typing-ms", type=float, default=1400.0)
+    args = parser.parse_args(argv)
+
+    costs = {
+        "caffeinate": args.caffeinate_ms / 1000.0,
+        "pmset": args.pmset_ms / 1000.0,
+        "ioreg": args.ioreg_ms / 1000.0,
+        "security": args.security_ms / 1000.0,
+        "applescript": args.applescript_ms / 1000.0,
+        "frontmost": args.frontmost_ms / 1000.0,
+        "typing": args.typing_ms / 1000.0,
+    }
+
+    import async_lock_manager
+    import config
+    import lock_manager
+
+    config._config = _common.isolated_config()
+
+    results = {"blocking": [], "async": []}
+    with modelled_commands(costs), _common.quiet():
+        for _ in range(args.runs):
+            reset_state(costs, args.prefetched)
+            started = time.perf_counter()
+            assert lock_manager.unlock_mac_screen()
+            results["blocking"].append((time.perf_counter() - started) * 1000.0)
+
+            reset_state(costs, args.prefetched)
+            started = time.perf_counter()
+            assert asyncio.run(async_lock_manager.unlock_mac_screen())
+            results["async"].append((time.perf_counter() - started) * 1000.0)
+
+    print(f"{'mode':<10} {'p50 ms':>9} {'max ms':>9}")
+    for name, durations in results.items():
+        durations.sort()
+        print(f"{name:<10} {_common.percentile(durations, 0.5):>9.1f} {durations[-1]:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
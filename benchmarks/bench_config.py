@@ -0,0 +1,72 @@
+"""Per-advert config access cost and the cost of rapid menu changes
+
+Access: the reads the advert path makes (target address and name plus
+lock-only mode) through the locked properties versus one snapshot load.
+Changes: a burst of threshold edits like clicking through the menu, saved
+synchronously on every change versus debounced write-behind.
+
+    python benchmarks/bench_config.py --count 200000 --changes 50
+"""
+import argparse
+import time
+
+import _common
+
+
+def property_reads(config):
+    return (config.target_address, config.target_name, config.lock_only_mode)
+
+
+def snapshot_reads(config):
+    snapshot = config.snapshot
+    return (snapshot.target_address, snapshot.target_name, snapshot.lock_only_mode)
+
+
+def menu_burst(config, changes):
+    started = time.perf_counter()
+    for i in range(changes):
+        config.rssi_far = -70 - (i % 20)
+        config.consecutive_far_required = 3 + (i % 5)
+    elapsed = time.perf_counter() - started
+    config.flush()
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=200000)
+    parser.add_argument("--changes", type=int, default=50)
+    parser.add_argument("--save", metavar="NAME", help="save results as a baseline")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    config = _common.isolated_config(target_address="AA:BB:CC:DD:EE:FF", target_name="Phone")
+    calls = [(config,)] * args.count
+    results = {
+        "property_reads": _common.measure(property_reads, calls),
+        "snapshot_reads": _common.measure(snapshot_reads, calls),
+    }
+    _common.print_results(results)
+
+    print()
+    print(f"{'save mode':<14} {'changes':>8} {'writes':>7} {'ms/change':>10}")
+    for name, delay in (("synchronous", None), ("write-behind", 0.5)):
+        config = _common.isolated_config()
+        config._writer.delay = delay
+        config.flush()
+        writes_before = config._writer.write_count
+        elapsed = menu_burst(config, args.changes)
+        writes = config._writer.write_count - writes_before
+        changes = args.changes * 2
+        print(f"{name:<14} {changes:>8} {writes:>7} {elapsed * 1000.0 / changes:>10.3f}")
+
+    if args.save:
+        _common.save_baseline(args.save, results)
+    if args.compare and _common.compare_baseline(args.compare, results, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,115 @@
+"""Devices-menu bookkeeping under a crowd of advertisers
+
+Simulates a busy RF environment: a population of advertisers (most of
+them transient, like rotating private addresses) advertising on a virtual
+clock, with one menu tick per simulated second. Compares the original
+unbounded dict (filter + full sort each tick) with DeviceTable, reporting
+retained memory, entries held and per-tick cost.
+
+    python benchmarks/bench_device_table.py --advertisers 20000 --seconds 120
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+import _common
+
+from device_table import DeviceTable
+
+MENU_TTL = 10.0
+MENU_LIMIT = 25
+
+
+class LegacyDeviceDict:
+    """The menubar's original bookkeeping, kept as the baseline"""
+
+    def __init__(self):
+        self.devices = {}
+
+    def update(self, address, name, rssi, now):
+        self.devices[address] = {"address": address, "name": name, "rssi": rssi, "last_seen": now}
+
+    def tick(self, now):
+        devices = [d for d in self.devices.values() if now - d["last_seen"] < MENU_TTL]
+        return sorted(devices, key=lambda x: x["rssi"], reverse=True)
+
+    def __len__(self):
+        return len(self.devices)
+
+
+class TableAdapter:
+    def __init__(self, capacity):
+        self.table = DeviceTable(capacity=capacity, ttl=MENU_TTL)
+
+    def update(self, address, name, rssi, now):
+        self.table.update(address, name, rssi, now)
+
+    def tick(self, now):
+        return self.table.top_k(MENU_LIMIT, now)
+
+    def __len__(self):
+        return len(self.table)
+
+
+def advert_stream(advertisers, seconds, adverts_per_second, resident, seed):
+    """(second, [(address, name, rssi, t), ...]) for each simulated second"""
+    rng = random.Random(seed)
+    residents = [f"AA:00:00:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}:00" for i in range(resident)]
+    transient_per_second = max(1, (advertisers - resident) // max(1, seconds))
+    next_transient = 0
+    for second in range(seconds):
+        batch = []
+        fresh = [
+            f"{(next_transient + i) >> 16 & 0xFF:02X}:{(next_transient + i) >> 8 & 0xFF:02X}:"
+            f"{(next_transient + i) & 0xFF:02X}:BB:CC:DD"
+            for i in range(transient_per_second)
+        ]
+        next_transient += transient_per_second
+        population = residents + fresh
+        for i in range(adverts_per_second):
+            address = population[rng.randrange(len(population))]
+            batch.append((address, address, rng.randint(-100, -30), second + i / adverts_per_second))
+        yield second, batch
+
+
+def run(store, stream):
+    tick_ns = []
+    for second, batch in stream:
+        for address, name, rssi, t in batch:
+            store.update(address, name, rssi, t)
+        started = time.perf_counter_ns()
+        store.tick(second + 1.0)
+        tick_ns.append(time.perf_counter_ns() - started)
+    tick_ns.sort()
+    return tick_ns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--advertisers", type=int, default=12000, help="distinct addresses over the run")
+    parser.add_argument("--resident", type=int, default=300, help="advertisers present the whole time")
+    parser.add_argument("--seconds", type=int, default=120)
+    parser.add_argument("--rate", type=int, default=2000, help="adverts per simulated second")
+    parser.add_argument("--capacity", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    print(f"{args.advertisers} advertisers ({args.resident} resident), {args.rate} adverts/s, {args.seconds} s")
+    print(f"{'store':<10} {'entries':>8} {'retained KiB':>13} {'tick p50 us':>12} {'tick p99 us':>12}")
+    for name, factory in (("dict", LegacyDeviceDict), ("table", lambda: TableAdapter(args.capacity))):
+        stream = advert_stream(args.advertisers, args.seconds, args.rate, args.resident, args.seed)
+        tracemalloc.start()
+        store = factory()
+        ticks = run(store, stream)
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        # Timing without tracemalloc overhead
+        stream = advert_stream(args.advertisers, args.seconds, args.rate, args.resident, args.seed)
+        ticks = run(factory(), stream)
+        print(f"{name:<10} {len(store):>8} {retained / 1024:>13,.0f} "
+              f"{_common.percentile(ticks, 0.5) / 1000:>12,.1f} {_common.percentile(ticks, 0.99) / 1000:>12,.1f}")
+
+
+if __name__ == "__main__":
+    main()
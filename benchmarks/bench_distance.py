@@ -0,0 +1,138 @@
+"""Distance model: per-advert cost, batch throughput, and lock distance across device types
+
+Three device types with different reference levels (an iPhone, a Watch
+and a tracker tag) walk away from the desk with noisy RSSI. With one set
+of dBm thresholds each locks at a different distance; calibrating each
+from a short guided sample (distance.fit) and setting thresholds in
+metres makes them lock at about the same place. The cost part compares
+the advert path with dBm and metre thresholds, and per-sample against
+batch distance estimates for a trace.
+
+    python benchmarks/bench_distance.py --count 100000
+"""
+import argparse
+import importlib.util
+import random
+import time
+
+import _common
+
+from controller import FAR, ProximityController
+from device_group import DeviceGroup
+from distance import PathLossModel, fit
+from filters import FILTER_EWMA, FILTER_NONE, create_filter
+
+# name: (RSSI at 1 m, path-loss exponent) of the simulated radio
+DEVICE_TYPES = {
+    "iphone": (-59.0, 2.2),
+    "watch": (-68.0, 2.4),
+    "tag": (-75.0, 2.0),
+}
+NOISE_DBM = 4.0
+LOCK_METRES = 3.0
+UNLOCK_METRES = 1.0
+RSSI_FAR = -70
+MAX_UNLOCKING_RSSI = -59
+
+
+def walk_lock_distance(truth, controller, rng, consecutive_far=5, step=0.05):
+    """Metres from the desk when consecutive_far FAR readings in a row first occur"""
+    rssi_filter = create_filter(FILTER_EWMA, alpha=0.3)
+    far = 0
+    metres = 0.3
+    while metres < 30.0:
+        rssi = rssi_filter.update(round(truth.rssi_at(metres) + rng.gauss(0, NOISE_DBM)))
+        far = far + 1 if controller.classify(rssi) == FAR else 0
+        if far >= consecutive_far:
+            return metres
+        metres += step
+    return float("inf")
+
+
+def guided_sample(truth, rng, per_distance=40):
+    return [(d, round(truth.rssi_at(d) + rng.gauss(0, NOISE_DBM))) for d in (0.5, 1.0, 2.0) for _ in range(per_distance)]
+
+
+def lock_distances(walks, seed):
+    rng = random.Random(seed)
+    dbm = ProximityController(-30, RSSI_FAR, MAX_UNLOCKING_RSSI)
+    rows = []
+    for name, (rssi_at_1m, exponent) in DEVICE_TYPES.items():
+        truth = PathLossModel(rssi_at_1m, exponent)
+        model = fit(guided_sample(truth, rng))
+        far, unlocking = model.thresholds(LOCK_METRES, UNLOCK_METRES)
+        metres = ProximityController(-30, round(far), round(unlocking))
+        by_dbm = sorted(walk_lock_distance(truth, dbm, rng) for _ in range(walks))
+        by_metres = sorted(walk_lock_distance(truth, metres, rng) for _ in range(walks))
+        rows.append((name, model, by_dbm, by_metres))
+    return rows
+
+
+def costs(count):
+    rng = random.Random(7)
+    readings = [(rng.randint(-95, -30), None) for _ in range(count)]
+    defaults = _Defaults()
+    results = {}
+    for label, targets in (
+        ("observe_dbm", [("AA", None, None)]),
+        ("observe_metres", [("AA", None, {"lock_distance": 3.0, "unlock_distance": 1.0})]),
+    ):
+        group = DeviceGroup(targets, ProximityController(-30, RSSI_FAR, MAX_UNLOCKING_RSSI),
+                            lambda: create_filter(FILTER_NONE), distance_defaults=defaults)
+        tracked = group.devices[0]
+        results[label] = _common.measure(group.observe, [(tracked, rssi, tx) for rssi, tx in readings])
+
+    model = PathLossModel()
+    results["distance_table"] = _common.measure(model.distance, [(rssi,) for rssi, _ in readings])
+    results["distance_pow"] = _common.measure(model._distance, [(rssi,) for rssi, _ in readings])
+    return results
+
+
+class _Defaults:
+    lock_distance = None
+    unlock_distance = None
+    rssi_at_1m = -59.0
+    path_loss_exponent = 2.0
+
+
+def batch(count):
+    rng = random.Random(3)
+    values = [rng.randint(-100, -30) if i % 10 else rng.uniform(-100, -30) for i in range(count)]
+    model = PathLossModel()
+    started = time.perf_counter()
+    [model.distance(v) for v in values]
+    per_sample = time.perf_counter() - started
+    if importlib.util.find_spec("numpy") is None:
+        return per_sample, None
+    # Pays for importing NumPy and building the array table outside the timing
+    model.distance_batch(values[:1])
+    started = time.perf_counter()
+    model.distance_batch(values)
+    return per_sample, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--walks", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    print(f"Lock distance over {args.walks} walks: dBm thresholds ({RSSI_FAR}/{MAX_UNLOCKING_RSSI}) "
+          f"vs {LOCK_METRES:g} m/{UNLOCK_METRES:g} m after calibration")
+    print(f"{'device':<8} {'fitted model':<44} {'dBm p50/p95 m':>15} {'metres p50/p95 m':>17}")
+    for name, model, by_dbm, by_metres in lock_distances(args.walks, args.seed):
+        print(f"{name:<8} {model!r:<44} "
+              f"{_common.percentile(by_dbm, 0.5):>7.1f}/{_common.percentile(by_dbm, 0.95):<7.1f} "
+              f"{_common.percentile(by_metres, 0.5):>8.1f}/{_common.percentile(by_metres, 0.95):<8.1f}")
+
+    _common.print_results(costs(args.count))
+    per_sample, batched = batch(args.count)
+    line = f"{args.count:,} trace samples: per-sample {per_sample * 1000:.1f} ms"
+    if batched is not None:
+        line += f", distance_batch {batched * 1000:.1f} ms"
+    print(line)
+
+
+if __name__ == "__main__":
+    main()
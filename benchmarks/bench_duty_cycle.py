@@ -0,0 +1,174 @@
+"""Radio-on time and decision latency for each scan duty-cycle policy
+
+Simulates a working day on a virtual clock: long spells at the desk with
+the odd lean back, walks away, time away with the screen script-locked,
+and returns. The target advertises at --advert-rate with noisy RSSI; an
+advert is only seen while the scheduler has the radio on, and the monitor
+loop wakes exactly when main._monitor_loop would. Lock and unlock latency
+are measured from the moment the walk away (or back) starts.
+
+    python benchmarks/bench_duty_cycle.py --hours 8 --device-timeout 3
+"""
+import argparse
+import bisect
+import random
+
+import _common
+
+from controller import FAR, MID, ProximityController
+from duty_cycle import SCAN_POLICIES, DutyCycleScheduler
+
+DESK_RSSI = -25
+LEAN_RSSI = -55
+AWAY_RSSI = -88
+WALK_SECONDS = 8.0
+NOISE_DBM = 4.0
+
+
+def day_timeline(hours, rng):
+    """[(start, end, rssi_from, rssi_to)] segments, plus walk-away and walk-back start times"""
+    segments = []
+    leaves = []
+    returns = []
+    t = 0.0
+    end = hours * 3600.0
+    while t < end:
+        desk = rng.uniform(20, 60) * 60
+        desk_end = t + desk
+        while t < desk_end:
+            calm = rng.uniform(3, 8) * 60
+            segments.append((t, t + calm, DESK_RSSI, DESK_RSSI))
+            t += calm
+            lean = rng.uniform(5, 20)
+            segments.append((t, t + lean, LEAN_RSSI, LEAN_RSSI))
+            t += lean
+        leaves.append(t)
+        segments.append((t, t + WALK_SECONDS, DESK_RSSI, AWAY_RSSI))
+        t += WALK_SECONDS
+        away = rng.uniform(2, 15) * 60
+        segments.append((t, t + away, AWAY_RSSI, AWAY_RSSI))
+        t += away
+        returns.append(t)
+        segments.append((t, t + WALK_SECONDS, AWAY_RSSI, DESK_RSSI))
+        t += WALK_SECONDS
+    return segments, leaves, returns
+
+
+def advert_times(segments, rate, rng):
+    """[(time, rssi)] as the target would send them, radio or not"""
+    adverts = []
+    for start, end, rssi_from, rssi_to in segments:
+        t = start + rng.expovariate(rate)
+        while t < end:
+            mean = rssi_from + (rssi_to - rssi_from) * (t - start) / (end - start)
+            adverts.append((t, int(round(mean + rng.gauss(0, NOISE_DBM)))))
+            t += rng.expovariate(rate)
+    return adverts
+
+
+def simulate(policy, adverts, end, scan_interval, device_timeout, consecutive_far_required):
+    controller = ProximityController(-30, -70, -50)
+    clock = [0.0]
+    scheduler = DutyCycleScheduler(scan_interval, device_timeout, policy, clock=lambda: clock[0])
+    locks = []
+    unlocks = []
+    locked = False
+    far_count = 0
+    last_state = None
+    radio_on = True
+    radio_seconds = 0.0
+    wakeups = 0
+    seen = 0
+    now = 0.0
+    i = 0
+
+    while now < end:
+        # The monitor loop tick: same decisions as ProximityMonitor._duty_cycle
+        clock[0] = now
+        wakeups += 1
+        scheduler.observe(last_state, now)
+        scheduler.set_script_locked(locked, now)
+        radio_on = scheduler.radio_on(now)
+        delay = scan_interval if radio_on else scheduler.next_change(now)
+        tick_end = min(now + delay, end)
+
+        if radio_on:
+            radio_seconds += tick_end - now
+            while i < len(adverts) and adverts[i][0] < tick_end:
+                t, rssi = adverts[i]
+                i += 1
+                seen += 1
+                state = controller.classify(rssi)
+                if state == FAR:
+                    far_count += 1
+                    if far_count == consecutive_far_required and not locked:
+                        locked = True
+                        locks.append(t)
+                elif state == MID:
+                    far_count = 0
+                else:
+                    far_count = 0
+                    if locked:
+                        locked = False
+                        unlocks.append(t)
+                last_state = state
+        else:
+            while i < len(adverts) and adverts[i][0] < tick_end:
+                i += 1
+        now = tick_end
+
+    return {
+        "radio_seconds": radio_seconds,
+        "wakeups": wakeups,
+        "seen": seen,
+        "locks": locks,
+        "unlocks": unlocks,
+    }
+
+
+def latencies(events, starts, others):
+    """Delay from the latest start before each event, and events with no such start (false triggers)"""
+    delays = []
+    false = 0
+    for t in events:
+        s = bisect.bisect_right(starts, t) - 1
+        o = bisect.bisect_right(others, t) - 1
+        if s < 0 or (o >= 0 and others[o] > starts[s]):
+            false += 1
+        else:
+            delays.append(t - starts[s])
+    delays.sort()
+    return delays, false
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=float, default=8.0)
+    parser.add_argument("--advert-rate", type=float, default=4.0, help="target adverts per second")
+    parser.add_argument("--scan-interval", type=float, default=0.2)
+    parser.add_argument("--device-timeout", type=float, default=3.0)
+    parser.add_argument("--consecutive-far", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    segments, leaves, returns = day_timeline(args.hours, rng)
+    adverts = advert_times(segments, args.advert_rate, rng)
+    end = segments[-1][1]
+
+    print(f"{end / 3600:.1f} h simulated, {len(leaves)} walks away, {len(adverts):,} target adverts")
+    print(f"{'policy':<11} {'radio on':>9} {'wakeups/h':>10} {'lock p50/p95 s':>15} "
+          f"{'unlock p50/p95 s':>17} {'false locks':>12} {'missed':>7}")
+    for policy in SCAN_POLICIES:
+        result = simulate(policy, adverts, end, args.scan_interval, args.device_timeout, args.consecutive_far)
+        lock_delays, false_locks = latencies(result["locks"], leaves, returns)
+        unlock_delays, _ = latencies(result["unlocks"], returns, leaves)
+        missed = len(leaves) - len(lock_delays)
+        print(f"{policy:<11} {result['radio_seconds'] / end:>9.1%} {result['wakeups'] * 3600 / end:>10,.0f} "
+              f"{_common.percentile(lock_delays, 0.5):>7.2f}/{_common.percentile(lock_delays, 0.95):<7.2f} "
+              f"{_common.percentile(unlock_delays, 0.5):>8.2f}/{_common.percentile(unlock_delays, 0.95):<8.2f} "
+              f"{false_locks:>12} {missed:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Compare RSSI smoothing filters by lock latency and false-lock rate
+
+Each scenario is a walk-away trace: the device sits at the desk (with
+occasional multipath dips) and then leaves at a known time. A lock before
+that time is a false lock; the delay after it is the lock latency.
+
+    python benchmarks/bench_filters.py
+    python benchmarks/bench_filters.py --trace office.trace --away-at 42.5
+"""
+import argparse
+import random
+import statistics
+
+import _common
+
+from controller import ProximityController
+from filters import FILTER_KINDS, create_filter
+
+RSSI_NEAR = -30
+RSSI_FAR = -70
+MAX_UNLOCKING_RSSI = -50
+
+
+def synthetic_walkaway(seed, desk_seconds=600.0, walk_seconds=8.0, tail_seconds=20.0):
+    """Return ([(timestamp, rssi)], away_time) for one simulated departure"""
+    rng = random.Random(seed)
+    interval = rng.choice((0.05, 0.1, 0.2, 0.5))
+    desk_level = rng.uniform(-55, -40)
+    far_level = rng.uniform(-95, -85)
+
+    samples = []
+    t = 0.0
+    dip_left = 0
+    while t < desk_seconds + walk_seconds + tail_seconds:
+        if t < desk_seconds:
+            level = desk_level
+        elif t < desk_seconds + walk_seconds:
+            level = desk_level + (far_level - desk_level) * (t - desk_seconds) / walk_seconds
+        else:
+            level = far_level
+
+        rssi = level + rng.gauss(0, 4)
+        if dip_left == 0 and rng.random() < 0.01:
+            dip_left = rng.randint(1, 3)
+        if dip_left:
+            rssi -= rng.uniform(20, 30)
+            dip_left -= 1
+
+        samples.append((t, int(round(max(-127, min(20, rssi))))))
+        t += interval * rng.uniform(0.8, 1.2)
+    return samples, desk_seconds
+
+
+def recorded_walkaway(path, away_at, address=None):
+    from ble_trace import read_trace
+
+    adverts = list(read_trace(path))
+    if address is None:
+        counts = {}
+        for device, _ in adverts:
+            counts[device.address] = counts.get(device.address, 0) + 1
+        address = max(counts, key=counts.get)
+    adverts = [adv for device, adv in adverts if device.address == address]
+    if not adverts:
+        raise SystemExit(f"No adverts from {address} in {path}")
+    start = adverts[0].timestamp
+    return [(adv.timestamp - start, adv.rssi) for adv in adverts], away_at
+
+
+def simulate(samples, away_time, rssi_filter, consecutive_far_required):
+    """Replay the scanner's consecutive-FAR logic and return (false_locks, latency or None)"""
+    controller = ProximityController(RSSI_NEAR, RSSI_FAR, MAX_UNLOCKING_RSSI)
+    rssi_filter.reset()
+    far_count = 0
+    false_locks = 0
+    for timestamp, rssi in samples:
+        proximity = controller.get_proximity(rssi_filter.update(rssi))
+        if proximity == "FAR":
+            far_count += 1
+        else:
+            far_count = 0
+
+        if far_count >= consecutive_far_required:
+            far_count = 0
+            if timestamp < away_time:
+                false_locks += 1
+            else:
+                return false_locks, timestamp - away_time
+    return false_locks, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", type=int, default=40, help="synthetic walk-away traces")
+    parser.add_argument("--trace", metavar="PATH", help="recorded trace instead of synthetic scenarios")
+    parser.add_argument("--away-at", type=float, help="seconds into --trace when the user walked away")
+    parser.add_argument("--address", help="device to follow in --trace (default: most frequent)")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        if args.away_at is None:
+            parser.error("--trace requires --away-at")
+        scenarios = [recorded_walkaway(args.trace, args.away_at, args.address)]
+    else:
+        scenarios = [synthetic_walkaway(seed) for seed in range(args.scenarios)]
+
+    desk_hours = sum(away for _, away in scenarios) / 3600.0
+
+    print(f"{'filter':<8} {'N':>3} {'false locks/h':>14} {'mean latency s':>15} {'p90 latency s':>14} {'missed':>7}")
+    for kind in FILTER_KINDS:
+        for required in (1, 2, 3, 5):
+            false_locks = 0
+            latencies = []
+            missed = 0
+            for samples, away_time in scenarios:
+                false, latency = simulate(samples, away_time, create_filter(kind), required)
+                false_locks += false
+                if latency is None:
+                    missed += 1
+                else:
+                    latencies.append(latency)
+
+            latencies.sort()
+            mean = statistics.mean(latencies) if latencies else float("nan")
+            p90 = _common.percentile(latencies, 0.9) if latencies else float("nan")
+            print(f"{kind:<8} {required:>3} {false_locks / desk_hours:>14.2f} {mean:>15.2f} {p90:>14.2f} {missed:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Microbenchmarks for the advert -> proximity decision hot path
+
+Run from the repository root:
+
+    python benchmarks/bench_hot_path.py --save baseline
+    python benchmarks/bench_hot_path.py --compare baseline
+"""
+import contextlib
+import random
+
+import _common
+
+TARGET_ADDRESS = "AA:BB:CC:DD:EE:FF"
+ADVERTISERS = 300
+TARGET_SHARE = 0.05
+
+
+def synthetic_adverts(count, seed=1234):
+    """A crowded office: hundreds of advertisers plus a target walking near and far"""
+    from ble_trace import TraceAdvertisement, TraceDevice
+
+    rng = random.Random(seed)
+    others = [
+        TraceDevice(f"10:00:00:00:{i // 256:02X}:{i % 256:02X}", f"Device {i}" if i % 3 else None)
+        for i in range(ADVERTISERS)
+    ]
+    target = TraceDevice(TARGET_ADDRESS, "Phone")
+
+    adverts = []
+    rssi = -40.0
+    for i in range(count):
+        if rng.random() < TARGET_SHARE:
+            rssi = max(-100.0, min(-20.0, rssi + rng.gauss(0, 6)))
+            adverts.append((target, TraceAdvertisement(int(rssi), None, {}, i * 0.01)))
+        else:
+            device = others[rng.randrange(ADVERTISERS)]
+            adverts.append((device, TraceAdvertisement(rng.randint(-100, -40), None, {76: b"\x10\x05"}, i * 0.01)))
+    return adverts
+
+
+def traced_adverts(path, count):
+    from ble_trace import read_trace
+
+    adverts = list(read_trace(path))
+    if not adverts:
+        raise SystemExit(f"{path} contains no advertisements")
+    while len(adverts) < count:
+        adverts.extend(adverts[:count - len(adverts)])
+    return adverts[:count]
+
+
+@contextlib.contextmanager
+def stub_lock_actions():
+    """Replace the macOS automation in main with no-ops
+
+    main._action_executor is swapped for a RecordingExecutor too: its
+    handlers call the real lock_manager functions, so a submitted intent
+    would otherwise lock (and try to unlock) the screen.
+    """
+    import main
+
+    names = ("lock_mac_screen", "unlock_mac_screen", "is_screen_locked", "_action_executor", "last_proximity")
+    saved = {name: getattr(main, name) for name in names}
+    main.lock_mac_screen = lambda: True
+    main.unlock_mac_screen = lambda: True
+    main.is_screen_locked = lambda: False
+    main._action_executor = _common.RecordingExecutor()
+    try:
+        yield main
+    finally:
+        for name, value in saved.items():
+            setattr(main, name, value)
+
+
+def check_classify_batch(seed=7):
+    """classify_batch must agree with classify element by element, also outside -127..20 dBm"""
+    from controller import RSSI_MAX, RSSI_MIN, ProximityController
+
+    rng = random.Random(seed)
+    values = [whole + fraction for whole in range(RSSI_MIN - 5, RSSI_MAX + 5) for fraction in (0.0, 0.25, 0.5)]
+    values += [rng.uniform(RSSI_MIN - 50, RSSI_MAX + 50) for _ in range(10000)] + [float("nan")]
+    for thresholds in ((-30, -70, -50), (-30, RSSI_MIN, -50), (-30, -70.4, -49.6), (-30, RSSI_MIN - 0.5, RSSI_MIN + 0.5)):
+        controller = ProximityController(*thresholds)
+        batch = [int(state) for state in controller.classify_batch(values)]
+        scalar = [controller.classify(value) for value in values]
+        mismatches = [(v, b, c) for v, b, c in zip(values, batch, scalar) if b != c]
+        assert not mismatches, f"classify_batch disagrees with classify at thresholds {thresholds}: {mismatches[:5]}"
+    print(f"classify_batch matches classify on {len(values):,} readings: yes")
+
+
+def suite(args):
+    import config
+    from scanner import ProximityScanner
+
+    check_classify_batch()
+
+    if args.trace:
+        adverts = traced_adverts(args.trace, args.count)
+        target_address = None
+    else:
+        adverts = synthetic_adverts(args.count)
+        target_address = TARGET_ADDRESS
+
+    results = {}
+    with stub_lock_actions() as main, _common.quiet():
+        if target_address is None:
+            # Follow the most frequent address in the trace
+            counts = {}
+            for device, _ in adverts:
+                counts[device.address] = counts.get(device.address, 0) + 1
+            target_address = max(counts, key=counts.get)
+        # Installed before the scanner is built so it follows this config
+        config._config = _common.isolated_config(target_address=target_address)
+        scanner = ProximityScanner(main.proximity_callback)
+        main._monitor_instance.scanner_instance = scanner
+
+        target_adverts = [a for a in adverts if a[0].address == target_address] or adverts[:1]
+        while len(target_adverts) < args.count:
+            target_adverts.extend(target_adverts[:args.count - len(target_adverts)])
+
+        results["detection_crowd"] = _common.measure(scanner._detection_callback, adverts)
+        results["detection_target"] = _common.measure(scanner._detection_callback, target_adverts)
+
+        controller = scanner.controller
+        rssi_calls = [(adv.rssi,) for _, adv in target_adverts]
+        results["controller_get_proximity"] = _common.measure(controller.get_proximity, rssi_calls)
+        results["controller_classify"] = _common.measure(controller.classify, rssi_calls)
+
+        decisions = []
+        far_count = 0
+        for (rssi,) in rssi_calls:
+            proximity = controller.get_proximity(rssi)
+            far_count = far_count + 1 if proximity == "FAR" else 0
+            decisions.append((proximity, rssi, far_count))
+        results["main_proximity_callback"] = _common.measure(main.proximity_callback, decisions)
+
+        main._monitor_instance.scanner_instance = None
+    return results
+
+
+if __name__ == "__main__":
+    _common.run_suite(__doc__.splitlines()[0], suite)
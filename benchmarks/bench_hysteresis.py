@@ -0,0 +1,96 @@
+"""Lock and unlock latency across advertising rates: consecutive-FAR count vs time-based hysteresis
+
+Replays the bench_duty_cycle working day at several advert intervals,
+from a fast 20 ms advertiser to a slow tracker tag, through the
+main.proximity_callback lock rules with the radio always on. Count mode
+locks after --consecutive-far FAR adverts in a row and unlocks on the
+first NEAR one; time mode locks once FAR has held --device-timeout
+seconds and unlocks once NEAR has held --debounce seconds. Latency is
+measured from the start of each walk away (or back). Expect time mode
+to lock later than count mode at fast intervals (a 3 s hold against
+five adverts that arrive in under a second) and to gain only at slow
+ones. The last part is the per-advert cost of TimedHysteresis.update.
+
+    python benchmarks/bench_hysteresis.py --hours 8 --device-timeout 3 --debounce 1
+"""
+import argparse
+import random
+
+import _common
+
+from bench_duty_cycle import advert_times, day_timeline, latencies
+from controller import FAR, MID, NEAR, ProximityController
+from hysteresis import HYSTERESIS_COUNT, HYSTERESIS_MODES, TimedHysteresis
+
+ADVERT_INTERVALS = (0.02, 0.1, 0.25, 1.0, 1.5)
+
+
+def simulate(adverts, mode, required, far_hold, near_hold, thresholds=(-30, -70, -50)):
+    """Lock and unlock times for one mode"""
+    controller = ProximityController(*thresholds)
+    hysteresis = TimedHysteresis(far_hold, near_hold)
+    locks = []
+    unlocks = []
+    locked = False
+    far_count = 0
+    last = None
+    for t, rssi in adverts:
+        state = controller.classify(rssi)
+        if mode == HYSTERESIS_COUNT:
+            far_count = far_count + 1 if state == FAR else 0
+            lock = far_count == required
+        else:
+            state = hysteresis.update(state, t)
+            lock = hysteresis.held_count == 1
+        if state == FAR and lock and not locked:
+            locked = True
+            locks.append(t)
+        elif state == NEAR and last != NEAR and locked:
+            locked = False
+            unlocks.append(t)
+        last = state
+    return locks, unlocks
+
+
+def update_cost(count):
+    rng = random.Random(5)
+    states = [rng.choice((FAR, MID, NEAR)) if i % 20 == 0 else FAR for i in range(count)]
+    hysteresis = TimedHysteresis(3.0, 1.0)
+    return _common.measure(hysteresis.update, [(state, i * 0.25) for i, state in enumerate(states)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=float, default=8.0)
+    parser.add_argument("--consecutive-far", type=int, default=5)
+    parser.add_argument("--device-timeout", type=float, default=3.0, help="seconds FAR must hold in time mode")
+    parser.add_argument("--debounce", type=float, default=1.0, help="seconds NEAR must hold in time mode")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    segments, leaves, returns = day_timeline(args.hours, random.Random(args.seed))
+    hours = segments[-1][1] / 3600
+    print(f"{hours:.1f} h, {len(leaves)} walks away; count mode {args.consecutive_far} adverts, "
+          f"time mode FAR {args.device_timeout:g} s / NEAR {args.debounce:g} s")
+    print(f"{'interval':>8} {'mode':<6} {'lock p50/p95 s':>15} {'unlock p50/p95 s':>17} {'false locks/h':>14} {'missed':>7}")
+    medians = {mode: [] for mode in HYSTERESIS_MODES}
+    for interval in ADVERT_INTERVALS:
+        adverts = advert_times(segments, 1.0 / interval, random.Random(args.seed + 1))
+        for mode in HYSTERESIS_MODES:
+            locks, unlocks = simulate(adverts, mode, args.consecutive_far, args.device_timeout, args.debounce)
+            lock_delays, false_locks = latencies(locks, leaves, returns)
+            medians[mode].append(_common.percentile(lock_delays, 0.5))
+            unlock_delays, _ = latencies(unlocks, returns, leaves)
+            print(f"{interval:>7g}s {mode:<6} "
+                  f"{_common.percentile(lock_delays, 0.5):>7.2f}/{_common.percentile(lock_delays, 0.95):<7.2f} "
+                  f"{_common.percentile(unlock_delays, 0.5):>8.2f}/{_common.percentile(unlock_delays, 0.95):<8.2f} "
+                  f"{false_locks / hours:>14.2f} {len(leaves) - len(lock_delays):>7}")
+    for mode, values in medians.items():
+        print(f"{mode} mode: lock p50 spread across advert intervals {max(values) - min(values):.2f} s")
+
+    _common.print_results({"hysteresis_update": update_cost(args.count)})
+
+
+if __name__ == "__main__":
+    main()
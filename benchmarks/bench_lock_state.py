@@ -0,0 +1,108 @@
+"""Subprocess spawns per minute for lock-state checks, before and after LockStateService
+
+Simulates the monitor loop (one update_lock_state read per SCAN_INTERVAL
+tick) and proximity callbacks in virtual time against a fake backend, with
+the screen locking and unlocking a few times along the way.
+
+    python benchmarks/bench_lock_state.py --minutes 30
+"""
+import argparse
+import heapq
+
+import _common
+
+from lock_state import FakeLockStateBackend, LockStateService
+
+SCAN_INTERVAL = 0.2
+ADVERT_INTERVAL = 0.2
+# is_screen_locked calls per FAR advert beyond the consecutive-FAR threshold
+READS_PER_FAR_ADVERT = 2
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def lock_schedule(minutes):
+    """(time, locked) flips every few minutes"""
+    flips = []
+    t = 90.0
+    locked = True
+    while t < minutes * 60:
+        flips.append((t, locked))
+        t += 240.0 if locked else 150.0
+        locked = not locked
+    return flips
+
+
+def simulate(minutes, mode):
+    clock = VirtualClock()
+    backend = FakeLockStateBackend(pushes_notifications=(mode == "notifications"))
+    service = None
+    if mode != "per-call":
+        service = LockStateService(backend, clock=clock)
+        service.subscribe()
+
+    def read():
+        if service is None:
+            return backend.probe()
+        return service.is_locked()
+
+    end = minutes * 60.0
+    events = []
+    heapq.heappush(events, (0.0, 0, "tick"))
+    heapq.heappush(events, (0.0, 1, "advert"))
+    if service is not None:
+        heapq.heappush(events, (0.0, 2, "poll"))
+    for i, (t, locked) in enumerate(lock_schedule(minutes)):
+        heapq.heappush(events, (t, 3 + i, ("flip", locked)))
+
+    seq = 1000
+    changed_at = None
+    detection_delays = []
+    while events:
+        t, _, event = heapq.heappop(events)
+        if t > end:
+            break
+        clock.now = t
+        seq += 1
+
+        if isinstance(event, tuple):
+            backend.set_locked(event[1])
+            changed_at = t
+        elif event == "tick":
+            if read() == backend.locked and changed_at is not None:
+                detection_delays.append(t - changed_at)
+                changed_at = None
+            heapq.heappush(events, (t + SCAN_INTERVAL, seq, "tick"))
+        elif event == "advert":
+            # While the user is away (screen locked) adverts are FAR past the threshold
+            if backend.locked:
+                for _ in range(READS_PER_FAR_ADVERT):
+                    read()
+            heapq.heappush(events, (t + ADVERT_INTERVAL, seq, "advert"))
+        elif event == "poll":
+            heapq.heappush(events, (t + service.poll(), seq, "poll"))
+
+    spawns = backend.probe_count * backend.spawns_per_probe
+    worst = max(detection_delays) if detection_delays else 0.0
+    return spawns / minutes, worst
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, default=30.0)
+    args = parser.parse_args(argv)
+
+    print(f"{'mode':<14} {'spawns/min':>11} {'worst detection delay s':>24}")
+    for mode in ("per-call", "polling", "notifications"):
+        per_minute, worst = simulate(args.minutes, mode)
+        print(f"{mode:<14} {per_minute:>11.1f} {worst:>24.2f}")
+
+
+if __name__ == "__main__":
+    main()
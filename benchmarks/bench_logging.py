@@ -0,0 +1,117 @@
+"""Per-advert logging cost: print() with f-strings vs the ring-buffer logger, to /dev/null and a slow pipe
+
+The slow pipe stands in for a py2app console or a terminal that cannot
+keep up: a reader thread drains it at --pipe-rate bytes per second, so
+once the pipe buffer fills print() blocks the caller while the ring
+logger drops records and counts them. The last rows run the whole advert
+path (ProximityScanner._detection_callback through main.proximity_callback,
+lock actions stubbed) with the ring logger writing to the slow pipe.
+
+    python benchmarks/bench_logging.py --count 100000
+"""
+import argparse
+import contextlib
+import os
+import threading
+import time
+
+import _common
+
+from bench_hot_path import TARGET_ADDRESS, stub_lock_actions, synthetic_adverts
+from ring_log import RingLogger, StreamSink, get_logger
+
+
+@contextlib.contextmanager
+def slow_pipe(rate):
+    """stdout redirected to a pipe read at rate bytes per second"""
+    read_fd, write_fd = os.pipe()
+    stop = threading.Event()
+    chunk = 4096
+
+    def reader():
+        while True:
+            data = os.read(read_fd, chunk)
+            if not data:
+                return
+            time.sleep(len(data) / rate)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    stream = os.fdopen(write_fd, "w", buffering=1)
+    try:
+        with contextlib.redirect_stdout(stream):
+            yield
+    finally:
+        stop.set()
+        stream.close()
+        thread.join()
+        os.close(read_fd)
+
+
+TEMPLATE = "FAR | RSSI: {} | Consecutive: {}/{}"
+
+
+def print_line(template, rssi, count, required):
+    print(f"FAR | RSSI: {rssi} | Consecutive: {count}/{required}")
+
+
+def primitives(count, rate):
+    calls = [(TEMPLATE, -60 - i % 30, i % 7, 5) for i in range(count)]
+    results = {}
+    with _common.quiet():
+        results["print_devnull"] = _common.measure(print_line, calls)
+    with slow_pipe(rate):
+        results["print_slow_pipe"] = _common.measure(print_line, calls[:count // 10])
+
+    drops = {}
+    for name, context in (("ring_devnull", _common.quiet), ("ring_slow_pipe", lambda: slow_pipe(rate))):
+        log = RingLogger(StreamSink())
+        with context():
+            results[name] = _common.measure(log.debug, calls)
+            log.close()
+        drops[name] = log.dropped
+
+    log = RingLogger(StreamSink(), level=20)
+    results["ring_below_level"] = _common.measure(log.debug, calls)
+    log = RingLogger(StreamSink(), sample={"debug": 10})
+    with _common.quiet():
+        results["ring_sampled_1_in_10"] = _common.measure(log.debug, calls)
+        log.close()
+    return results, drops
+
+
+def advert_path(count, rate):
+    import config
+    from scanner import ProximityScanner
+
+    adverts = synthetic_adverts(count)
+    results = {}
+    logger = get_logger()
+    dropped = logger.dropped
+    with stub_lock_actions() as main, slow_pipe(rate):
+        config._config = _common.isolated_config(target_address=TARGET_ADDRESS)
+        scanner = ProximityScanner(main.proximity_callback)
+        main._monitor_instance.scanner_instance = scanner
+        results["adverts_ring_slow_pipe"] = _common.measure(scanner._detection_callback, adverts)
+        main._monitor_instance.scanner_instance = None
+        logger.drain()
+    return results, logger.dropped - dropped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--pipe-rate", type=float, default=200_000, help="slow pipe reader, bytes per second")
+    args = parser.parse_args(argv)
+
+    results, drops = primitives(args.count, args.pipe_rate)
+    advert_results, advert_drops = advert_path(args.count, args.pipe_rate)
+    results.update(advert_results)
+    _common.print_results(results)
+    for name, dropped in sorted(drops.items()):
+        print(f"{name}: {dropped:,} records dropped")
+    print(f"adverts_ring_slow_pipe: {advert_drops:,} records dropped")
+
+
+if __name__ == "__main__":
+    main()
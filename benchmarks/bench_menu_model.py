@@ -0,0 +1,95 @@
+"""Menu work per tick: rebuild everything vs apply menu_model diffs
+
+Feeds a DeviceTable with a busy RF environment (resident devices with
+jittering RSSI plus transient advertisers) and runs the once-a-second
+Devices tick and the every-two-seconds settings tick. "rebuild" counts the
+items the old code created, cleared or retitled; "diff" counts what the
+rumps adapter now touches, and times the model itself.
+
+    python benchmarks/bench_menu_model.py --devices 200 --ticks 600
+"""
+import argparse
+import random
+import time
+
+import _common
+
+from device_table import DeviceTable
+from menu_model import ProxiLockMenuModel, device_entries, settings_sections, settings_titles
+
+DEVICE_MENU_LIMIT = 25
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=200, help="resident advertisers")
+    parser.add_argument("--transient", type=int, default=20, help="new advertisers per second")
+    parser.add_argument("--ticks", type=int, default=600, help="simulated seconds")
+    parser.add_argument("--jitter", type=int, default=2, help="RSSI jitter (dBm) between adverts")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    config = _common.isolated_config(target_address="AA:00:00:00:00:07")
+    snapshot = config.snapshot
+    table = DeviceTable(capacity=512, ttl=10.0)
+    model = ProxiLockMenuModel()
+
+    base_rssi = {f"AA:00:00:00:{i >> 8:02X}:{i & 0xFF:02X}": rng.randint(-95, -35) for i in range(args.devices)}
+    rebuild_ops = {"devices": 0, "settings": 0}
+    diff_ops = {"devices": 0, "settings": 0}
+    created = {"rebuild": 0, "diff": 0}
+    tick_ns = []
+    next_transient = 0
+
+    for second in range(args.ticks):
+        for address, rssi in base_rssi.items():
+            table.update(address, address, rssi + rng.randint(-args.jitter, args.jitter), now=second + rng.random())
+        for _ in range(args.transient):
+            address = f"BB:{next_transient >> 16 & 0xFF:02X}:{next_transient >> 8 & 0xFF:02X}:{next_transient & 0xFF:02X}:00:00"
+            next_transient += 1
+            table.update(address, address, rng.randint(-100, -60), now=second + rng.random())
+
+        now = second + 1.0
+        records = table.top_k(DEVICE_MENU_LIMIT, now)
+        previous = len(model.devices.entries)
+
+        started = time.perf_counter_ns()
+        diff = model.update_devices(records, snapshot)
+        if second % 2 == 0:
+            titles, section_diffs = model.update_settings(snapshot, True)
+        else:
+            titles, section_diffs = {}, {}
+        tick_ns.append(time.perf_counter_ns() - started)
+
+        # The old update_menu cleared the submenu and created one item per device
+        shown = len(device_entries(records, snapshot.target_address, snapshot.target_name))
+        rebuild_ops["devices"] += previous + shown
+        created["rebuild"] += shown
+        diff_ops["devices"] += diff.op_count()
+        created["diff"] += len(diff.placed) - len(diff.moved)
+        if second % 2 == 0:
+            # update_threshold_menus set every top-level title
+            rebuild_ops["settings"] += len(settings_titles(snapshot, True))
+            diff_ops["settings"] += len(titles) + sum(d.op_count() for d in section_diffs.values())
+        if second == args.ticks // 2:
+            # One menu click halfway through
+            config.rssi_far = -75
+            snapshot = config.snapshot
+
+    tick_ns.sort()
+    settings_entries = sum(len(e) for e in settings_sections(snapshot).values())
+    print(f"{args.devices} resident + {args.transient}/s transient advertisers, {args.ticks} ticks, "
+          f"{settings_entries} settings entries")
+    print(f"{'menu':<10} {'rebuild ops/tick':>17} {'diff ops/tick':>14}")
+    for name in ("devices", "settings"):
+        ticks = args.ticks if name == "devices" else (args.ticks + 1) // 2
+        print(f"{name:<10} {rebuild_ops[name] / ticks:>17.1f} {diff_ops[name] / ticks:>14.2f}")
+    print(f"MenuItems created per tick: rebuild {created['rebuild'] / args.ticks:.1f}, "
+          f"diff {created['diff'] / args.ticks:.2f}")
+    print(f"model cost per tick: p50 {_common.percentile(tick_ns, 0.5) / 1000:.1f} us, "
+          f"p99 {_common.percentile(tick_ns, 0.99) / 1000:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
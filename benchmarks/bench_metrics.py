@@ -0,0 +1,107 @@
+"""Cost of the metrics hot path: per-update time and allocation, and the advert path with and without metrics
+
+The advert path is ProximityScanner._detection_callback through
+main.proximity_callback (lock actions stubbed), measured with the real
+metric children and with them swapped for no-ops, then again while a
+thread renders the Prometheus text every 10 ms as a scraper would.
+
+    python benchmarks/bench_metrics.py --count 100000
+"""
+import argparse
+import threading
+import time
+
+import _common
+
+from bench_hot_path import TARGET_ADDRESS, stub_lock_actions, synthetic_adverts
+from metrics import COUNT_BUCKETS, get_metrics
+
+_METRIC_GLOBALS = ("_adverts_received", "_adverts_filtered", "_advert_seconds", "_far_streaks")
+
+
+class _NoOp:
+    def inc(self, amount=1.0):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def primitives(count):
+    registry = get_metrics()
+    counter = registry.counter("bench_counter_total", "benchmark").labels()
+    labelled = registry.counter("bench_labelled_total", "benchmark", ("kind",)).labels("a")
+    histogram = registry.histogram("bench_seconds", "benchmark").labels()
+    far = registry.histogram("bench_far_streak", "benchmark", buckets=COUNT_BUCKETS).labels()
+    values = [(i % 97 * 1e-5,) for i in range(count)]
+    return {
+        "counter_inc": _common.measure(counter.inc, [()] * count),
+        "labelled_counter_inc": _common.measure(labelled.inc, [()] * count),
+        "histogram_observe": _common.measure(histogram.observe, values),
+        "histogram_observe_int": _common.measure(far.observe, [(i % 12,) for i in range(count)]),
+    }
+
+
+def advert_path(count):
+    import config
+    import scanner as scanner_module
+    from scanner import ProximityScanner
+
+    adverts = synthetic_adverts(count)
+    results = {}
+    with stub_lock_actions() as main, _common.quiet():
+        config._config = _common.isolated_config(target_address=TARGET_ADDRESS)
+        scanner = ProximityScanner(main.proximity_callback)
+        main._monitor_instance.scanner_instance = scanner
+
+        results["adverts_with_metrics"] = _common.measure(scanner._detection_callback, adverts)
+
+        saved = {name: getattr(scanner_module, name) for name in _METRIC_GLOBALS}
+        for name in _METRIC_GLOBALS:
+            setattr(scanner_module, name, _NoOp())
+        try:
+            results["adverts_without_metrics"] = _common.measure(scanner._detection_callback, adverts)
+        finally:
+            for name, value in saved.items():
+                setattr(scanner_module, name, value)
+
+        stop = threading.Event()
+        renders = [0]
+
+        def scrape():
+            registry = get_metrics()
+            while not stop.wait(0.01):
+                registry.render_prometheus()
+                renders[0] += 1
+
+        scraper = threading.Thread(target=scrape, daemon=True)
+        scraper.start()
+        try:
+            results["adverts_while_scraped"] = _common.measure(scanner._detection_callback, adverts)
+        finally:
+            stop.set()
+            scraper.join()
+        main._monitor_instance.scanner_instance = None
+    return results, renders[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    results = primitives(args.count)
+    advert_results, renders = advert_path(args.count)
+    results.update(advert_results)
+    _common.print_results(results)
+
+    registry = get_metrics()
+    started = time.perf_counter()
+    text = registry.render_prometheus()
+    elapsed = time.perf_counter() - started
+    print(f"{renders} concurrent renders; one render: {len(text.splitlines())} lines, "
+          f"{len(text):,} bytes in {elapsed * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Monitor loop wakeups per minute: fixed SCAN_INTERVAL poll vs event-driven loop
+
+Replays the same synthetic trace (a target walking away and back in a
+crowd) in real time through ProximityScanner and main.proximity_callback,
+once under the old loop that woke every scan_interval and once under
+ProximityMonitor._monitor_loop, and checks both reach the same decisions.
+The lock actions are recorded instead of run.
+
+    python benchmarks/bench_monitor_loop.py --seconds 30 --speed 2
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+from functools import partial
+
+import _common
+
+from ble_trace import ReplayScanner, TraceAdvertisement, TraceDevice, TraceRecorder
+from lock_state import FakeLockStateBackend, LockStateService, set_lock_state_service
+
+TARGET = "AA:BB:CC:DD:EE:FF"
+
+
+def write_trace(path, seconds, crowd, seed):
+    """Target at ~5 adverts/s wandering between the desk and the corridor, plus crowd noise"""
+    rng = random.Random(seed)
+    recorder = TraceRecorder(path)
+    target = TraceDevice(TARGET, "Phone")
+    others = [TraceDevice(f"10:00:00:00:{i >> 8:02X}:{i & 0xFF:02X}", None) for i in range(crowd)]
+    t = 0.0
+    rssi = -35.0
+    while t < seconds:
+        t += rng.expovariate(5.0 + crowd)
+        if rng.random() < 5.0 / (5.0 + crowd):
+            # A slow walk: mostly near, with spells far enough away to lock
+            goal = -85.0 if int(t / 8) % 3 == 2 else -30.0
+            rssi += (goal - rssi) * 0.2 + rng.gauss(0, 3)
+            recorder.record(target, TraceAdvertisement(int(rssi), None, {}, t), timestamp=t)
+        else:
+            device = others[rng.randrange(crowd)]
+            recorder.record(device, TraceAdvertisement(rng.randint(-100, -40), None, {}, t), timestamp=t)
+    recorder.close()
+
+
+def install(main):
+    decisions = []
+    executor = _common.RecordingExecutor()
+    original = main.proximity_callback
+
+    def proximity_callback(proximity, rssi, consecutive_far_count):
+        decisions.append((proximity, rssi, consecutive_far_count))
+        original(proximity, rssi, consecutive_far_count)
+
+    main.proximity_callback = proximity_callback
+    main._action_executor = executor
+    main.last_proximity = None
+    return decisions, executor, original
+
+
+async def poll_loop(main, trace, speed):
+    """The loop as it was: update_lock_state and the wake check every scan_interval"""
+    from config import get_config
+    from lock_security import update_lock_state
+    from scanner import ProximityScanner
+
+    scanner = ProximityScanner(main.proximity_callback, scanner_factory=partial(ReplayScanner, path=trace, speed=speed))
+    main._monitor_instance.scanner_instance = scanner
+    await scanner.start()
+    wakeups = 0
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    done = asyncio.ensure_future(scanner.scanner.wait())
+    while not done.done():
+        wakeups += 1
+        update_lock_state()
+        if main.get_time_since_wake() < 2.0:
+            scanner.reset_consecutive_far_count()
+        await asyncio.sleep(get_config().snapshot.scan_interval)
+    elapsed = loop.time() - started
+    await scanner.stop()
+    main._monitor_instance.scanner_instance = None
+    return wakeups, elapsed, {"timer": wakeups}
+
+
+async def event_loop(main, trace, speed):
+    monitor = main.ProximityMonitor(scanner_factory=partial(ReplayScanner, path=trace, speed=speed))
+    main._monitor_instance = monitor
+    monitor.monitoring = True
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    task = asyncio.ensure_future(monitor._monitor_loop())
+    while monitor.scanner_instance is None or monitor.scanner_instance.scanner is None:
+        await asyncio.sleep(0.01)
+    await monitor.scanner_instance.scanner.wait()
+    elapsed = loop.time() - started
+    wakeups, reasons = monitor.wakeups, dict(monitor.wakeup_reasons)
+    monitor.stop()
+    await task
+    return wakeups, elapsed, reasons
+
+
+def run(mode, trace, speed):
+    import main
+
+    saved = (main.proximity_callback, main._action_executor, main._monitor_instance)
+    decisions, executor, _ = install(main)
+    try:
+        with _common.quiet():
+            coroutine = poll_loop if mode == "poll" else event_loop
+            wakeups, elapsed, reasons = asyncio.run(coroutine(main, trace, speed))
+    finally:
+        main.proximity_callback, main._action_executor, main._monitor_instance = saved
+    return wakeups, elapsed, reasons, decisions, executor.submitted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=30.0, help="trace length")
+    parser.add_argument("--speed", type=float, default=2.0, help="replay speed (1 = real time)")
+    parser.add_argument("--crowd", type=int, default=50, help="adverts/s from other advertisers")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    import config
+    config._config = _common.isolated_config(target_address=TARGET, scan_policy="continuous")
+    set_lock_state_service(LockStateService(FakeLockStateBackend()))
+
+    fd, trace = tempfile.mkstemp(prefix="proxi_lock_bench_", suffix=".trace")
+    os.close(fd)
+    try:
+        write_trace(trace, args.seconds, args.crowd, args.seed)
+        results = {mode: run(mode, trace, args.speed) for mode in ("poll", "event")}
+    finally:
+        os.remove(trace)
+
+    print(f"{'loop':<6} {'wakeups':>8} {'wakeups/min':>12} {'decisions':>10} {'actions':>8}  reasons")
+    for mode, (wakeups, elapsed, reasons, decisions, submitted) in results.items():
+        detail = ", ".join(f"{k} {v}" for k, v in sorted(reasons.items()))
+        print(f"{mode:<6} {wakeups:>8} {wakeups * 60 / elapsed:>12,.0f} {len(decisions):>10} {len(submitted):>8}  {detail}")
+    same = results["poll"][3:] == results["event"][3:]
+    print(f"identical decisions and actions: {'yes' if same else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Per-advert cost of following many enrolled devices: linear scan vs DeviceGroup
+
+Adverts come from a crowd of strangers plus the enrolled devices. "linear"
+is the obvious extension of the single-target code: compare each advert
+against every enrolled address, then recount every device's state to
+apply the combinators. "group" is ProximityScanner._detection_callback
+with the address-keyed DeviceGroup and its incremental state counts.
+
+    python benchmarks/bench_multi_device.py --adverts 200000 --crowd 300
+"""
+import argparse
+import random
+import time
+
+import _common
+
+from ble_trace import TraceAdvertisement, TraceDevice
+from controller import FAR, NEAR, PROXIMITY_NAMES, ProximityController
+from filters import create_filter
+
+
+def enrolled(count):
+    return [f"AA:BB:CC:00:{i >> 8:02X}:{i & 0xFF:02X}" for i in range(count)]
+
+
+def advert_plan(targets, adverts, crowd, target_share, seed):
+    rng = random.Random(seed)
+    strangers = [TraceDevice(f"11:22:33:{i >> 8:02X}:{i & 0xFF:02X}:00", None) for i in range(crowd)]
+    devices = [TraceDevice(address, None) for address in targets]
+    plan = []
+    for i in range(adverts):
+        if rng.random() < target_share:
+            device = devices[rng.randrange(len(devices))]
+        else:
+            device = strangers[rng.randrange(crowd)]
+        plan.append((device, TraceAdvertisement(rng.randint(-100, -25), None, {}, i * 0.01)))
+    return plan
+
+
+class LinearMonitor:
+    """Every enrolled device checked in turn, and the group state recounted each time"""
+
+    def __init__(self, targets, controller, quorum=2):
+        self.targets = [[address, create_filter("ewma"), FAR, 0] for address in targets]
+        self.controller = controller
+        self.quorum = quorum
+        self.consecutive_far_count = 0
+        self.decisions = []
+
+    def detection_callback(self, device, advertisement_data):
+        for target in self.targets:
+            if target[0] == device.address:
+                break
+        else:
+            return
+        rssi = target[1].update(advertisement_data.rssi)
+        target[2] = self.controller.classify(rssi)
+        states = [t[2] for t in self.targets]
+        if all(s == FAR for s in states):
+            state = FAR
+        elif any(s == NEAR for s in states):
+            state = NEAR
+        else:
+            state = 1
+        if state == FAR:
+            self.consecutive_far_count += 1
+        elif state == NEAR:
+            self.consecutive_far_count = 0
+        self.decisions.append((PROXIMITY_NAMES[state], self.consecutive_far_count))
+
+
+def run_group(targets, plan):
+    import config
+    from scanner import ProximityScanner
+
+    config._config = _common.isolated_config(target_devices=targets, rssi_filter="ewma")
+    decisions = []
+    scanner = ProximityScanner(lambda proximity, rssi, consecutive_far_count: decisions.append(
+        (proximity, consecutive_far_count)))
+    callback = scanner._detection_callback
+    started = time.perf_counter()
+    for device, adv in plan:
+        callback(device, adv)
+    return time.perf_counter() - started, decisions
+
+
+def run_linear(targets, plan):
+    monitor = LinearMonitor(targets, ProximityController(-30, -70, -50))
+    callback = monitor.detection_callback
+    started = time.perf_counter()
+    for device, adv in plan:
+        callback(device, adv)
+    return time.perf_counter() - started, monitor.decisions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--adverts", type=int, default=200000)
+    parser.add_argument("--crowd", type=int, default=300, help="strangers in range")
+    parser.add_argument("--target-share", type=float, default=0.2, help="fraction of adverts from enrolled devices")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    print(f"{'enrolled':>8} {'linear ns/advert':>17} {'group ns/advert':>16} {'same decisions':>15}")
+    for count in (1, 2, 8, 32, 64):
+        targets = enrolled(count)
+        plan = advert_plan(targets, args.adverts, args.crowd, args.target_share, args.seed)
+        linear, linear_decisions = run_linear(targets, plan)
+        with _common.quiet():
+            group, group_decisions = run_group(targets, plan)
+        same = "yes" if linear_decisions == group_decisions else "NO"
+        print(f"{count:>8} {linear * 1e9 / len(plan):>17,.0f} {group * 1e9 / len(plan):>16,.0f} {same:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Predictive locking: walk-away lock latency saved vs false locks added
+
+Replays a synthetic working day (the bench_duty_cycle timeline: desk
+spells with the odd lean back, walks away and back) or a labelled trace
+through DeviceGroup and the main.proximity_callback lock rules, once
+with the consecutive-FAR count alone and once per predictor setting
+with TrendPredictor allowed to lock early. Latency is measured from the
+start of each walk away (or of each labelled away interval).
+
+    python benchmarks/bench_predictive.py --hours 8
+    python benchmarks/bench_predictive.py --trace office.trace
+"""
+import argparse
+import bisect
+import random
+
+import _common
+
+from bench_duty_cycle import advert_times, day_timeline, latencies
+from controller import FAR, MID, ProximityController
+from device_group import DeviceGroup
+from filters import FILTER_KINDS, FILTER_NONE, create_filter
+from predictor import TrendPredictor
+
+# (window s, horizon s, min R^2) settings to compare; the first is the config default
+SETTINGS = (
+    (3.0, 1.0, 0.8),
+    (3.0, 2.0, 0.7),
+    (2.0, 2.0, 0.6),
+    (4.0, 3.0, 0.8),
+)
+
+
+def simulate(adverts, required, filter_kind, setting=None, thresholds=(-30, -70, -50)):
+    """Lock and unlock times, and how many locks the predictor made early"""
+    predictor_factory = None
+    if setting is not None:
+        window, horizon, min_r2 = setting
+
+        def make_predictor():
+            return TrendPredictor(window, horizon, min_r2)
+        predictor_factory = make_predictor
+
+    group = DeviceGroup(
+        [("AA:BB:CC:DD:EE:FF", None, None)], ProximityController(*thresholds),
+        lambda: create_filter(filter_kind), predictor_factory=predictor_factory,
+    )
+    tracked = group.devices[0]
+    locks = []
+    unlocks = []
+    early = 0
+    locked = False
+    far_count = 0
+    for t, rssi in adverts:
+        group.observe(tracked, rssi, None, t)
+        state = group.state
+        if state == FAR:
+            far_count += 1
+            if not locked and (far_count == required or (far_count < required and group.departing)):
+                early += far_count < required
+                locked = True
+                locks.append(t)
+        elif state == MID:
+            far_count = 0
+            if not locked and group.departing:
+                early += 1
+                locked = True
+                locks.append(t)
+        else:
+            far_count = 0
+            if locked:
+                locked = False
+                unlocks.append(t)
+    return locks, unlocks, early
+
+
+def first_locks(locks, leaves, returns):
+    """Locks minus repeats within one away spell (an early lock, a bounce back, and a second lock)"""
+    kept = []
+    spell = None
+    for t in locks:
+        i = bisect.bisect_right(leaves, t) - 1
+        j = bisect.bisect_right(returns, t) - 1
+        current = i if i >= 0 and (j < 0 or returns[j] <= leaves[i]) else None
+        if current is not None and current == spell:
+            continue
+        spell = current
+        kept.append(t)
+    return kept
+
+
+def trace_adverts(path):
+    """[(t, rssi)] for the labelled device, and the away intervals, from a tuner-style labelled trace"""
+    import json
+
+    from ble_trace import read_trace
+
+    with open(path + ".labels.json", "r") as f:
+        labels = json.load(f)
+    adverts = []
+    first = None
+    for device, advertisement_data in read_trace(path):
+        if first is None:
+            first = advertisement_data.timestamp
+        if device.address == labels["address"] and advertisement_data.rssi is not None:
+            adverts.append((advertisement_data.timestamp - first, advertisement_data.rssi))
+    leaves = [start for start, _ in labels["away"]]
+    returns = [end for _, end in labels["away"]]
+    end = adverts[-1][0] if adverts else 0.0
+    return adverts, leaves, returns, end
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=float, default=8.0)
+    parser.add_argument("--advert-rate", type=float, default=4.0, help="target adverts per second")
+    parser.add_argument("--consecutive-far", type=int, default=5)
+    parser.add_argument("--filter", choices=FILTER_KINDS, default=FILTER_NONE)
+    parser.add_argument("--trace", help="labelled trace (<trace>.labels.json next to it) instead of a synthetic day")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        adverts, leaves, returns, end = trace_adverts(args.trace)
+    else:
+        rng = random.Random(args.seed)
+        segments, leaves, returns = day_timeline(args.hours, rng)
+        adverts = advert_times(segments, args.advert_rate, rng)
+        end = segments[-1][1]
+    hours = end / 3600 if end else 1.0
+
+    print(f"{hours:.1f} h, {len(leaves)} walks away, {len(adverts):,} target adverts, filter {args.filter}")
+    print(f"{'predictor (window/horizon/R2)':<30} {'lock p50/p95 s':>15} {'saved p50 s':>12} "
+          f"{'early':>6} {'false/h':>8} {'added/h':>8} {'missed':>7}")
+
+    baseline_p50 = None
+    baseline_false = 0
+    for setting in (None,) + SETTINGS:
+        locks, _, early = simulate(adverts, args.consecutive_far, args.filter, setting)
+        delays, false_locks = latencies(first_locks(locks, leaves, returns), leaves, returns)
+        missed = len(leaves) - len(delays)
+        p50 = _common.percentile(delays, 0.5)
+        if setting is None:
+            label = "off (consecutive FAR only)"
+            baseline_p50 = p50
+            baseline_false = false_locks
+        else:
+            label = "{:g} s / {:g} s / {:.1f}".format(*setting)
+        print(f"{label:<30} {p50:>7.2f}/{_common.percentile(delays, 0.95):<7.2f} {baseline_p50 - p50:>12.2f} "
+              f"{early:>6} {false_locks / hours:>8.2f} {(false_locks - baseline_false) / hours:>8.2f} {missed:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Per-advert CPU: one scanner per consumer vs one shared ScannerHub
+
+Each consumer is a cheap advert handler: a DeviceTable update for the
+Devices menu or a target-address check for a proximity monitor. With
+"separate" every consumer has its own FakeBleScanner, so each advert is
+decoded once per consumer (what running two BleakScanners costs); with
+"hub" one scanner decodes it once and the hub fans it out through each
+subscriber's filter and queue.
+
+    python benchmarks/bench_scanner_hub.py --adverts 200000 --crowd 300
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import _common
+
+from device_table import DeviceTable
+from scanner_hub import DROP_OLDEST, LATEST_PER_ADDRESS, FakeBleScanner, ScanFilter, ScannerHub
+
+TARGET = "AA:BB:CC:DD:EE:FF"
+BATCH = 64
+
+
+def make_consumers(count):
+    """[(callback, ScanFilter or None, drop policy)]: a device list, then proximity monitors"""
+    consumers = []
+    table = DeviceTable(capacity=512, ttl=10.0, clock=lambda: 0.0)
+    consumers.append((lambda d, a: table.update(d.address, d.name or d.address, a.rssi, 0.0), None, LATEST_PER_ADDRESS))
+    for i in range(count - 1):
+        state = {"count": 0}
+        target = TARGET if i == 0 else f"AA:BB:CC:DD:EE:{i:02X}"
+
+        def on_target(device, adv, state=state, target=target):
+            if device.address != target:
+                return
+            state["count"] += 1
+
+        consumers.append((on_target, ScanFilter(addresses=[target]), DROP_OLDEST))
+    return consumers[:count]
+
+
+def advert_plan(adverts, crowd, seed):
+    rng = random.Random(seed)
+    addresses = [TARGET] + [f"11:22:33:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}:00" for i in range(crowd)]
+    return [(addresses[rng.randrange(len(addresses))], rng.randint(-100, -30)) for _ in range(adverts)]
+
+
+async def emit_plan(emitters, plan):
+    """Deliver the plan in batches, yielding so queued drains run; returns thread CPU seconds"""
+    started = time.thread_time()
+    for i in range(0, len(plan), BATCH):
+        for address, rssi in plan[i:i + BATCH]:
+            for emit in emitters:
+                emit(address, rssi)
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    return time.thread_time() - started
+
+
+async def run_separate(consumers, plan):
+    emitters = []
+    for callback, _, _ in consumers:
+        scanner = FakeBleScanner(callback)
+        await scanner.start()
+        emitters.append(scanner.emit_now)
+    return await emit_plan(emitters, plan)
+
+
+def run_hub(consumers, plan):
+    hub = ScannerHub(scanner_factory=FakeBleScanner)
+    subscriptions = [
+        hub.subscribe(callback, scan_filter=scan_filter, max_queue=512, drop_policy=drop_policy)
+        for callback, scan_filter, drop_policy in consumers
+    ]
+    deadline = time.monotonic() + 2.0
+    while hub.scanner is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    try:
+        # Runs on the hub's thread, where the scanner's callbacks and the drains happen
+        elapsed = asyncio.run_coroutine_threadsafe(emit_plan([hub.scanner.emit_now], plan), hub.loop).result()
+    finally:
+        for subscription in subscriptions:
+            hub.unsubscribe(subscription)
+    return elapsed, sum(s.dropped for s in subscriptions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--adverts", type=int, default=200000)
+    parser.add_argument("--crowd", type=int, default=300, help="other advertisers in range")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    plan = advert_plan(args.adverts, args.crowd, args.seed)
+    print(f"{'consumers':>9} {'separate ns/advert':>19} {'hub ns/advert':>14} {'hub coalesced':>14}")
+    for count in (1, 2, 4, 8):
+        consumers = make_consumers(count)
+        separate = asyncio.run(run_separate(consumers, plan))
+        consumers = make_consumers(count)
+        with _common.quiet():
+            hub, dropped = run_hub(consumers, plan)
+        print(f"{count:>9} {separate * 1e9 / len(plan):>19,.0f} {hub * 1e9 / len(plan):>14,.0f} {dropped:>14,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""AppleScript action latency: a fresh interpreter per action vs a warm host
+
+On Linux both paths use the stand-in interpreter from script_executor, so
+the difference is the process start-up cost. On macOS pass --osascript to
+measure the real interpreters with a harmless script.
+
+    python benchmarks/bench_script_executor.py --runs 50
+"""
+import argparse
+import time
+
+import _common
+
+from script_executor import (
+    PersistentScriptRunner,
+    SubprocessScriptRunner,
+    osascript_host_command,
+    stand_in_host_command,
+)
+
+
+def time_runs(runner, script, runs):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        runner.run(script, timeout=10)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    latencies.sort()
+    return latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--osascript", action="store_true", help="use the real osascript interpreters")
+    args = parser.parse_args(argv)
+
+    if args.osascript:
+        cold = SubprocessScriptRunner(("osascript", "-e"))
+        warm = PersistentScriptRunner(osascript_host_command())
+        script = "return 1"
+    else:
+        cold = SubprocessScriptRunner(stand_in_host_command())
+        warm = PersistentScriptRunner(stand_in_host_command())
+        script = "ping"
+
+    started = time.perf_counter()
+    warm.run(script, timeout=10)
+    first_ms = (time.perf_counter() - started) * 1000.0
+
+    print(f"{'path':<24} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, runner in (("cold (spawn per action)", cold), ("warm host", warm)):
+        latencies = time_runs(runner, script, args.runs)
+        print(f"{name:<24} {_common.percentile(latencies, 0.5):>8.2f} "
+              f"{_common.percentile(latencies, 0.99):>8.2f} {latencies[-1]:>8.2f}")
+    print(f"warm host first request (includes spawn): {first_ms:.2f} ms")
+    warm.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Decision tracing: advert-path cost with tracing off and on, and a traced walk away and back
+
+The first part measures ProximityScanner._detection_callback through
+main.proximity_callback (lock actions stubbed) with the tracer disabled
+and enabled. The second walks a target away until the screen locks and
+back again (auto-unlock is not enabled, so only the lock is acted on).
+Every external command is modelled as a sleep, as in
+bench_async_unlock.py, and the walk runs twice: with the blocking
+lock_manager on the ActionExecutor thread, then with async_lock_manager
+on a monitor loop as while monitoring. Each trace is read back and each
+decision's stages printed. Pass --keep to keep the last trace for a
+Perfetto viewer.
+
+    python benchmarks/bench_tracing.py --count 50000 --keep walk.trace.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import _common
+
+from bench_async_unlock import SlowSecretBackend, modelled_commands
+from bench_hot_path import TARGET_ADDRESS, stub_lock_actions, synthetic_adverts
+from tracing import get_tracer
+
+
+def advert_path(count, trace_path):
+    import config
+    from scanner import ProximityScanner
+
+    adverts = synthetic_adverts(count)
+    tracer = get_tracer()
+    results = {}
+    with stub_lock_actions() as main, _common.quiet():
+        config._config = _common.isolated_config(target_address=TARGET_ADDRESS)
+        scanner = ProximityScanner(main.proximity_callback)
+        main._monitor_instance.scanner_instance = scanner
+        results["adverts_tracing_off"] = _common.measure(scanner._detection_callback, adverts)
+        tracer.start(trace_path)
+        try:
+            results["adverts_tracing_on"] = _common.measure(scanner._detection_callback, adverts)
+        finally:
+            tracer.stop()
+        main._monitor_instance.scanner_instance = None
+        results["span_tracing_off"] = _common.measure(tracer.span, [("wake_display",)] * count)
+    return results
+
+
+def wait_idle(executor, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while executor.is_busy() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def traced_walk(trace_path, costs, advert_interval, on_loop):
+    import asyncio
+    import threading
+
+    import async_lock_manager
+    import config
+    import lock_manager
+    import main
+    from action_executor import LOCK, UNLOCK, ActionExecutor
+    from ble_trace import TraceAdvertisement, TraceDevice
+    from lock_state import FakeLockStateBackend, LockStateService, set_lock_state_service
+    from scanner import ProximityScanner
+    from secret_provider import SecretProvider, set_secret_provider
+
+    config._config = _common.isolated_config(target_address=TARGET_ADDRESS)
+    required = config._config.snapshot.consecutive_far_required
+    backend = FakeLockStateBackend(locked=False)
+    set_lock_state_service(LockStateService(backend))
+    set_secret_provider(SecretProvider(SlowSecretBackend(costs["security"])))
+
+    loop = None
+    if on_loop:
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name="monitor", daemon=True).start()
+    main._monitor_instance.loop = loop
+
+    def lock():
+        locked = main._on_monitor_loop(async_lock_manager.lock_mac_screen, lock_manager.lock_mac_screen)
+        backend.locked = locked
+        return locked
+
+    def unlock():
+        unlocked = main._on_monitor_loop(async_lock_manager.unlock_mac_screen, lock_manager.unlock_mac_screen)
+        backend.locked = not unlocked
+        return unlocked
+
+    saved = (main._action_executor, main.last_proximity)
+    executor = ActionExecutor({LOCK: lock, UNLOCK: unlock})
+    main._action_executor = executor
+    main.last_proximity = None
+    target = TraceDevice(TARGET_ADDRESS, "Phone")
+    scanner = ProximityScanner(main.proximity_callback)
+    main._monitor_instance.scanner_instance = scanner
+    tracer = get_tracer()
+    tracer.start(trace_path)
+    try:
+        with modelled_commands(costs), _common.quiet():
+            executor.start()
+            for rssi in [-25] * 3 + [-85] * required:
+                scanner._detection_callback(target, TraceAdvertisement(rssi, None, {}, 0.0))
+                time.sleep(advert_interval)
+            wait_idle(executor)
+            for rssi in [-25] * 3:
+                scanner._detection_callback(target, TraceAdvertisement(rssi, None, {}, 0.0))
+                time.sleep(advert_interval)
+            wait_idle(executor)
+            executor.stop(timeout=1.0)
+    finally:
+        tracer.stop()
+        main._action_executor, main.last_proximity = saved
+        main._monitor_instance.scanner_instance = None
+        main._monitor_instance.loop = None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+
+
+def read_trace(path):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().rstrip().rstrip(",")
+    return json.loads(text + "]")
+
+
+def print_decisions(events):
+    spans = [e for e in events if e.get("ph") == "X" and "decision" in e.get("args", {})]
+    acted = {e["args"]["decision"] for e in spans if e["name"] in ("lock", "unlock")}
+    for decision in sorted(acted):
+        stages = sorted((e for e in spans if e["args"]["decision"] == decision), key=lambda e: e["ts"])
+        start = stages[0]["ts"]
+        end = max(e["ts"] + e["dur"] for e in stages)
+        action = next(e["name"] for e in stages if e["name"] in ("lock", "unlock"))
+        print(f"decision {decision} ({action}): {(end - start) / 1000:.1f} ms from the triggering advert")
+        for e in stages:
+            extra = {k: v for k, v in e["args"].items() if k != "decision"}
+            print(f"  {(e['ts'] - start) / 1000:>8.1f} ms  {e['name']:<24} {e['dur'] / 1000:>8.1f} ms  {extra or ''}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--advert-interval", type=float, default=0.05, help="seconds between target adverts")
+    parser.add_argument("--keep", metavar="PATH", help="write the last walk trace here instead of a temp file")
+    args = parser.parse_args(argv)
+
+    # bench_async_unlock's model, scaled down so the walk takes a few seconds
+    costs = {
+        "caffeinate": 0.2, "pmset": 0.06, "ioreg": 0.04, "security": 0.12,
+        "applescript": 0.06, "frontmost": 0.09, "typing": 1.4,
+    }
+    fd, scratch = tempfile.mkstemp(prefix="proxi_lock_bench_", suffix=".trace.json")
+    os.close(fd)
+    walk_path = args.keep or scratch
+    try:
+        results = advert_path(args.count, scratch)
+        _common.print_results(results)
+        for on_loop in (False, True):
+            traced_walk(walk_path, costs, args.advert_interval, on_loop)
+            events = read_trace(walk_path)
+            print(f"{'async_lock_manager on the monitor loop' if on_loop else 'lock_manager on the executor thread'}: "
+                  f"{len(events)} trace events in {os.path.getsize(walk_path):,} bytes")
+            print_decisions(events)
+    finally:
+        os.remove(scratch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""Record and replay BLE advertisement traces"""
+import asyncio
+import os
+import struct
+import sys
+import time
+
+TRACE_MAGIC = b"PXLT\x01"
+
+# timestamp, rssi, tx_power, address length, name length, manufacturer entries
+_RECORD = struct.Struct("<dbbBBB")
+_MANUFACTURER = struct.Struct("<HH")
+
+_NO_TX_POWER = -128
+_NO_NAME = 0xFF
+_REPLAY_YIELD_EVERY = 256
+
+
+class TraceDevice:
+    """Stand-in for bleak's BLEDevice during replay"""
+    __slots__ = ("address", "name")
+
+    def __init__(self, address, name):
+        self.address = address
+        self.name = name
+
+
+class TraceAdvertisement:
+    """Stand-in for bleak's AdvertisementData during replay"""
+    __slots__ = ("rssi", "tx_power", "manufacturer_data", "timestamp")
+
+    def __init__(self, rssi, tx_power, manufacturer_data, timestamp):
+        self.rssi = rssi
+        self.tx_power = tx_power
+        self.manufacturer_data = manufacturer_data
+        self.timestamp = timestamp
+
+
+def _clamp_int8(value):
+    return max(-127, min(127, int(value)))
+
+
+class TraceRecorder:
+    """Append-only binary writer for advertisements seen by the scanner"""
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, "ab")
+        if new_file:
+            self._file.write(TRACE_MAGIC)
+        self.count = 0
+
+    def record(self, device, advertisement_data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        address = (device.address or "").encode("utf-8")[:255]
+        if device.name is None:
+            name = b""
+            name_len = _NO_NAME
+        else:
+            name = device.name.encode("utf-8")[:254]
+            name_len = len(name)
+
+        rssi = advertisement_data.rssi
+        tx_power = getattr(advertisement_data, "tx_power", None)
+        manufacturer_data = getattr(advertisement_data, "manufacturer_data", None) or {}
+        entries = list(manufacturer_data.items())[:255]
+
+        parts = [
+            _RECORD.pack(
+                timestamp,
+                _clamp_int8(rssi if rssi is not None else -127),
+                _NO_TX_POWER if tx_power is None else _clamp_int8(tx_power),
+                len(address),
+                name_len,
+                len(entries),
+            ),
+            address,
+            name,
+        ]
+        for company_id, payload in entries:
+            payload = bytes(payload)[:0xFFFF]
+            parts.append(_MANUFACTURER.pack(company_id & 0xFFFF, len(payload)))
+            parts.append(payload)
+
+        self._file.write(b"".join(parts))
+        self.count += 1
+
+    def flush(self):
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def read_trace(path):
+    """Yield (device, advertisement_data) pairs from a trace file"""
+    with open(os.path.expanduser(path), "rb") as f:
+        data = f.read()
+
+    if not data.startswith(TRACE_MAGIC):
+        raise ValueError(f"{path} is not a Proxi-Lock trace")
+
+    offset = len(TRACE_MAGIC)
+    end = len(data)
+    unpack_record = _RECORD.unpack_from
+    unpack_manufacturer = _MANUFACTURER.unpack_from
+
+    while offset + _RECORD.size <= end:
+        timestamp, rssi, tx_power, address_len, name_len, entries = unpack_record(data, offset)
+        offset += _RECORD.size
+
+        address = data[offset:offset + address_len].decode("utf-8", errors="replace")
+        offset += address_len
+
+        if name_len == _NO_NAME:
+            name = None
+        else:
+            name = data[offset:offset + name_len].decode("utf-8", errors="replace")
+            offset += name_len
+
+        manufacturer_data = {}
+        for _ in range(entries):
+            company_id, length = unpack_manufacturer(data, offset)
+            offset += _MANUFACTURER.size
+            manufacturer_data[company_id] = data[offset:offset + length]
+            offset += length
+
+        if offset > end:
+            # Truncated tail from an interrupted recording
+            return
+
+        yield (
+            TraceDevice(address, name),
+            TraceAdvertisement(
+                rssi,
+                None if tx_power == _NO_TX_POWER else tx_power,
+                manufacturer_data,
+                timestamp,
+            ),
+        )
+
+
+class ReplayScanner:
+    """Drop-in replacement for BleakScanner that plays back a recorded trace
+
+    speed=1.0 replays in real time, speed=N replays N times faster and
+    speed=None (or 0) replays as fast as possible.
+    """
+
+    def __init__(self, detection_callback, path, speed=1.0):
+        self.detection_callback = detection_callback
+        self.path = path
+        self.speed = speed or None
+        self.count = 0
+        self.elapsed = 0.0
+        self._task = None
+        self._done = None
+
+    async def start(self):
+        self._done = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def wait(self):
+        """Wait until the whole trace has been delivered"""
+        if self._done is not None:
+            await self._done.wait()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        callback = self.detection_callback
+        speed = self.speed
+        first_timestamp = None
+        started = loop.time()
+
+        try:
+            for device, advertisement_data in read_trace(self.path):
+                if speed is None:
+                    if self.count % _REPLAY_YIELD_EVERY == 0:
+                        await asyncio.sleep(0)
+                else:
+                    if first_timestamp is None:
+                        first_timestamp = advertisement_data.timestamp
+                    due = started + (advertisement_data.timestamp - first_timestamp) / speed
+                    delay = due - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                callback(device, advertisement_data)
+                self.count += 1
+        finally:
+            self.elapsed = loop.time() - started
+            self._done.set()
+
+
+def replay_trace(path, detection_callback):
+    """Feed a whole trace synchronously, returning (adverts, seconds)"""
+    count = 0
+    started = time.perf_counter()
+    for device, advertisement_data in read_trace(path):
+        detection_callback(device, advertisement_data)
+        count += 1
+    return count, time.perf_counter() - started
+
+
+async def _record(path):
+    from bleak import BleakScanner
+
+    recorder = TraceRecorder(path)
+    scanner = BleakScanner(recorder.record)
+    await scanner.start()
+    print(f"Recording advertisements to {path} (Ctrl+C to stop)")
+    try:
+        while True:
+            await asyncio.sleep(1.0)
+            recorder.flush()
+    finally:
+        await scanner.stop()
+        recorder.close()
+        print(f"Recorded {recorder.count} advertisements")
+
+
+async def _replay(path, speed, through_main):
+    from functools import partial
+    from scanner import ProximityScanner
+
+    if through_main:
+        import main
+        proximity_callback = main.proximity_callback
+    else:
+        def proximity_callback(proximity, rssi, consecutive_far_count):
+            pass
+
+    scanner = ProximityScanner(
+        proximity_callback,
+        scanner_factory=partial(ReplayScanner, path=path, speed=speed),
+    )
+    if through_main:
+        main._monitor_instance.scanner_instance = scanner
+
+    await scanner.start()
+    if scanner.scanner is None:
+        print("No target device configured; nothing to replay")
+        return
+    await scanner.scanner.wait()
+    await scanner.stop()
+
+    replay = scanner.scanner
+    rate = replay.count / replay.elapsed if replay.elapsed > 0 else float("inf")
+    print(f"Replayed {replay.count} advertisements in {replay.elapsed:.3f}s ({rate:.0f} adverts/s)")
+
+
+def _main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Record or replay BLE advertisement traces")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="record every advertisement to a trace file")
+    record.add_argument("path")
+
+    replay = commands.add_parser("replay", help="replay a trace through ProximityScanner")
+    replay.add_argument("path")
+    replay.add_argument("--speed", type=float, default=0.0,
+                        help="playback speed multiplier (0 = as fast as possible)")
+    replay.add_argument("--main", action="store_true",
+                        help="route decisions through main.proximity_callback (runs real lock actions)")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "record":
+            asyncio.run(_record(args.path))
+        else:
+            asyncio.run(_replay(args.path, args.speed, args.main))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    _main(sys.argv[1:])
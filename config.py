@@ -1,11 +1,130 @@
 """Configuration management"""
+import atexit
+import ctypes
+import ctypes.util
 import json
 import os
+import select
+import struct
 import sys
+import tempfile
 import threading
+import time
+
+
+def file_signature(path):
+    """(mtime_ns, size, inode) of path, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def write_json_atomic(path, data, before_replace=None):
+    """Write JSON to a temp file in the same directory, fsync it and rename it over path
+
+    before_replace(signature) is called with the new file's signature just
+    before the rename makes it visible.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=".proxi_lock_", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+            st = os.fstat(f.fileno())
+        if before_replace is not None:
+            before_replace((st.st_mtime_ns, st.st_size, st.st_ino))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class WriteBehindWriter:
+    """Debounces saves and writes only the newest data on a background thread
+
+    Each schedule() replaces the pending data and pushes the write back to
+    delay seconds after the latest change, so a burst of menu clicks costs
+    one write. delay=None writes synchronously on the caller's thread.
+    """
+
+    def __init__(self, path, delay=0.5):
+        self.path = path
+        self.delay = delay
+        self._pending = None
+        self._due = 0.0
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self.write_count = 0
+        self.last_signature = None
+
+    def schedule(self, data):
+        with self._condition:
+            self._pending = data
+            self._due = time.monotonic() + (self.delay or 0.0)
+            if self.delay is not None:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+                self._condition.notify()
+                return
+        self.flush()
+
+    def flush(self):
+        """Write any pending data now"""
+        # Taking the data under the write lock keeps writes in schedule order
+        with self._write_lock:
+            with self._condition:
+                data = self._pending
+                self._pending = None
+            if data is None:
+                return
+            try:
+                write_json_atomic(self.path, data, self._set_last_signature)
+                self.write_count += 1
+            except OSError as e:
+                print(f"Failed to save config: {e}")
+
+    def _set_last_signature(self, signature):
+        # Recorded before the rename so a watcher never mistakes our write for an edit
+        self.last_signature = signature
+
+    def discard(self):
+        """Drop a pending write (an external edit superseded it)"""
+        with self._condition:
+            self._pending = None
+
+    def pending(self):
+        with self._condition:
+            return self._pending is not None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+                remaining = self._due - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+            self.flush()
 
 class ProxiLockConfig:
-    """Thread-safe configuration manager with auto-persistence"""
+    """Thread-safe configuration manager with auto-persistence
+
+    Every change publishes a new immutable ConfigSnapshot on .snapshot,
+    which hot paths read without locking, and queues a write-behind save.
+    Components that cache settings subscribe() to hear about changes,
+    whether made through a setter or by editing the file (see
+    ConfigFileWatcher).
+    """
     
     _DEFAULTS = {
         "target_name": None,
@@ -19,10 +138,42 @@ class ProxiLockConfig:
         "consecutive_far_required": 5,
         "keychain_item": "proxi-lock-password",
         "use_screen_saver_lock": False,
-        "lock_only_mode": False
+        "lock_only_mode": False,
+        "record_trace_path": None,
+        "rssi_filter": "none",
+        "rssi_filter_alpha": 0.3,
+        "rssi_filter_window": 5,
+        "rssi_filter_process_noise": 1.0,
+        "rssi_filter_measurement_noise": 16.0,
+        "password_cache_ttl": 900.0,
+        "target_devices": [],
+        "lock_combinator": "all",
+        "unlock_combinator": "any",
+        "combinator_quorum": 2,
+        "scan_policy": "adaptive",
+        "metrics_port": None,
+        "metrics_textfile": None,
+        "metrics_interval": 15.0,
+        "log_path": None,
+        "log_level": "debug",
+        "log_sample": {},
+        "log_max_bytes": 1048576,
+        "log_backups": 3,
+        "trace_path": None,
+        "lock_distance": None,
+        "unlock_distance": None,
+        "rssi_at_1m": -59.0,
+        "path_loss_exponent": 2.0,
+        "predictive_lock": False,
+        "predict_window": 3.0,
+        "predict_horizon": 1.0,
+        "predict_min_r2": 0.8,
+        "hysteresis_mode": "count",
+        "absence_watchdog": False,
+        "absence_interval_factor": 4.0
     }
     
-    def __init__(self, path=None):
+    def __init__(self, path=None, write_delay=0.5):
         if path is None:
             if getattr(sys, 'frozen', False):
                 app_support = os.path.join(
@@ -39,8 +190,12 @@ class ProxiLockConfig:
         else:
             self.path = os.path.expanduser(path)
         
-        self._lock = threading.Lock()
+        self._lock = threading.RLock()
         self._data = {}
+        self.snapshot = None
+        self._listeners = []
+        self._writer = WriteBehindWriter(self.path, write_delay)
+        atexit.register(self.flush)
         self._load()
     
     def _load(self):
@@ -54,6 +209,7 @@ class ProxiLockConfig:
                 loaded = json.load(f)
                 self._data = {**self._DEFAULTS, **loaded}
                 self._validate_max_unlocking_rssi()
+            self._publish()
         except (json.JSONDecodeError, IOError) as e:
             self._data = self._DEFAULTS.copy()
             self._save()
@@ -74,17 +230,70 @@ class ProxiLockConfig:
         elif max_unlocking > rssi_near:
             self._data["max_unlocking_rssi"] = rssi_near
     
-    def _save(self):
+    def subscribe(self, callback):
+        """callback(snapshot, changed_keys) runs after every change, in change order"""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
         try:
-            with open(self.path, "w") as f:
-                json.dump(self._data, f, indent=2)
-        except IOError as e:
+            self._listeners.remove(callback)
+        except ValueError:
             pass
+
+    def _publish(self):
+        with self._lock:
+            old = self.snapshot
+            new = ConfigSnapshot(self._data)
+            changed = new.diff(old) if old is not None else frozenset()
+            if old is None or changed:
+                self.snapshot = new
+            # Notifying under the lock keeps listeners in the same order as the changes
+            for callback in list(self._listeners) if changed else ():
+                try:
+                    callback(new, changed)
+                except Exception as e:
+                    print(f"Config listener error: {e}")
+            return dict(self._data)
+
+    def _save(self):
+        self._writer.schedule(self._publish())
+
+    def flush(self):
+        """Write any pending change to disk now"""
+        self._writer.flush()
+
+    def reload(self):
+        """Apply edits made to the file by someone else; True if a setting changed
+
+        An unreadable or half-written file is ignored rather than reset to
+        the defaults. The external edit wins over any unsaved local change.
+        """
+        try:
+            with open(self.path, "r") as f:
+                loaded = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Ignoring unreadable config file {self.path}: {e}")
+            return False
+        if not isinstance(loaded, dict):
+            return False
+
+        with self._lock:
+            old = self.snapshot
+            self._writer.discard()
+            self._data = {**self._DEFAULTS, **loaded}
+            self._validate_max_unlocking_rssi()
+            self._publish()
+            return self.snapshot is not old
+
+    def file_changed_externally(self, signature):
+        """Whether signature (see file_signature) differs from our own last write"""
+        return signature != self._writer.last_signature
     
     @property
     def target_name(self):
-        with self._lock:
-            return self._data["target_name"]
+        return self.snapshot.target_name
     
     @target_name.setter
     def target_name(self, value):
@@ -94,8 +303,7 @@ class ProxiLockConfig:
     
     @property
     def target_address(self):
-        with self._lock:
-            return self._data.get("target_address")
+        return self.snapshot.target_address
     
     @target_address.setter
     def target_address(self, value):
@@ -206,11 +414,490 @@ class ProxiLockConfig:
         self._data["lock_only_mode"] = value
         self._save()
     
+    @property
+    def record_trace_path(self):
+        return self._data["record_trace_path"]
+    
+    @record_trace_path.setter
+    def record_trace_path(self, value):
+        self._data["record_trace_path"] = value
+        self._save()
+    
+    @property
+    def rssi_filter(self):
+        return self._data["rssi_filter"]
+    
+    @rssi_filter.setter
+    def rssi_filter(self, value):
+        self._data["rssi_filter"] = value
+        self._save()
+    
+    @property
+    def rssi_filter_alpha(self):
+        return self._data["rssi_filter_alpha"]
+    
+    @rssi_filter_alpha.setter
+    def rssi_filter_alpha(self, value):
+        self._data["rssi_filter_alpha"] = value
+        self._save()
+    
+    @property
+    def rssi_filter_window(self):
+        return self._data["rssi_filter_window"]
+    
+    @rssi_filter_window.setter
+    def rssi_filter_window(self, value):
+        self._data["rssi_filter_window"] = value
+        self._save()
+    
+    @property
+    def rssi_filter_process_noise(self):
+        return self._data["rssi_filter_process_noise"]
+    
+    @rssi_filter_process_noise.setter
+    def rssi_filter_process_noise(self, value):
+        self._data["rssi_filter_process_noise"] = value
+        self._save()
+    
+    @property
+    def rssi_filter_measurement_noise(self):
+        return self._data["rssi_filter_measurement_noise"]
+    
+    @rssi_filter_measurement_noise.setter
+    def rssi_filter_measurement_noise(self, value):
+        self._data["rssi_filter_measurement_noise"] = value
+        self._save()
+    
+    @property
+    def password_cache_ttl(self):
+        return self._data["password_cache_ttl"]
+    
+    @password_cache_ttl.setter
+    def password_cache_ttl(self, value):
+        self._data["password_cache_ttl"] = value
+        self._save()
+    
+    @property
+    def target_devices(self):
+        return list(self._data["target_devices"])
+    
+    @target_devices.setter
+    def target_devices(self, value):
+        self._data["target_devices"] = list(value)
+        self._save()
+    
+    @property
+    def lock_combinator(self):
+        return self._data["lock_combinator"]
+    
+    @lock_combinator.setter
+    def lock_combinator(self, value):
+        self._data["lock_combinator"] = value
+        self._save()
+    
+    @property
+    def unlock_combinator(self):
+        return self._data["unlock_combinator"]
+    
+    @unlock_combinator.setter
+    def unlock_combinator(self, value):
+        self._data["unlock_combinator"] = value
+        self._save()
+    
+    @property
+    def combinator_quorum(self):
+        return self._data["combinator_quorum"]
+    
+    @combinator_quorum.setter
+    def combinator_quorum(self, value):
+        self._data["combinator_quorum"] = value
+        self._save()
+    
+    @property
+    def scan_policy(self):
+        return self._data["scan_policy"]
+    
+    @scan_policy.setter
+    def scan_policy(self, value):
+        self._data["scan_policy"] = value
+        self._save()
+    
+    @property
+    def metrics_port(self):
+        return self._data["metrics_port"]
+    
+    @metrics_port.setter
+    def metrics_port(self, value):
+        self._data["metrics_port"] = value
+        self._save()
+    
+    @property
+    def metrics_textfile(self):
+        return self._data["metrics_textfile"]
+    
+    @metrics_textfile.setter
+    def metrics_textfile(self, value):
+        self._data["metrics_textfile"] = value
+        self._save()
+    
+    @property
+    def metrics_interval(self):
+        return self._data["metrics_interval"]
+    
+    @metrics_interval.setter
+    def metrics_interval(self, value):
+        self._data["metrics_interval"] = value
+        self._save()
+    
+    @property
+    def log_path(self):
+        return self._data["log_path"]
+    
+    @log_path.setter
+    def log_path(self, value):
+        self._data["log_path"] = value
+        self._save()
+    
+    @property
+    def log_level(self):
+        return self._data["log_level"]
+    
+    @log_level.setter
+    def log_level(self, value):
+        self._data["log_level"] = value
+        self._save()
+    
+    @property
+    def log_sample(self):
+        return self._data["log_sample"]
+    
+    @log_sample.setter
+    def log_sample(self, value):
+        self._data["log_sample"] = value
+        self._save()
+    
+    @property
+    def log_max_bytes(self):
+        return self._data["log_max_bytes"]
+    
+    @log_max_bytes.setter
+    def log_max_bytes(self, value):
+        self._data["log_max_bytes"] = value
+        self._save()
+    
+    @property
+    def log_backups(self):
+        return self._data["log_backups"]
+    
+    @log_backups.setter
+    def log_backups(self, value):
+        self._data["log_backups"] = value
+        self._save()
+    
+    @property
+    def trace_path(self):
+        return self._data["trace_path"]
+    
+    @trace_path.setter
+    def trace_path(self, value):
+        self._data["trace_path"] = value
+        self._save()
+    
+    @property
+    def lock_distance(self):
+        return self._data["lock_distance"]
+    
+    @lock_distance.setter
+    def lock_distance(self, value):
+        self._data["lock_distance"] = value
+        self._save()
+    
+    @property
+    def unlock_distance(self):
+        return self._data["unlock_distance"]
+    
+    @unlock_distance.setter
+    def unlock_distance(self, value):
+        self._data["unlock_distance"] = value
+        self._save()
+    
+    @property
+    def rssi_at_1m(self):
+        return self._data["rssi_at_1m"]
+    
+    @rssi_at_1m.setter
+    def rssi_at_1m(self, value):
+        self._data["rssi_at_1m"] = value
+        self._save()
+    
+    @property
+    def path_loss_exponent(self):
+        return self._data["path_loss_exponent"]
+    
+    @path_loss_exponent.setter
+    def path_loss_exponent(self, value):
+        self._data["path_loss_exponent"] = value
+        self._save()
+    
+    @property
+    def predictive_lock(self):
+        return self._data["predictive_lock"]
+    
+    @predictive_lock.setter
+    def predictive_lock(self, value):
+        self._data["predictive_lock"] = value
+        self._save()
+    
+    @property
+    def predict_window(self):
+        return self._data["predict_window"]
+    
+    @predict_window.setter
+    def predict_window(self, value):
+        self._data["predict_window"] = value
+        self._save()
+    
+    @property
+    def predict_horizon(self):
+        return self._data["predict_horizon"]
+    
+    @predict_horizon.setter
+    def predict_horizon(self, value):
+        self._data["predict_horizon"] = value
+        self._save()
+    
+    @property
+    def predict_min_r2(self):
+        return self._data["predict_min_r2"]
+    
+    @predict_min_r2.setter
+    def predict_min_r2(self, value):
+        self._data["predict_min_r2"] = value
+        self._save()
+    
+    @property
+    def hysteresis_mode(self):
+        return self._data["hysteresis_mode"]
+    
+    @hysteresis_mode.setter
+    def hysteresis_mode(self, value):
+        self._data["hysteresis_mode"] = value
+        self._save()
+    
+    @property
+    def absence_watchdog(self):
+        return self._data["absence_watchdog"]
+    
+    @absence_watchdog.setter
+    def absence_watchdog(self, value):
+        self._data["absence_watchdog"] = value
+        self._save()
+    
+    @property
+    def absence_interval_factor(self):
+        return self._data["absence_interval_factor"]
+    
+    @absence_interval_factor.setter
+    def absence_interval_factor(self, value):
+        self._data["absence_interval_factor"] = value
+        self._save()
+    
     @property
     def unlocking_rssi_max(self):
         return self.max_unlocking_rssi
 
 
+class ConfigSnapshot:
+    """Immutable view of every setting at one point in time
+
+    Readers take config.snapshot once and use plain attribute loads; a
+    change replaces the whole object, so a reader never sees a mix of old
+    and new values.
+    """
+    __slots__ = tuple(ProxiLockConfig._DEFAULTS)
+
+    def __init__(self, data):
+        for key in self.__slots__:
+            value = data.get(key, ProxiLockConfig._DEFAULTS[key])
+            if isinstance(value, list):
+                value = tuple(value)
+            object.__setattr__(self, key, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ConfigSnapshot is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("ConfigSnapshot is immutable")
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def diff(self, other):
+        """Names of the settings whose values differ from other"""
+        return frozenset(key for key in self.__slots__ if getattr(self, key) != getattr(other, key))
+
+
+# inotify(7) event bits
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class _InotifyEvents:
+    """Linux: inotify on the config directory, filtered to the config file's name"""
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.name = os.fsencode(os.path.basename(path))
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(os.path.dirname(path) or "."), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed")
+
+    def wait(self, timeout, wake_fd):
+        readable, _, _ = select.select([self.fd, wake_fd], [], [], timeout)
+        if self.fd not in readable:
+            return False
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return False
+        offset = 0
+        relevant = False
+        while offset + _INOTIFY_EVENT.size <= len(buffer):
+            _, _, _, length = _INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += _INOTIFY_EVENT.size
+            name = buffer[offset:offset + length].rstrip(b"\0")
+            offset += length
+            relevant = relevant or name == self.name
+        return relevant
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _KqueueEvents:
+    """macOS/BSD: kqueue vnode events on the config directory (renames into it)"""
+
+    def __init__(self, path):
+        self.dir_fd = os.open(os.path.dirname(path) or ".", getattr(os, "O_EVTONLY", os.O_RDONLY))
+        self.kqueue = select.kqueue()
+        self.kqueue.control([select.kevent(
+            self.dir_fd,
+            filter=select.KQ_FILTER_VNODE,
+            flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+            fflags=select.KQ_NOTE_WRITE
+        )], 0, 0)
+        self._wake_registered = None
+
+    def wait(self, timeout, wake_fd):
+        if self._wake_registered != wake_fd:
+            self.kqueue.control([select.kevent(wake_fd, filter=select.KQ_FILTER_READ, flags=select.KQ_EV_ADD)], 0, 0)
+            self._wake_registered = wake_fd
+        events = self.kqueue.control(None, 4, timeout)
+        return any(event.ident == self.dir_fd for event in events)
+
+    def close(self):
+        self.kqueue.close()
+        os.close(self.dir_fd)
+
+
+class _PollingEvents:
+    """No change notifications available: wake up every poll interval"""
+
+    def __init__(self, path):
+        pass
+
+    def wait(self, timeout, wake_fd):
+        select.select([wake_fd], [], [], timeout)
+        return False
+
+    def close(self):
+        pass
+
+
+def _open_event_source(path):
+    for source in (_InotifyEvents, _KqueueEvents):
+        try:
+            return source(path)
+        except (OSError, AttributeError, TypeError):
+            continue
+    return _PollingEvents(path)
+
+
+class ConfigFileWatcher:
+    """Applies external edits of the config file to a running ProxiLockConfig
+
+    Waits for inotify (Linux) or kqueue (macOS) events on the config
+    directory so an edit is picked up within milliseconds, and also checks
+    the file's mtime every poll_interval as a fallback (in-place writes on
+    macOS, or no event source at all). The file is only re-parsed when its
+    mtime, size or inode changed and it is not the config's own last write.
+    """
+
+    def __init__(self, config, poll_interval=1.0):
+        self.config = config
+        self.poll_interval = poll_interval
+        self._signature = file_signature(config.path)
+        self._thread = None
+        self._stopping = False
+        self._wake_r = None
+        self._wake_w = None
+        self.source_name = None
+        self.reload_count = 0
+
+    def check(self):
+        """Reload if the file changed since the last check; True if settings changed"""
+        signature = file_signature(self.config.path)
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+        if not self.config.file_changed_externally(signature):
+            return False
+        self.reload_count += 1
+        return self.config.reload()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._signature = file_signature(self.config.path)
+        self._wake_r, self._wake_w = os.pipe()
+        source = _open_event_source(self.config.path)
+        self.source_name = type(source).__name__.strip("_")
+        self._thread = threading.Thread(target=self._run, args=(source,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping = True
+        os.write(self._wake_w, b"x")
+        self._thread.join(timeout=2.0)
+        self._thread = None
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    def _run(self, source):
+        try:
+            while not self._stopping:
+                try:
+                    source.wait(self.poll_interval, self._wake_r)
+                    if not self._stopping:
+                        self.check()
+                except Exception as e:
+                    print(f"Config watcher error: {e}")
+                    time.sleep(self.poll_interval)
+        finally:
+            source.close()
+
+
 _config = ProxiLockConfig()
 
 TARGET_NAME = _config.target_name
@@ -223,14 +910,27 @@ CONSECUTIVE_FAR_REQUIRED = _config.consecutive_far_required
 KEYCHAIN_ITEM = _config.keychain_item
 UNLOCKING_RSSI_MAX = _config.unlocking_rssi_max
 
+_watcher = None
+
 def get_config():
     return _config
 
+def get_config_watcher():
+    global _watcher
+    if _watcher is None or _watcher.config is not _config:
+        _watcher = ConfigFileWatcher(_config)
+    return _watcher
+
 def reload_config():
+    """Re-read the config file; subscribers are notified of any change
+
+    The module-level constants are kept only for older callers; they are
+    snapshots from import (or the last reload) and do not follow changes.
+    """
     global TARGET_NAME, RSSI_NEAR, RSSI_FAR, SCAN_INTERVAL, DEVICE_TIMEOUT
     global STATE_DEBOUNCE_TIME, CONSECUTIVE_FAR_REQUIRED, KEYCHAIN_ITEM, UNLOCKING_RSSI_MAX
     
-    _config._load()
+    _config.reload()
     TARGET_NAME = _config.target_name
     RSSI_NEAR = _config.rssi_near
     RSSI_FAR = _config.rssi_far
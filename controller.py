@@ -1,22 +1,165 @@
+"""Table-driven proximity classification"""
+import math
+
+FAR = 0
+MID = 1
+NEAR = 2
+
+PROXIMITY_NAMES = ("FAR", "MID", "NEAR")
+
+# Whole RSSI domain reported by BLE radios, in dBm
+RSSI_MIN = -127
+RSSI_MAX = 20
+
+
+def _evaluate(rssi, rssi_far, max_unlocking_rssi):
+    """Reference threshold chain the lookup table is built from"""
+    if rssi <= rssi_far:
+        return FAR
+    elif max_unlocking_rssi > rssi >= rssi_far:
+        return MID
+    return NEAR
+
+
+def _on_whole_dbm(threshold):
+    """Whether threshold is a whole dBm; NaN is rejected since no reading compares with it"""
+    threshold = float(threshold)
+    if threshold != threshold:
+        raise ValueError("RSSI thresholds must not be NaN")
+    return threshold.is_integer()
+
+
 class ProximityController:
+    """Classifies RSSI into FAR/MID/NEAR through a lookup table
+
+    The table has two slots per whole dBm: one for the integer value itself
+    and one for the open interval up to the next integer, so smoothed
+    (float) RSSI is classified exactly like the original comparisons would.
+    It is rebuilt whenever a threshold changes, together with a dict view
+    keyed by whole dBm so the common integer case is a single lookup. A
+    threshold between whole dBm (a per-device override or one derived
+    from metres) would fall inside a slot, so then there is no table and
+    fractional readings go through the comparisons themselves.
+    """
+
     def __init__(self, rssi_near, rssi_far, max_unlocking_rssi):
-        self.rssi_near = rssi_near
-        self.rssi_far = rssi_far
-        self.max_unlocking_rssi = max_unlocking_rssi
+        self._rssi_near = rssi_near
+        self._rssi_far = rssi_far
+        self._max_unlocking_rssi = max_unlocking_rssi
+        self._table = b""
+        self._lookup = {}
+        self._np_table = None
+        self._build_table()
 
-    def get_proximity(self, rssi):
-        UNLOCKING_RSSI_MAX = self.max_unlocking_rssi
-        """State machine: Return 'NEAR' or 'FAR' based on RSSI thresholds"""
-        if rssi is None:
-            return "FAR"
-        elif rssi <= self.rssi_far:
-            return "FAR"
-        elif UNLOCKING_RSSI_MAX > rssi >= self.rssi_far:
-            return "MID"
-        
-        elif UNLOCKING_RSSI_MAX < rssi < self.rssi_near:
-            return "NEAR"
-        elif rssi >= self.rssi_near:
-            return "NEAR"
+    def _build_table(self):
+        far = self._rssi_far
+        max_unlocking = self._max_unlocking_rssi
+        whole_dbm = _on_whole_dbm(far)
+        if _on_whole_dbm(max_unlocking) and whole_dbm:
+            table = bytearray()
+            for value in range(RSSI_MIN, RSSI_MAX + 1):
+                table.append(_evaluate(value, far, max_unlocking))
+                table.append(_evaluate(value + 0.5, far, max_unlocking))
+            self._table = bytes(table)
         else:
-            return "NEAR"
+            self._table = None
+        lookup = {value: _evaluate(value, far, max_unlocking) for value in range(RSSI_MIN, RSSI_MAX + 1)}
+        lookup[None] = FAR
+        self._lookup = lookup
+        self._np_table = None
+
+    def set_thresholds(self, rssi_near, rssi_far, max_unlocking_rssi):
+        """Replace all thresholds at once with a single table rebuild"""
+        self._rssi_near = rssi_near
+        self._rssi_far = rssi_far
+        self._max_unlocking_rssi = max_unlocking_rssi
+        self._build_table()
+
+    @property
+    def rssi_near(self):
+        return self._rssi_near
+
+    @rssi_near.setter
+    def rssi_near(self, value):
+        self._rssi_near = value
+        self._build_table()
+
+    @property
+    def rssi_far(self):
+        return self._rssi_far
+
+    @rssi_far.setter
+    def rssi_far(self, value):
+        self._rssi_far = value
+        self._build_table()
+
+    @property
+    def max_unlocking_rssi(self):
+        return self._max_unlocking_rssi
+
+    @max_unlocking_rssi.setter
+    def max_unlocking_rssi(self, value):
+        self._max_unlocking_rssi = value
+        self._build_table()
+
+    def classify(self, rssi):
+        """Return FAR, MID or NEAR as an integer state"""
+        try:
+            return self._lookup[rssi]
+        except KeyError:
+            pass
+
+        # Fractional (smoothed) or out-of-domain readings
+        if rssi != rssi:
+            return FAR
+        table = self._table
+        if table is None:
+            return _evaluate(rssi, self._rssi_far, self._max_unlocking_rssi)
+        whole = math.floor(rssi)
+        index = ((whole - RSSI_MIN) << 1) | (rssi != whole)
+
+        if index < 0:
+            return table[0]
+        if index >= len(table):
+            return table[-1]
+        return table[index]
+
+    def get_proximity(self, rssi):
+        """State machine: Return 'NEAR', 'MID' or 'FAR' based on RSSI thresholds"""
+        return PROXIMITY_NAMES[self.classify(rssi)]
+
+    def classify_batch(self, rssi_values):
+        """Classify many samples in one call
+
+        With NumPy installed this takes any array-like (NaN meaning no
+        reading) and returns a uint8 array. Without NumPy it returns a
+        bytes object with one state per sample.
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            return bytes(self.classify(value) for value in rssi_values)
+
+        values = np.asarray(rssi_values, dtype=np.float64)
+        missing = np.isnan(values)
+        if self._table is None:
+            states = np.where(values < self._max_unlocking_rssi, MID, NEAR).astype(np.uint8)
+            states[(values <= self._rssi_far) | missing] = FAR
+            return states
+
+        if self._np_table is None:
+            self._np_table = np.frombuffer(self._table, dtype=np.uint8)
+
+        whole = np.floor(np.where(missing, RSSI_MIN, values))
+        # Below the domain classify() uses the first slot, whatever the fraction
+        fraction = (values != whole) & ~missing & (whole >= RSSI_MIN)
+        index = (np.clip(whole, RSSI_MIN, RSSI_MAX).astype(np.intp) - RSSI_MIN) * 2 + fraction
+        index[whole > RSSI_MAX] = len(self._table) - 1
+        states = self._np_table[index]
+        states[missing] = FAR
+        return states
+
+
+def proximity_names(states):
+    """Map integer states (e.g. from classify_batch) back to their string names"""
+    return [PROXIMITY_NAMES[state] for state in states]
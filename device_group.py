@@ -0,0 +1,290 @@
+"""Per-device proximity state for a set of enrolled devices and how they combine"""
+import time
+
+from controller import FAR, MID, NEAR, ProximityController
+from distance import DISTANCE_KEYS, model_for
+
+COMBINATOR_ALL = "all"
+COMBINATOR_ANY = "any"
+COMBINATOR_QUORUM = "quorum"
+COMBINATORS = (COMBINATOR_ALL, COMBINATOR_ANY, COMBINATOR_QUORUM)
+
+_THRESHOLD_OVERRIDES = ("rssi_near", "rssi_far", "max_unlocking_rssi") + DISTANCE_KEYS
+
+
+class TrackedDevice:
+    """One enrolled device with its own controller, RSSI filter and FAR counter
+
+    model is the device's PathLossModel when its thresholds are in metres
+    (re-referenced to tx_power once an advert carries one), else None.
+    predictor is its TrendPredictor when predictive locking is on.
+    """
+    __slots__ = ("address", "name", "controller", "rssi_filter", "state", "rssi", "consecutive_far_count", "overrides",
+                 "model", "tx_power", "predictor")
+
+    def __init__(self, address, name, controller, rssi_filter, overrides=None):
+        self.address = address
+        self.name = name
+        self.controller = controller
+        self.rssi_filter = rssi_filter
+        self.overrides = overrides
+        # Never seen counts as away until the first advert says otherwise
+        self.state = FAR
+        self.rssi = None
+        self.consecutive_far_count = 0
+        self.model = None
+        self.tx_power = None
+        self.predictor = None
+
+    def distance(self):
+        """Estimated metres from the latest (filtered) RSSI, or None without a distance model"""
+        if self.model is None:
+            return None
+        return self.model.distance(self.rssi)
+
+    def __repr__(self):
+        return f"TrackedDevice({self.address or self.name!r}, state={self.state}, far={self.consecutive_far_count})"
+
+
+def _satisfied(combinator, matching, total, quorum):
+    if combinator == COMBINATOR_ALL:
+        return matching == total
+    if combinator == COMBINATOR_ANY:
+        return matching > 0
+    return matching >= min(quorum, total)
+
+
+def parse_targets(snapshot):
+    """[(address, name, threshold overrides)] from target_devices plus the legacy single target
+
+    target_devices entries are addresses, or dicts with "address" or
+    "name" and optional rssi_near/rssi_far/max_unlocking_rssi overrides,
+    or lock_distance/unlock_distance/rssi_at_1m/path_loss_exponent for
+    thresholds in metres.
+    """
+    targets = []
+    seen = set()
+    for entry in snapshot.target_devices or ():
+        if isinstance(entry, str):
+            address, name, overrides = entry, None, None
+        else:
+            address, name = entry.get("address"), entry.get("name")
+            overrides = {k: entry[k] for k in _THRESHOLD_OVERRIDES if k in entry} or None
+        key = address or name
+        if key and key not in seen:
+            seen.add(key)
+            targets.append((address, name, overrides))
+
+    if snapshot.target_address and snapshot.target_address not in seen:
+        targets.append((snapshot.target_address, None, None))
+    elif not snapshot.target_address and snapshot.target_name and snapshot.target_name not in seen:
+        targets.append((None, snapshot.target_name, None))
+    return targets
+
+
+def group_from_config(snapshot, controller, filter_factory, predictor_factory=None):
+    """DeviceGroup for the targets and combinators selected in ProxiLockConfig"""
+    combinators = []
+    for key, default in (("lock_combinator", COMBINATOR_ALL), ("unlock_combinator", COMBINATOR_ANY)):
+        combinator = getattr(snapshot, key)
+        if combinator not in COMBINATORS:
+            print(f"Unknown {key.replace('_', ' ')} '{combinator}', using '{default}'")
+            combinator = default
+        combinators.append(combinator)
+    return DeviceGroup(
+        parse_targets(snapshot),
+        controller,
+        filter_factory,
+        lock_combinator=combinators[0],
+        unlock_combinator=combinators[1],
+        quorum=max(1, int(snapshot.combinator_quorum)),
+        distance_defaults=snapshot,
+        predictor_factory=predictor_factory,
+    )
+
+
+class DeviceGroup:
+    """Enrolled devices, found by address in O(1), combined into one group state
+
+    Devices are matched by address, or by name for targets enrolled by
+    name (the address is remembered on first sight). The group keeps a
+    count of devices in each state, so combining is O(1) per advert no
+    matter how many devices are enrolled:
+
+    - FAR when the lock combinator holds over FAR devices
+    - NEAR when the unlock combinator holds over NEAR devices
+    - MID otherwise; when both hold, FAR wins (locking is the safe side)
+
+    A device whose lock_distance and unlock_distance are set (its own or
+    from distance_defaults, a ConfigSnapshot) is classified in metres: its
+    controller gets the dBm thresholds its path-loss model puts at those
+    distances, rebuilt if its adverts carry a TX power level.
+
+    With a predictor_factory each device also tracks its RSSI trend, and
+    departing is True while at least one device is predicted to leave and
+    the lock combinator holds over devices that are FAR or predicted to be.
+    """
+
+    def __init__(self, targets, controller, filter_factory,
+                 lock_combinator=COMBINATOR_ALL, unlock_combinator=COMBINATOR_ANY, quorum=1, distance_defaults=None,
+                 predictor_factory=None):
+        for combinator in (lock_combinator, unlock_combinator):
+            if combinator not in COMBINATORS:
+                raise ValueError(f"Unknown combinator: {combinator}")
+        self.controller = controller
+        self.lock_combinator = lock_combinator
+        self.unlock_combinator = unlock_combinator
+        self.quorum = quorum
+        self.distance_defaults = distance_defaults
+        self.devices = []
+        self._by_address = {}
+        self._by_name = {}
+        for address, name, overrides in targets:
+            tracked = TrackedDevice(address, name, self.controller, filter_factory(), overrides)
+            self._configure(tracked)
+            if predictor_factory is not None:
+                tracked.predictor = predictor_factory()
+            self.devices.append(tracked)
+            if address:
+                self._by_address[address] = tracked
+            else:
+                self._by_name[name] = tracked
+        self._counts = [0, 0, 0]
+        self._counts[FAR] = len(self.devices)
+        # Devices predicted to leave, and how many of those are not FAR yet
+        self._departing = 0
+        self._departing_not_far = 0
+        self.departing = False
+        self.state = self._combine()
+
+    def _distances(self, overrides):
+        """(lock_distance, unlock_distance) for a device, or None when it uses dBm thresholds"""
+        distances = []
+        for key in ("lock_distance", "unlock_distance"):
+            value = overrides.get(key) if overrides else None
+            if value is None:
+                value = getattr(self.distance_defaults, key, None)
+            distances.append(value)
+        return None if None in distances else tuple(distances)
+
+    def _configure(self, tracked):
+        """Give tracked the controller (and distance model) its settings call for"""
+        overrides = tracked.overrides
+        c = self.controller
+        distances = self._distances(overrides)
+        if distances is not None:
+            model = model_for(overrides, self.distance_defaults)
+            if tracked.tx_power is not None:
+                model = model.with_tx_power(tracked.tx_power)
+            try:
+                rssi_far, max_unlocking_rssi = model.thresholds(*distances)
+            except ValueError as e:
+                print(f"Ignoring distance thresholds for {tracked.address or tracked.name}: {e}")
+            else:
+                tracked.model = model
+                # Adverts report whole dBm, so whole-dBm thresholds lose nothing
+                tracked.controller = ProximityController(c.rssi_near, round(rssi_far), round(max_unlocking_rssi))
+                return
+        tracked.model = None
+        if not overrides:
+            tracked.controller = c
+            return
+        tracked.controller = ProximityController(
+            overrides.get("rssi_near", c.rssi_near),
+            overrides.get("rssi_far", c.rssi_far),
+            overrides.get("max_unlocking_rssi", c.max_unlocking_rssi),
+        )
+
+    def __len__(self):
+        return len(self.devices)
+
+    def addresses(self):
+        return [d.address for d in self.devices if d.address]
+
+    def names(self):
+        return [d.name for d in self.devices if not d.address]
+
+    def lookup(self, address, name):
+        """The enrolled device this advert belongs to, or None"""
+        tracked = self._by_address.get(address)
+        if tracked is None and self._by_name:
+            tracked = self._by_name.get(name or "")
+            if tracked is not None:
+                self._by_address[address] = tracked
+        return tracked
+
+    def observe(self, tracked, rssi, tx_power=None, now=None):
+        """Feed one advert's RSSI (and TX power level, if any) to its device; returns the filtered RSSI
+
+        now (seconds, any monotonic clock) timestamps the reading for the
+        trend predictor; it defaults to time.monotonic().
+        """
+        if tx_power is not None and tx_power != tracked.tx_power and tracked.model is not None:
+            tracked.tx_power = tx_power
+            self._configure(tracked)
+        if rssi is not None:
+            rssi = tracked.rssi_filter.update(rssi)
+        state = tracked.controller.classify(rssi)
+        tracked.rssi = rssi
+
+        if state == FAR:
+            tracked.consecutive_far_count += 1
+        elif state == NEAR:
+            tracked.consecutive_far_count = 0
+
+        previous = tracked.state
+        if state != previous:
+            tracked.state = state
+            counts = self._counts
+            counts[previous] -= 1
+            counts[state] += 1
+            self.state = self._combine()
+        if tracked.predictor is not None:
+            self._predict(tracked, previous, rssi, time.monotonic() if now is None else now)
+        return rssi
+
+    def _predict(self, tracked, previous, rssi, now):
+        predictor = tracked.predictor
+        was = predictor.departing
+        departing = predictor.update(now, rssi, tracked.controller.rssi_far)
+        if departing != was:
+            self._departing += 1 if departing else -1
+        before = was and previous != FAR
+        after = departing and tracked.state != FAR
+        if before != after:
+            self._departing_not_far += 1 if after else -1
+        self.departing = self._departing > 0 and _satisfied(
+            self.lock_combinator, self._counts[FAR] + self._departing_not_far, len(self.devices), self.quorum
+        )
+
+    def _combine(self):
+        total = len(self.devices)
+        counts = self._counts
+        if total and _satisfied(self.lock_combinator, counts[FAR], total, self.quorum):
+            return FAR
+        if total and _satisfied(self.unlock_combinator, counts[NEAR], total, self.quorum):
+            return NEAR
+        return MID
+
+    def reset_far_counts(self):
+        for tracked in self.devices:
+            tracked.consecutive_far_count = 0
+
+    def set_thresholds(self, rssi_near, rssi_far, max_unlocking_rssi):
+        """Update the shared controller and rebuild per-device overrides around it"""
+        self.controller.set_thresholds(rssi_near, rssi_far, max_unlocking_rssi)
+        for tracked in self.devices:
+            if tracked.overrides or tracked.model is not None:
+                self._configure(tracked)
+
+    def set_predictor_factory(self, predictor_factory):
+        """Start (or stop, with None) trend prediction with fresh predictors"""
+        for tracked in self.devices:
+            tracked.predictor = predictor_factory() if predictor_factory is not None else None
+        self._departing = 0
+        self._departing_not_far = 0
+        self.departing = False
+
+    def set_filter_factory(self, filter_factory):
+        for tracked in self.devices:
+            tracked.rssi_filter = filter_factory()
@@ -0,0 +1,121 @@
+"""Bounded, expiring table of nearby BLE advertisers"""
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+
+class DeviceRecord:
+    __slots__ = ("address", "name", "rssi", "last_seen")
+
+    def __init__(self, address, name, rssi, last_seen):
+        self.address = address
+        self.name = name
+        self.rssi = rssi
+        self.last_seen = last_seen
+
+    def copy(self):
+        return DeviceRecord(self.address, self.name, self.rssi, self.last_seen)
+
+    def __repr__(self):
+        return f"DeviceRecord({self.address!r}, {self.name!r}, {self.rssi!r}, {self.last_seen!r})"
+
+
+class DeviceTable:
+    """Most recently seen advertisers, capped at capacity and expiring after ttl
+
+    - update() is O(1): a dict hit plus an LRU move; a new address beyond
+      capacity evicts the least recently seen one
+    - expiry uses a heap holding one entry per record; a popped entry
+      whose record was seen again is pushed back with its new deadline, so
+      each stale record costs O(log n) once
+    - top_k() returns copies of the k strongest live records
+
+    Thread-safe: the scanner thread updates while the UI thread queries.
+    """
+
+    def __init__(self, capacity=512, ttl=10.0, clock=time.monotonic):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._clock = clock
+        self._records = OrderedDict()
+        self._expiry = []
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.evicted_count = 0
+        self.expired_count = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def update(self, address, name, rssi, now=None):
+        if now is None:
+            now = self._clock()
+        with self._lock:
+            record = self._records.get(address)
+            if record is not None:
+                record.rssi = rssi
+                record.last_seen = now
+                if name:
+                    record.name = name
+                self._records.move_to_end(address)
+                return
+
+            record = DeviceRecord(address, name, rssi, now)
+            self._records[address] = record
+            self._push(record)
+            if len(self._records) > self.capacity:
+                self._records.popitem(last=False)
+                self.evicted_count += 1
+                # Evicted records leave stale heap entries until their deadline;
+                # rebuild before a flood of new addresses can bloat the heap
+                if len(self._expiry) > 2 * self.capacity:
+                    self._rebuild_expiry()
+
+    def _push(self, record):
+        self._seq += 1
+        heapq.heappush(self._expiry, (record.last_seen + self.ttl, self._seq, record))
+
+    def _rebuild_expiry(self):
+        self._expiry = []
+        for record in self._records.values():
+            self._seq += 1
+            self._expiry.append((record.last_seen + self.ttl, self._seq, record))
+        heapq.heapify(self._expiry)
+
+    def expire(self, now=None):
+        """Drop records not seen within ttl; returns how many were dropped"""
+        if now is None:
+            now = self._clock()
+        dropped = 0
+        with self._lock:
+            expiry = self._expiry
+            records = self._records
+            while expiry and expiry[0][0] <= now:
+                _, _, record = heapq.heappop(expiry)
+                if records.get(record.address) is not record:
+                    continue
+                if record.last_seen + self.ttl <= now:
+                    del records[record.address]
+                    dropped += 1
+                else:
+                    self._push(record)
+            self.expired_count += dropped
+        return dropped
+
+    def get(self, address):
+        with self._lock:
+            record = self._records.get(address)
+            return record.copy() if record is not None else None
+
+    def top_k(self, k, now=None):
+        """Copies of the k live records with the strongest RSSI, strongest first"""
+        self.expire(now)
+        with self._lock:
+            strongest = heapq.nlargest(k, self._records.values(), key=lambda r: r.rssi)
+            return [record.copy() for record in strongest]
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._expiry = []
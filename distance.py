@@ -0,0 +1,257 @@
+"""Log-distance path-loss model: RSSI to estimated metres, and metre thresholds back to dBm
+
+    rssi = rssi_at_1m - 10 * exponent * log10(metres)
+
+rssi_at_1m is the advertised TX power level minus the free-space loss
+over the first metre when the advert carries one, and otherwise a
+per-device calibrated reference. Classification never computes a
+distance: lock and unlock distances are turned into dBm thresholds for a
+ProximityController, so the per-advert cost is the usual table lookup.
+
+Calibrate from a guided live sample or from a recorded trace:
+
+    python distance.py calibrate AA:BB:CC:DD:EE:FF --distances 0.5 1 2 --apply
+    python distance.py calibrate AA:BB:CC:DD:EE:FF --trace desk.trace --at 1 0 20 --at 3 30 50
+"""
+import argparse
+import asyncio
+import math
+import statistics
+import sys
+
+from controller import RSSI_MAX, RSSI_MIN
+
+DEFAULT_RSSI_AT_1M = -59.0
+DEFAULT_EXPONENT = 2.0
+
+# Free-space path loss over the first metre at 2.4 GHz
+TX_POWER_LOSS_1M = 41.0
+
+DISTANCE_KEYS = ("lock_distance", "unlock_distance", "rssi_at_1m", "path_loss_exponent")
+
+
+class PathLossModel:
+    """RSSI <-> metres for one reference level and path-loss exponent
+
+    Distances for every whole dBm are precomputed, so whole-dBm readings
+    are a list index and only smoothed (fractional) ones pay for pow().
+    """
+    __slots__ = ("rssi_at_1m", "exponent", "_table", "_np_table")
+
+    def __init__(self, rssi_at_1m=DEFAULT_RSSI_AT_1M, exponent=DEFAULT_EXPONENT):
+        if exponent <= 0:
+            raise ValueError(f"Path-loss exponent must be positive, got {exponent}")
+        self.rssi_at_1m = float(rssi_at_1m)
+        self.exponent = float(exponent)
+        self._table = [self._distance(value) for value in range(RSSI_MIN, RSSI_MAX + 1)]
+        self._np_table = None
+
+    def __repr__(self):
+        return f"PathLossModel(rssi_at_1m={self.rssi_at_1m:.1f}, exponent={self.exponent:.2f})"
+
+    def _distance(self, rssi):
+        return 10.0 ** ((self.rssi_at_1m - rssi) / (10.0 * self.exponent))
+
+    def distance(self, rssi):
+        """Estimated metres for one reading; None (no reading) is infinitely far"""
+        if rssi is None or rssi != rssi:
+            return math.inf
+        if rssi.__class__ is int and RSSI_MIN <= rssi <= RSSI_MAX:
+            return self._table[rssi - RSSI_MIN]
+        return self._distance(rssi)
+
+    def rssi_at(self, metres):
+        """The RSSI expected at metres"""
+        return self.rssi_at_1m - 10.0 * self.exponent * math.log10(metres)
+
+    def with_tx_power(self, tx_power):
+        """This model re-referenced to an advertised TX power level"""
+        return PathLossModel(tx_power - TX_POWER_LOSS_1M, self.exponent)
+
+    def thresholds(self, lock_distance, unlock_distance):
+        """(rssi_far, max_unlocking_rssi) equivalent to locking beyond lock_distance
+        and unlocking within unlock_distance"""
+        if not 0 < unlock_distance < lock_distance:
+            raise ValueError(f"Need 0 < unlock distance < lock distance, got {unlock_distance} and {lock_distance}")
+        return self.rssi_at(lock_distance), self.rssi_at(unlock_distance)
+
+    def distance_batch(self, rssi_values):
+        """Distances for many samples (e.g. a recorded trace)
+
+        With NumPy installed this takes any array-like (NaN meaning no
+        reading) and returns a float64 array; otherwise a list.
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            return [self.distance(value) for value in rssi_values]
+
+        if self._np_table is None:
+            self._np_table = np.asarray(self._table, dtype=np.float64)
+        values = np.asarray(rssi_values, dtype=np.float64)
+        whole = (values == np.floor(values)) & (values >= RSSI_MIN) & (values <= RSSI_MAX)
+        result = np.empty_like(values)
+        result[whole] = self._np_table[values[whole].astype(np.intp) - RSSI_MIN]
+        rest = ~whole
+        result[rest] = 10.0 ** ((self.rssi_at_1m - values[rest]) / (10.0 * self.exponent))
+        result[np.isnan(values)] = np.inf
+        return result
+
+
+def model_for(settings, defaults=None):
+    """PathLossModel from a target_devices entry, falling back to defaults (a ConfigSnapshot)"""
+    def pick(key, fallback):
+        if settings and settings.get(key) is not None:
+            return settings[key]
+        value = getattr(defaults, key, None)
+        return fallback if value is None else value
+
+    return PathLossModel(pick("rssi_at_1m", DEFAULT_RSSI_AT_1M), pick("path_loss_exponent", DEFAULT_EXPONENT))
+
+
+def fit(samples, exponent=None):
+    """Fit a PathLossModel to [(metres, rssi)] samples
+
+    Readings are reduced to a median per distance, which shrugs off the
+    multipath dips a short sample always has. With two or more distances
+    the exponent is fitted by least squares; with one (or when exponent
+    is given) only the 1 m reference is.
+    """
+    by_distance = {}
+    for metres, rssi in samples:
+        if metres <= 0:
+            raise ValueError(f"Calibration distances must be positive, got {metres}")
+        by_distance.setdefault(float(metres), []).append(rssi)
+    if not by_distance:
+        raise ValueError("No calibration samples")
+
+    points = [(-10.0 * math.log10(metres), statistics.median(values)) for metres, values in by_distance.items()]
+    if exponent is None and len(points) >= 2:
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        spread = sum((x - mean_x) ** 2 for x, _ in points)
+        exponent = sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+        if exponent <= 0:
+            raise ValueError("RSSI did not fall with distance; check the device was moved as prompted")
+        return PathLossModel(mean_y - exponent * mean_x, exponent)
+
+    exponent = exponent or DEFAULT_EXPONENT
+    return PathLossModel(statistics.mean(y - exponent * x for x, y in points), exponent)
+
+
+def trace_samples(path, address, spans):
+    """[(metres, rssi)] from a recorded trace, given (metres, start, end) spans in seconds from its start"""
+    from ble_trace import read_trace
+
+    samples = []
+    first = None
+    for device, advertisement_data in read_trace(path):
+        if first is None:
+            first = advertisement_data.timestamp
+        if device.address != address or advertisement_data.rssi is None:
+            continue
+        t = advertisement_data.timestamp - first
+        for metres, start, end in spans:
+            if start <= t < end:
+                samples.append((metres, advertisement_data.rssi))
+    return samples
+
+
+async def _sample_live(address, seconds):
+    """RSSI readings (and any TX power level) from address for seconds, through the shared scanner"""
+    from scanner_hub import HubScanner, ScanFilter
+
+    readings = []
+    tx_powers = []
+
+    def on_advert(device, advertisement_data):
+        if advertisement_data.rssi is not None:
+            readings.append(advertisement_data.rssi)
+        tx_power = getattr(advertisement_data, "tx_power", None)
+        if tx_power is not None:
+            tx_powers.append(tx_power)
+
+    scanner = HubScanner(on_advert, scan_filter=ScanFilter(addresses=[address]))
+    await scanner.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        await scanner.stop()
+    return readings, tx_powers
+
+
+def guided_samples(address, distances, seconds):
+    samples = []
+    tx_powers = []
+    for metres in distances:
+        input(f"Hold the device {metres:g} m from this Mac and press Enter, then keep still for {seconds:g}s...")
+        readings, powers = asyncio.run(_sample_live(address, seconds))
+        print(f"  {len(readings)} readings, median {statistics.median(readings) if readings else 'n/a'} dBm")
+        samples.extend((metres, rssi) for rssi in readings)
+        tx_powers.extend(powers)
+    return samples, tx_powers
+
+
+def apply_calibration(address, model):
+    """Store the fitted reference in the device's target_devices entry (or the global setting)"""
+    from config import get_config
+
+    config = get_config()
+    entries = list(config.target_devices or [])
+    for i, entry in enumerate(entries):
+        entry_address = entry if isinstance(entry, str) else entry.get("address")
+        if entry_address == address:
+            entry = {"address": entry} if isinstance(entry, str) else dict(entry)
+            entry["rssi_at_1m"] = round(model.rssi_at_1m, 1)
+            entry["path_loss_exponent"] = round(model.exponent, 2)
+            entries[i] = entry
+            config.target_devices = entries
+            return f"{address} in target_devices"
+    config.rssi_at_1m = round(model.rssi_at_1m, 1)
+    config.path_loss_exponent = round(model.exponent, 2)
+    return "the global rssi_at_1m and path_loss_exponent"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RSSI-to-distance calibration")
+    commands = parser.add_subparsers(dest="command", required=True)
+    calibrate = commands.add_parser("calibrate", help="fit the path-loss model for one device")
+    calibrate.add_argument("address")
+    calibrate.add_argument("--distances", type=float, nargs="+", default=(0.5, 1.0, 2.0),
+                           help="metres to sample at, live (default: 0.5 1 2)")
+    calibrate.add_argument("--seconds", type=float, default=10.0, help="sampling time per distance")
+    calibrate.add_argument("--trace", help="fit from a recorded trace instead of sampling live")
+    calibrate.add_argument("--at", type=float, nargs=3, action="append", metavar=("METRES", "START", "END"),
+                           help="with --trace: the device was METRES away from START to END seconds")
+    calibrate.add_argument("--exponent", type=float, help="fix the path-loss exponent instead of fitting it")
+    calibrate.add_argument("--apply", action="store_true", help="save the fit to the Proxi-Lock config")
+    args = parser.parse_args(argv)
+
+    tx_powers = []
+    if args.trace:
+        if not args.at:
+            parser.error("--trace needs at least one --at METRES START END")
+        samples = trace_samples(args.trace, args.address, args.at)
+    else:
+        samples, tx_powers = guided_samples(args.address, args.distances, args.seconds)
+
+    try:
+        model = fit(samples, args.exponent)
+    except ValueError as e:
+        print(f"Calibration failed: {e}")
+        return 1
+    print(f"{len(samples)} readings: RSSI at 1 m {model.rssi_at_1m:.1f} dBm, exponent {model.exponent:.2f}")
+    if tx_powers:
+        tx_power = statistics.median(tx_powers)
+        print(f"The device advertises a TX power of {tx_power} dBm; that reference "
+              f"({tx_power - TX_POWER_LOSS_1M:.1f} dBm at 1 m) is used instead of the fitted one")
+    for metres in (0.5, 1.0, 2.0, 3.0, 5.0):
+        print(f"  {metres:>4g} m  ~ {model.rssi_at(metres):6.1f} dBm")
+
+    if args.apply:
+        print(f"Saved to {apply_calibration(args.address, model)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Scan duty-cycling: when the monitor needs the radio and when it can rest"""
+import time
+
+from controller import FAR, NEAR
+
+POLICY_CONTINUOUS = "continuous"
+POLICY_ADAPTIVE = "adaptive"
+SCAN_POLICIES = (POLICY_CONTINUOUS, POLICY_ADAPTIVE)
+
+MODE_AGGRESSIVE = "aggressive"
+MODE_SPARSE = "sparse"
+
+# Slack on window edges so float rounding never leaves a sleep of zero seconds
+_EDGE = 1e-6
+
+
+class DutyCycleScheduler:
+    """Decides, from the proximity state, whether the scanner should be listening
+
+    The radio stays on (aggressive) while the state is unknown or MID, for
+    hold seconds after any state change or a wake, and whenever locking or
+    unlocking may be imminent. It drops to sparse windows -- listening
+    window seconds out of every period -- once the device has been NEAR
+    for settle seconds, or is FAR while the screen is script-locked.
+
+    Bounds come from the config: period is device_timeout, so the monitor
+    is never deaf for longer than a device takes to time out, and window
+    is at least scan_interval. All times are on clock (monotonic seconds),
+    which the simulation replaces with a virtual one.
+    """
+
+    def __init__(self, scan_interval, device_timeout, policy=POLICY_ADAPTIVE, clock=time.monotonic):
+        if policy not in SCAN_POLICIES:
+            raise ValueError(f"Unknown scan policy: {policy}")
+        self.clock = clock
+        self.policy = policy
+        self.state = None
+        self.script_locked = False
+        now = clock()
+        self._state_since = now
+        self._locked_since = now
+        self._aggressive_until = now
+        self.set_bounds(scan_interval, device_timeout)
+
+    def set_bounds(self, scan_interval, device_timeout):
+        self.period = max(device_timeout, scan_interval)
+        self.window = max(scan_interval, min(5 * scan_interval, self.period / 2))
+        self.hold = self.period
+        self.settle = 2 * self.period
+
+    def observe(self, state, now=None):
+        """Record the latest proximity state (FAR, MID, NEAR or None)"""
+        if state == self.state:
+            return
+        now = self.clock() if now is None else now
+        self.state = state
+        self._state_since = now
+        self._aggressive_until = max(self._aggressive_until, now + self.hold)
+
+    def note_wake(self, now=None):
+        now = self.clock() if now is None else now
+        self._aggressive_until = max(self._aggressive_until, now + self.hold)
+
+    def set_script_locked(self, locked, now=None):
+        if locked == self.script_locked:
+            return
+        self.script_locked = locked
+        self._locked_since = self.clock() if now is None else now
+
+    def _sparse_since(self):
+        """When sparse scanning starts for the current state, or None if it never does"""
+        if self.policy != POLICY_ADAPTIVE:
+            return None
+        if self.state == NEAR:
+            return max(self._aggressive_until, self._state_since + self.settle)
+        if self.state == FAR and self.script_locked:
+            return max(self._aggressive_until, self._state_since, self._locked_since)
+        return None
+
+    def mode(self, now=None):
+        now = self.clock() if now is None else now
+        since = self._sparse_since()
+        return MODE_SPARSE if since is not None and now >= since else MODE_AGGRESSIVE
+
+    def radio_on(self, now=None):
+        now = self.clock() if now is None else now
+        since = self._sparse_since()
+        if since is None or now < since:
+            return True
+        # Each sparse period rests first, then listens for the last window seconds
+        return (now - since) % self.period >= self.period - self.window - _EDGE
+
+    def next_change(self, now=None):
+        """Seconds until radio_on() may flip, or None if only a new state can flip it"""
+        now = self.clock() if now is None else now
+        since = self._sparse_since()
+        if since is None:
+            return None
+        if now < since:
+            return since - now
+        position = (now - since) % self.period
+        rest = self.period - self.window
+        return rest - position if position < rest - _EDGE else self.period - position
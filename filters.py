@@ -0,0 +1,154 @@
+"""RSSI smoothing filters applied per device ahead of proximity classification"""
+from bisect import bisect_left, insort
+
+FILTER_NONE = "none"
+FILTER_EWMA = "ewma"
+FILTER_MEDIAN = "median"
+FILTER_KALMAN = "kalman"
+
+FILTER_KINDS = (FILTER_NONE, FILTER_EWMA, FILTER_MEDIAN, FILTER_KALMAN)
+
+
+class PassthroughFilter:
+    """Returns raw RSSI unchanged (the historical behaviour)"""
+    __slots__ = ()
+
+    def update(self, rssi):
+        return rssi
+
+    def reset(self):
+        pass
+
+
+class EwmaFilter:
+    """Exponentially weighted moving average; alpha is the weight of the newest sample"""
+    __slots__ = ("alpha", "value")
+
+    def __init__(self, alpha=0.3):
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError("alpha must be in (0, 1]")
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, rssi):
+        if self.value is None:
+            self.value = float(rssi)
+        else:
+            self.value += self.alpha * (rssi - self.value)
+        return self.value
+
+    def reset(self):
+        self.value = None
+
+
+class MedianFilter:
+    """Sliding-window median over a fixed-size ring buffer
+
+    Each sample costs one bisect removal and one insort into a sorted
+    list of at most `window` items: O(log window) comparisons but
+    O(window) element moves, which for the few-sample windows used here
+    is a short memmove.
+    """
+    __slots__ = ("window", "_ring", "_sorted", "_index")
+
+    def __init__(self, window=5):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.window = int(window)
+        self._ring = []
+        self._sorted = []
+        self._index = 0
+
+    def update(self, rssi):
+        ring = self._ring
+        ordered = self._sorted
+
+        if len(ring) < self.window:
+            ring.append(rssi)
+        else:
+            oldest = ring[self._index]
+            ring[self._index] = rssi
+            self._index = (self._index + 1) % self.window
+            del ordered[bisect_left(ordered, oldest)]
+        insort(ordered, rssi)
+
+        n = len(ordered)
+        mid = n // 2
+        if n % 2:
+            return ordered[mid]
+        return (ordered[mid - 1] + ordered[mid]) / 2
+
+    def reset(self):
+        self._ring = []
+        self._sorted = []
+        self._index = 0
+
+
+class KalmanFilter:
+    """One-dimensional Kalman filter with a constant-level model
+
+    process_noise is how much the true RSSI may drift between samples and
+    measurement_noise is the variance of a single reading, both in dBm^2.
+    """
+    __slots__ = ("process_noise", "measurement_noise", "estimate", "error")
+
+    def __init__(self, process_noise=1.0, measurement_noise=16.0):
+        if process_noise <= 0 or measurement_noise <= 0:
+            raise ValueError("noise parameters must be positive")
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.estimate = None
+        self.error = measurement_noise
+
+    def update(self, rssi):
+        if self.estimate is None:
+            self.estimate = float(rssi)
+            self.error = self.measurement_noise
+            return self.estimate
+
+        error = self.error + self.process_noise
+        gain = error / (error + self.measurement_noise)
+        self.estimate += gain * (rssi - self.estimate)
+        self.error = (1.0 - gain) * error
+        return self.estimate
+
+    def reset(self):
+        self.estimate = None
+        self.error = self.measurement_noise
+
+
+def create_filter(kind, alpha=0.3, window=5, process_noise=1.0, measurement_noise=16.0):
+    if kind == FILTER_EWMA:
+        return EwmaFilter(alpha)
+    if kind == FILTER_MEDIAN:
+        return MedianFilter(window)
+    if kind == FILTER_KALMAN:
+        return KalmanFilter(process_noise, measurement_noise)
+    if kind in (None, FILTER_NONE):
+        return PassthroughFilter()
+    raise ValueError(f"Unknown RSSI filter: {kind}")
+
+
+def filter_factory_from_config(config):
+    """Return a zero-argument callable building the filter selected in ProxiLockConfig
+
+    Falls back to raw RSSI when the kind is unknown or its parameters are
+    out of range.
+    """
+    kind = config.rssi_filter
+    if kind not in FILTER_KINDS:
+        print(f"Unknown RSSI filter '{kind}', using raw RSSI")
+        kind = FILTER_NONE
+
+    alpha = config.rssi_filter_alpha
+    window = config.rssi_filter_window
+    process_noise = config.rssi_filter_process_noise
+    measurement_noise = config.rssi_filter_measurement_noise
+    # Filters are built lazily per device, so try one now: a bad value from
+    # the menu or a hand-edited config file must not fail later on the monitor loop
+    try:
+        create_filter(kind, alpha, window, process_noise, measurement_noise)
+    except (ValueError, TypeError) as e:
+        print(f"Invalid settings for RSSI filter '{kind}' ({e}), using raw RSSI")
+        kind = FILTER_NONE
+    return lambda: create_filter(kind, alpha, window, process_noise, measurement_noise)
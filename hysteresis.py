@@ -0,0 +1,80 @@
+"""Time-based debouncing of the group proximity state"""
+from controller import FAR, MID, NEAR
+
+HYSTERESIS_COUNT = "count"
+HYSTERESIS_TIME = "time"
+
+HYSTERESIS_MODES = (HYSTERESIS_COUNT, HYSTERESIS_TIME)
+
+
+class TimedHysteresis:
+    """FAR locks once it has held far_hold seconds, NEAR unlocks once it has held near_hold
+
+    update() takes the raw group state of each target advert with its
+    monotonic timestamp and returns the state to act on. FAR is passed
+    through at once so the FAR branch can trace and predict, and
+    held_count counts the FAR adverts since the hold was reached: it is 1
+    on the advert that crosses far_hold, which is where a lock is
+    submitted, just as consecutive_far_count reaching the required count
+    is in count mode. A NEAR run younger than near_hold is reported as
+    MID. seconds is how long the current raw state has held. Any change
+    of raw state restarts the clock, so the work per advert is a
+    subtraction and a comparison whatever the advert rate.
+
+    The price is latency for fast advertisers. Five FAR adverts from a
+    device advertising every 20-100 ms take well under far_hold, so time
+    mode locks later than counting. That is why counting stays the
+    default; bench_hysteresis.py shows the crossover.
+    """
+    __slots__ = ("far_hold", "near_hold", "state", "since", "seconds", "held_count")
+
+    def __init__(self, far_hold, near_hold):
+        if far_hold < 0 or near_hold < 0:
+            raise ValueError("Hold times must not be negative")
+        self.far_hold = far_hold
+        self.near_hold = near_hold
+        self.reset()
+
+    def reset(self):
+        """Forget the current run; the next advert starts a new one"""
+        self.state = None
+        self.since = 0.0
+        self.seconds = 0.0
+        self.held_count = 0
+
+    def restart_far(self):
+        """Time a FAR run afresh (after a lock or a wake), leaving a NEAR run alone"""
+        if self.state == FAR:
+            self.reset()
+
+    def backdate(self, state, since):
+        """Start a run of state at since unless one is going (a silence is FAR from the last advert)"""
+        if state != self.state:
+            self.state = state
+            self.since = since
+            self.held_count = 0
+
+    def update(self, state, now):
+        if state != self.state:
+            self.state = state
+            self.since = now
+            self.held_count = 0
+        held = self.seconds = now - self.since
+        if state == FAR:
+            if held >= self.far_hold:
+                self.held_count += 1
+            return FAR
+        if state == NEAR and held < self.near_hold:
+            return MID
+        return state
+
+
+def hysteresis_from_config(config):
+    """TimedHysteresis from device_timeout and state_debounce_time, or None in count mode"""
+    mode = config.hysteresis_mode
+    if mode not in HYSTERESIS_MODES:
+        print(f"Unknown hysteresis mode '{mode}', counting FAR adverts")
+        mode = HYSTERESIS_COUNT
+    if mode == HYSTERESIS_COUNT:
+        return None
+    return TimedHysteresis(config.device_timeout, config.state_debounce_time)
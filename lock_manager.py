@@ -1,50 +1,81 @@
 """Screen lock/unlock system interactions"""
 import subprocess
-import getpass
 import time
-from config import KEYCHAIN_ITEM, get_config
+from config import get_config
+from lock_state import get_lock_state_service
+from metrics import time_spawn
+from script_executor import run_applescript
+from secret_provider import KeychainSecretBackend, get_secret_provider
+from tracing import get_tracer
 
-def is_screen_locked():
-    try:
-        result = subprocess.run(
-            '/usr/libexec/PlistBuddy -c "print :IOConsoleUsers:0:CGSSessionScreenIsLocked" /dev/stdin <<< "$(ioreg -n Root -d1 -a)"',
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=2
-        )
+_tracer = get_tracer()
+
+# Shared with async_lock_manager so both APIs send macOS the same scripts
+SCREEN_SAVER_SCRIPT = 'tell application "ScreenSaverEngine" to activate'
+LOCK_SHORTCUT_SCRIPT = 'tell application "System Events" to keystroke "q" using {command down, control down}'
+FN_KEY_SCRIPT = 'tell application "System Events" to key code 63'
+LOCK_SCREEN_ACTIVE_SCRIPT = '''
+tell application "System Events"
+    try
+        set frontApp to name of first application process whose frontmost is true
         
-        if result.returncode == 0:
-            return result.stdout.strip().lower() == "true"
+        if frontApp is "loginwindow" or frontApp is "ScreenSaverEngine" then
+            return true
+        end if
         
-        if "Does Not Exist" in result.stderr:
-            return False
+        if frontApp is not "WindowServer" then
+            return false
+        end if
         
-        return False
+        return true
+    on error
+        return false
+    end try
+end tell
+'''
 
-    except (subprocess.SubprocessError, subprocess.TimeoutExpired, FileNotFoundError):
-        return False
+def unlock_script(password):
+    """Script typing password into the login window: 15 backspaces, the password and return"""
+    escaped_password = password.replace('\\', '\\\\').replace('"', '\\"')
+    return f'''
+    tell application "System Events"
+        delay 0.8
+        repeat 15 times
+            key code 51
+        end repeat
+        delay 0.2
+        keystroke "{escaped_password}"
+        delay 0.2
+        key code 36
+    end tell
+    '''
+
+def is_screen_locked(max_age=None):
+    """Screen lock state from the shared LockStateService cache
+
+    Pass max_age=0 to force a fresh probe.
+    """
+    with _tracer.span("is_screen_locked", max_age=max_age) as span:
+        locked = get_lock_state_service().is_locked(max_age)
+        span.set(locked=locked)
+    return locked
 
 def lock_mac_screen():
     config = get_config()
     
     if config.use_screen_saver_lock:
         try:
-            subprocess.run([
-                "osascript",
-                "-e",
-                'tell application "ScreenSaverEngine" to activate'
-            ], check=True, capture_output=True, timeout=1)
+            with _tracer.span("screensaver_activate"):
+                run_applescript(SCREEN_SAVER_SCRIPT, timeout=1)
+            get_lock_state_service().expect_change()
             return True
         except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
             pass
     
     try:
-        result = subprocess.run([
-            "osascript",
-            "-e",
-            'tell application "System Events" to keystroke "q" using {command down, control down}'
-        ], check=True, capture_output=True, timeout=2)
+        with _tracer.span("lock_shortcut"):
+            run_applescript(LOCK_SHORTCUT_SCRIPT, timeout=2)
+        get_lock_state_service().expect_change()
         return True
     except subprocess.CalledProcessError as e:
         if "not allowed" in str(e.stderr, 'utf-8', errors='ignore'):
@@ -54,11 +85,9 @@ def lock_mac_screen():
     
     if not config.use_screen_saver_lock:
         try:
-            subprocess.run([
-                "osascript",
-                "-e",
-                'tell application "ScreenSaverEngine" to activate'
-            ], check=True, capture_output=True, timeout=1)
+            with _tracer.span("screensaver_activate"):
+                run_applescript(SCREEN_SAVER_SCRIPT, timeout=1)
+            get_lock_state_service().expect_change()
             return True
         except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
             pass
@@ -66,79 +95,53 @@ def lock_mac_screen():
     return False
 
 def get_password_from_keychain():
-    try:
-        result = subprocess.run([
-            "security",
-            "find-generic-password",
-            "-w",
-            "-a", getpass.getuser(),
-            "-s", KEYCHAIN_ITEM
-        ], check=True, capture_output=True, timeout=2)
-        password = result.stdout.decode('utf-8').strip()
-        return password
-    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+    secret = KeychainSecretBackend().fetch()
+    if secret is None:
         return None
+    password = secret.decode('utf-8')
+    for i in range(len(secret)):
+        secret[i] = 0
+    return password
 
 def is_lock_screen_active():
     try:
         if not is_screen_locked():
             return False
         
-        script = '''
-        tell application "System Events"
-            try
-                set frontApp to name of first application process whose frontmost is true
-                
-                if frontApp is "loginwindow" or frontApp is "ScreenSaverEngine" then
-                    return true
-                end if
-                
-                if frontApp is not "WindowServer" then
-                    return false
-                end if
-                
-                return true
-            on error
-                return false
-            end try
-        end tell
-        '''
+        output = run_applescript(LOCK_SCREEN_ACTIVE_SCRIPT, timeout=2)
         
-        result = subprocess.run([
-            "osascript",
-            "-e",
-            script
-        ], check=True, capture_output=True, timeout=2, text=True)
-        
-        return "true" in result.stdout.strip().lower()
+        return "true" in output.lower()
     except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
         return is_screen_locked()
 
 def wake_display():
+    with _tracer.span("wake_display"):
+        _wake_display()
+
+def _wake_display():
     try:
-        subprocess.run([
-            "caffeinate",
-            "-u",
-            "-t",
-            "2"
-        ], check=True, capture_output=True, timeout=3)
+        with time_spawn("caffeinate"), _tracer.span("caffeinate"):
+            subprocess.run([
+                "caffeinate",
+                "-u",
+                "-t",
+                "2"
+            ], check=True, capture_output=True, timeout=3)
     except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
         pass
     
     try:
-        subprocess.run([
-            "pmset",
-            "wake"
-        ], check=True, capture_output=True, timeout=2)
+        with time_spawn("pmset"), _tracer.span("pmset"):
+            subprocess.run([
+                "pmset",
+                "wake"
+            ], check=True, capture_output=True, timeout=2)
     except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
         pass
     
     try:
-        subprocess.run([
-            "osascript",
-            "-e",
-            'tell application "System Events" to key code 63'
-        ], check=True, capture_output=True, timeout=2)
+        with _tracer.span("fn_key"):
+            run_applescript(FN_KEY_SCRIPT, timeout=2)
     except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
         pass
 
@@ -148,48 +151,33 @@ def unlock_mac_screen():
     wake_display()
     
     # verify screen is locked (after waking)
-    if not is_screen_locked():
+    if not is_screen_locked(max_age=0):
         if not screen_was_locked:
             return False
-        time.sleep(1.0)
-        if not is_screen_locked():
+        with _tracer.span("settle_wait"):
+            time.sleep(1.0)
+        if not is_screen_locked(max_age=0):
             return False
     
-    if not is_screen_locked():
-        return False
-    
-    lock_screen_verified = is_lock_screen_active()
+    with _tracer.span("is_lock_screen_active") as span:
+        lock_screen_verified = is_lock_screen_active()
+        span.set(active=lock_screen_verified)
     if not lock_screen_verified:
         if not is_screen_locked():
             return False
     
-    password = get_password_from_keychain()
+    with _tracer.span("keychain") as span:
+        provider = get_secret_provider()
+        span.set(cached=provider.is_cached())
+        password = provider.take()
     if not password:
         return False
     
     try:
-        
-        escaped_password = password.replace('\\', '\\\\').replace('"', '\\"')
-        
-        script = f'''
-        tell application "System Events"
-            delay 0.8
-            repeat 15 times
-                key code 51
-            end repeat
-            delay 0.2
-            keystroke "{escaped_password}"
-            delay 0.2
-            key code 36
-        end tell
-        '''
-        
-        subprocess.run([
-            "osascript",
-            "-e",
-            script
-        ], check=True, capture_output=True, timeout=5)
+        with _tracer.span("type_password"):
+            run_applescript(unlock_script(password), timeout=5)
 
+        get_lock_state_service().expect_change()
         return True
     except subprocess.CalledProcessError as e:
         error_msg = str(e.stderr, 'utf-8', errors='ignore') if e.stderr else str(e)
@@ -3,6 +3,7 @@ import time
 from enum import Enum
 from lock_manager import is_screen_locked
 from sleep_watcher import get_time_since_wake
+from secret_provider import get_secret_provider
 
 class LockOwner(Enum):
     SCRIPT = "script"
@@ -20,6 +21,8 @@ def mark_script_lock():
     
     lock_owner = LockOwner.SCRIPT
     script_lock_time = time.time()
+    # Have the password ready before the user comes back
+    get_secret_provider().prefetch()
 
 def update_lock_state():
     global lock_owner, last_unlocked_time, last_lock_state
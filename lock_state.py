@@ -0,0 +1,310 @@
+"""Cached screen-lock state fed by notifications or adaptive polling"""
+import subprocess
+import threading
+import time
+
+from metrics import time_spawn
+
+try:
+    from Foundation import NSDistributedNotificationCenter, NSObject
+except ImportError:
+    # Not on macOS; NotificationLockStateBackend cannot subscribe
+    NSDistributedNotificationCenter = None
+else:
+    # Defined once: PyObjC refuses to register an Objective-C class name twice,
+    # so a subclass built per subscribe() would break restarting the service
+    class _ScreenLockObserver(NSObject):
+        def initWithCallback_(self, callback):
+            self = self.init()
+            if self is not None:
+                self.callback = callback
+            return self
+
+        def screenLocked_(self, notification):
+            self.callback(True)
+
+        def screenUnlocked_(self, notification):
+            self.callback(False)
+
+# sh + ioreg + PlistBuddy
+IOREG_PROBE_SPAWNS = 3
+
+
+def probe_screen_locked():
+    """Ask ioreg directly whether the console session is locked (spawns processes)"""
+    try:
+        with time_spawn("ioreg"):
+            result = subprocess.run(
+                '/usr/libexec/PlistBuddy -c "print :IOConsoleUsers:0:CGSSessionScreenIsLocked" /dev/stdin <<< "$(ioreg -n Root -d1 -a)"',
+                shell=True,
+                capture_output=True,
+                text=True,
+                timeout=2
+            )
+
+        if result.returncode == 0:
+            return result.stdout.strip().lower() == "true"
+
+        if "Does Not Exist" in result.stderr:
+            return False
+
+        return False
+
+    except (subprocess.SubprocessError, subprocess.TimeoutExpired, FileNotFoundError):
+        return False
+
+
+class IoregLockStateBackend:
+    """Polling-only backend built on the ioreg probe"""
+    spawns_per_probe = IOREG_PROBE_SPAWNS
+    pushes_notifications = False
+
+    def probe(self):
+        return probe_screen_locked()
+
+    def subscribe(self, callback):
+        pass
+
+    def unsubscribe(self):
+        pass
+
+
+class NotificationLockStateBackend(IoregLockStateBackend):
+    """ioreg probe plus com.apple.screenIsLocked/Unlocked distributed notifications
+
+    Must be subscribed from a thread with a running Cocoa run loop (the
+    menu bar app's main thread).
+    """
+    pushes_notifications = True
+
+    def __init__(self):
+        self._observer = None
+
+    def subscribe(self, callback):
+        center = NSDistributedNotificationCenter.defaultCenter()
+        self._observer = _ScreenLockObserver.alloc().initWithCallback_(callback)
+        center.addObserver_selector_name_object_(
+            self._observer, "screenLocked:", "com.apple.screenIsLocked", None
+        )
+        center.addObserver_selector_name_object_(
+            self._observer, "screenUnlocked:", "com.apple.screenIsUnlocked", None
+        )
+
+    def unsubscribe(self):
+        if self._observer is None:
+            return
+        NSDistributedNotificationCenter.defaultCenter().removeObserver_(self._observer)
+        self._observer = None
+
+
+class FakeLockStateBackend:
+    """In-memory backend for Linux and benchmarks; set_locked() simulates a lock change"""
+    spawns_per_probe = IOREG_PROBE_SPAWNS
+
+    def __init__(self, locked=False, pushes_notifications=False):
+        self.locked = locked
+        self.pushes_notifications = pushes_notifications
+        self.probe_count = 0
+        self._callback = None
+
+    def probe(self):
+        self.probe_count += 1
+        return self.locked
+
+    def subscribe(self, callback):
+        self._callback = callback
+
+    def unsubscribe(self):
+        self._callback = None
+
+    def set_locked(self, locked):
+        self.locked = locked
+        if self.pushes_notifications and self._callback:
+            self._callback(locked)
+
+
+class LockStateService:
+    """Single source of truth for whether the screen is locked
+
+    Reads are served from a cache that notifications keep current; with
+    notifications the cache is only re-probed every notification_interval
+    as a safety net. Without them a poller re-probes on an interval that
+    starts at min_interval and doubles up to max_interval while nothing
+    changes, and a cached value older than ttl is re-probed on read.
+    """
+
+    def __init__(self, backend, ttl=5.0, min_interval=0.5, max_interval=5.0,
+                 notification_interval=30.0, clock=time.monotonic):
+        self.backend = backend
+        self.ttl = ttl
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.notification_interval = notification_interval
+        self._clock = clock
+
+        self._locked = None
+        self._checked_at = float("-inf")
+        self._interval = min_interval
+        self._listeners = []
+        self._mutex = threading.Lock()
+        self._thread = None
+        self._subscribed = False
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+
+        self.probe_count = 0
+        self.notification_count = 0
+        self._counting_since = clock()
+
+    def is_locked(self, max_age=None):
+        """Cached lock state, probing only when older than max_age"""
+        locked = self.cached_state(max_age)
+        if locked is None:
+            return self.refresh()
+        return locked
+
+    def refresh(self):
+        """Probe the backend now and update the cache"""
+        locked = self.backend.probe()
+        self.record_probe(locked)
+        return locked
+
+    def record_probe(self, locked):
+        """Feed in the result of a probe made elsewhere (e.g. the async lock API)"""
+        self.probe_count += 1
+        self._update(locked)
+
+    def cached_state(self, max_age=None):
+        """The cached state if fresher than max_age, otherwise None (never probes)"""
+        if max_age is None:
+            max_age = self.notification_interval if self._subscribed else self.ttl
+        locked = self._locked
+        if locked is None or self._clock() - self._checked_at > max_age:
+            return None
+        return locked
+
+    def expect_change(self):
+        """Call after locking/unlocking so the next read and poll probe promptly"""
+        with self._mutex:
+            self._checked_at = float("-inf")
+            self._interval = self.min_interval
+        self._wakeup.set()
+
+    def add_listener(self, callback):
+        """callback(locked) runs whenever the cached state flips"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        try:
+            self._listeners.remove(callback)
+        except ValueError:
+            pass
+
+    def _on_notification(self, locked):
+        self.notification_count += 1
+        self._update(locked)
+
+    def _update(self, locked):
+        with self._mutex:
+            changed = self._locked is not None and locked != self._locked
+            self._locked = locked
+            self._checked_at = self._clock()
+            if changed:
+                self._interval = self.min_interval
+        if changed:
+            for callback in list(self._listeners):
+                try:
+                    callback(locked)
+                except Exception as e:
+                    print(f"Lock state listener error: {e}")
+
+    def poll(self):
+        """Run one polling step and return the seconds until the next one"""
+        if self._subscribed:
+            # Notifications keep the cache current; probe only as a safety net
+            age = self._clock() - self._checked_at
+            if age >= self.notification_interval:
+                self.refresh()
+                return self.notification_interval
+            return self.notification_interval - age
+
+        previous = self._locked
+        locked = self.refresh()
+        with self._mutex:
+            if locked == previous:
+                self._interval = min(self._interval * 2, self.max_interval)
+            return self._interval
+
+    def subscribe(self):
+        """Start receiving backend notifications, if it has any"""
+        if self.backend.pushes_notifications and not self._subscribed:
+            self.backend.subscribe(self._on_notification)
+            self._subscribed = True
+
+    def unsubscribe(self):
+        if self._subscribed:
+            self.backend.unsubscribe()
+            self._subscribed = False
+
+    def start(self):
+        """Subscribe to notifications and run the poller thread"""
+        if self._thread is not None:
+            return
+        self.subscribe()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._wakeup.set()
+        self._thread.join(timeout=2.0)
+        self._thread = None
+        self.unsubscribe()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                delay = self.poll()
+            except Exception as e:
+                print(f"Lock state poll error: {e}")
+                delay = self.max_interval
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+    def spawns_per_minute(self):
+        minutes = (self._clock() - self._counting_since) / 60.0
+        if minutes <= 0:
+            return 0.0
+        return self.probe_count * getattr(self.backend, "spawns_per_probe", 0) / minutes
+
+    def reset_counters(self):
+        self.probe_count = 0
+        self.notification_count = 0
+        self._counting_since = self._clock()
+
+
+def _default_backend():
+    if NSDistributedNotificationCenter is None:
+        return IoregLockStateBackend()
+    return NotificationLockStateBackend()
+
+
+_service = None
+
+
+def get_lock_state_service():
+    global _service
+    if _service is None:
+        _service = LockStateService(_default_backend())
+    return _service
+
+
+def set_lock_state_service(service):
+    """Swap the process-wide service (e.g. for a FakeLockStateBackend on Linux)"""
+    global _service
+    if _service is not None and _service is not service:
+        _service.stop()
+    _service = service
@@ -1,10 +1,21 @@
 """Main entry point - orchestrates BLE scanning, proximity detection, and lock management"""
 import asyncio
+import concurrent.futures
 import threading
+import time
 from datetime import datetime
-from config import CONSECUTIVE_FAR_REQUIRED, SCAN_INTERVAL, get_config
+from config import get_config, get_config_watcher
 from scanner import ProximityScanner
+from ble_trace import TraceRecorder
+import async_lock_manager
 from lock_manager import lock_mac_screen, unlock_mac_screen, is_screen_locked
+from lock_state import get_lock_state_service
+from action_executor import ActionExecutor, LOCK, UNLOCK
+from scanner_hub import get_scanner_hub, scanner_restarts
+from metrics import get_metrics, start_exporters, stop_exporters
+from ring_log import configure_logging, get_logger
+from tracing import configure_tracing, get_tracer, now as trace_now
+from duty_cycle import DutyCycleScheduler, POLICY_CONTINUOUS, SCAN_POLICIES
 from lock_security import (
     LockOwner, 
     mark_script_lock, 
@@ -14,62 +25,202 @@ from lock_security import (
 )
 from sleep_watcher import setup_sleep_watcher, set_wake_callback, get_time_since_wake
 
+# The done callbacks run on the executor thread; the FAR counters and lock
+# ownership they change belong to the monitor loop, so they hand over to it
+
+def _on_lock_done(locked):
+    if locked:
+        _monitor_instance.call_soon(_after_lock)
+    elif locked is False:
+        print("Lock attempt failed")
+
+def _after_lock():
+    mark_script_lock()
+    if _monitor_instance.scanner_instance:
+        _monitor_instance.scanner_instance.reset_consecutive_far_count()
+    _monitor_instance.notify("lock")
+
+def _on_unlock_done(unlocked):
+    # A failed attempt still clears ownership so a bad password is never retried
+    if unlocked is not None:
+        _monitor_instance.call_soon(_after_unlock)
+
+def _after_unlock():
+    reset_lock_owner()
+    _monitor_instance.notify("lock")
+
+_log = get_logger()
+_tracer = get_tracer()
+
+# Longest an action may run on the monitor loop before the executor gives up on it
+ACTION_TIMEOUT = 30.0
+
+def _on_monitor_loop(async_action, blocking_action):
+    """Run an async_lock_manager action on the monitor's loop and wait for it here
+
+    Called on the executor thread: the action's subprocesses overlap on
+    the loop without holding up BLE callbacks. With no loop running (the
+    monitor stopped, or a benchmark) the blocking lock_manager version
+    runs on this thread instead.
+    """
+    loop = _monitor_instance.loop
+    if loop is None or not loop.is_running():
+        return blocking_action()
+    # The decision is current on this thread only; hand it to the coroutine
+    future = asyncio.run_coroutine_threadsafe(async_action(decision=_tracer.current()), loop)
+    try:
+        return future.result(ACTION_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        return False
+
+_action_executor = ActionExecutor({
+    LOCK: lambda: _on_monitor_loop(async_lock_manager.lock_mac_screen, lock_mac_screen),
+    UNLOCK: lambda: _on_monitor_loop(async_lock_manager.unlock_mac_screen, unlock_mac_screen),
+})
+
+def _trace_decision(kind):
+    """Close the FAR window span for a lock and start the arrow to the executor"""
+    decision = _tracer.current()
+    if decision is None:
+        return
+    scanner = _monitor_instance.scanner_instance
+    if kind == LOCK and scanner is not None:
+        _tracer.complete(
+            "consecutive_far_window", scanner.far_started, trace_now(), decision,
+            adverts=scanner.consecutive_far_count
+        )
+    _tracer.flow_start(decision)
+
+def _lock_early(rssi):
+    """The trend says the user is leaving: lock without waiting out the FAR count"""
+    if _action_executor.is_busy(LOCK) or is_screen_locked():
+        return
+    _log.info("Departing | RSSI: {} | Locking ahead of the FAR count", rssi)
+    if _tracer.enabled:
+        _trace_decision(LOCK)
+    _action_executor.submit(LOCK, _on_lock_done)
+
+def _departing():
+    scanner = _monitor_instance.scanner_instance
+    return scanner is not None and scanner.group.departing
+
+def _hysteresis():
+    scanner = _monitor_instance.scanner_instance
+    return scanner.hysteresis if scanner is not None else None
+
 def proximity_callback(proximity, rssi, consecutive_far_count):
     global last_proximity
     
     if proximity == "FAR":
-        print(f"FAR | RSSI: {rssi} | Consecutive: {consecutive_far_count}/{CONSECUTIVE_FAR_REQUIRED}")
+        hysteresis = _hysteresis()
+        if hysteresis is None:
+            count, required = consecutive_far_count, get_config().snapshot.consecutive_far_required
+            _log.debug("FAR | RSSI: {} | Consecutive: {}/{}", rssi, count, required)
+        else:
+            # Time mode: held_count reaches 1 on the advert where FAR has held long enough
+            count, required = hysteresis.held_count, 1
+            _log.debug("FAR | RSSI: {} | Held: {:.2f}/{}s", rssi, hysteresis.seconds, hysteresis.far_hold)
         
-        if consecutive_far_count >= CONSECUTIVE_FAR_REQUIRED:
+        if count >= required:
             if not is_screen_locked():
-                if consecutive_far_count == CONSECUTIVE_FAR_REQUIRED:
-                    print(f"Attempting to lock screen (threshold reached: {consecutive_far_count}/{CONSECUTIVE_FAR_REQUIRED})")
-                    if lock_mac_screen():
-                        mark_script_lock()
-                        if _monitor_instance.scanner_instance:
-                            _monitor_instance.scanner_instance.reset_consecutive_far_count()
+                if count == required:
+                    if hysteresis is None:
+                        _log.info("Attempting to lock screen (threshold reached: {}/{})", count, required)
                     else:
-                        print("Lock attempt failed")
-                elif consecutive_far_count > CONSECUTIVE_FAR_REQUIRED:
-                    print(f"Threshold exceeded but screen not locked (count: {consecutive_far_count}, screen locked: {is_screen_locked()})")
+                        _log.info("Attempting to lock screen (FAR held {:.2f}s)", hysteresis.seconds)
+                    if _tracer.enabled:
+                        _trace_decision(LOCK)
+                    _action_executor.submit(LOCK, _on_lock_done)
+                elif count > required and not _action_executor.is_busy(LOCK):
+                    _log.info("Threshold exceeded but screen not locked (count: {}, screen locked: {})", count, is_screen_locked())
             else:
                 if _monitor_instance.scanner_instance:
                     _monitor_instance.scanner_instance.reset_consecutive_far_count()
+        elif _departing():
+            _lock_early(rssi)
     elif proximity == "MID":
-        print(f"MID | RSSI: {rssi} | Counter reset to 0")
+        _log.debug("MID | RSSI: {} | Counter reset to 0", rssi)
         if _monitor_instance.scanner_instance:
             _monitor_instance.scanner_instance.reset_consecutive_far_count()
+        if _departing():
+            _lock_early(rssi)
         
     else:
         if proximity == "NEAR":
-            print(f"NEAR | RSSI: {rssi} | Counter reset to 0")
+            _log.debug("NEAR | RSSI: {} | Counter reset to 0", rssi)
             
-            config = get_config()
-            if config.lock_only_mode:
-                print("Lock-only mode enabled — skipping unlock")
+            if get_config().snapshot.lock_only_mode:
+                _log.info("Lock-only mode enabled — skipping unlock")
+        # Auto-unlock is not enabled: NEAR never reaches the unlock below
         return
             
         if last_proximity != "NEAR":
             lock_owner = get_lock_owner()
             if lock_owner == LockOwner.SCRIPT:
-                print(f"Unlocking (script-owned lock)")
-                unlock_mac_screen()
-                reset_lock_owner()
+                _log.info("Unlocking (script-owned lock)")
+                if _tracer.enabled:
+                    _trace_decision(UNLOCK)
+                _action_executor.submit(UNLOCK, _on_unlock_done)
             elif lock_owner == LockOwner.USER:
-                print("Locked by user — unlock blocked")
+                _log.info("Locked by user — unlock blocked")
             else:
-                print("Screen already unlocked (skipping unlock)")
+                _log.info("Screen already unlocked (skipping unlock)")
     
     last_proximity = proximity
 
 last_proximity = None
 
+_metrics = get_metrics()
+_restarts_wake = scanner_restarts.labels("wake")
+_loop_wakeups = _metrics.counter("proxilock_monitor_wakeups_total", "Monitor loop wakeups, by reason", ("reason",))
+_monitoring = _metrics.gauge("proxilock_monitoring", "1 while proximity monitoring is running").labels()
+_monitoring.set_function(lambda: is_monitoring())
+_metrics.gauge(
+    "proxilock_radio_seconds", "Seconds the shared BLE scanner has had the radio on"
+).labels().set_function(lambda: get_scanner_hub().radio_time())
+
+# Hold the FAR counter at zero this long after a wake, while the radio settles
+WAKE_RESET_SECONDS = 2.0
+
 class ProximityMonitor:
-    def __init__(self):
+    """Runs the scanner and sleeps until something needs it
+
+    The loop wakes only for events -- a proximity state change, a screen
+    lock change, a system wake, a config change or stop() -- and for timer
+    deadlines from the duty-cycle scheduler, the absence watchdog and the
+    post-wake counter reset. wakeup_reasons counts why it woke.
+    """
+
+    def __init__(self, scanner_factory=None):
         self.scanner_instance = None
+        self.scanner_factory = scanner_factory
+        self.recorder = None
         self.monitoring = False
         self.loop = None
         self._wake_event = None
+        self._wake_reasons = set()
+        self.scheduler = None
+        self.wakeups = 0
+        self.wakeup_reasons = {}
+        self._counting_since = time.monotonic()
+    
+    def _create_scanner(self):
+        trace_path = get_config().record_trace_path
+        if trace_path and self.recorder is None:
+            self.recorder = TraceRecorder(trace_path)
+            print(f"Recording advertisements to {trace_path}")
+        return ProximityScanner(
+            proximity_callback,
+            scanner_factory=self.scanner_factory,
+            recorder=self.recorder,
+            on_state_change=self._on_state_change
+        )
+    
+    def _close_recorder(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
     
     async def _restart_scanner(self):
         if self.scanner_instance:
@@ -82,40 +233,167 @@ class ProximityMonitor:
         await asyncio.sleep(1.0)
         
         print("Restarting BLE scanner after wake...")
-        self.scanner_instance = ProximityScanner(proximity_callback)
+        _restarts_wake.inc()
+        self.scanner_instance = self._create_scanner()
         await self.scanner_instance.start()
+        self._wake_up("wake")
         print("BLE scanner restarted")
     
     def _on_wake(self):
         print("Handling system wake - restarting BLE scan")
+        if self.scanner_factory is None:
+            get_scanner_hub().restart()
         if self.loop and self.monitoring:
+            self.loop.call_soon_threadsafe(self._note_wake)
             asyncio.run_coroutine_threadsafe(self._restart_scanner(), self.loop)
     
+    def _note_wake(self):
+        if self.scheduler is not None:
+            self.scheduler.note_wake()
+        self._wake_up("wake")
+    
+    def notify(self, reason):
+        """Wake the monitor loop from any thread"""
+        loop = self.loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._wake_up, reason)
+        except RuntimeError:
+            # The loop has already closed
+            pass
+    
+    def call_soon(self, callback):
+        """Run callback on the monitor loop, or on this thread when the monitor is not running"""
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(callback)
+                return
+            except RuntimeError:
+                # The loop has already closed
+                pass
+        callback()
+    
+    def _wake_up(self, reason):
+        self._wake_reasons.add(reason)
+        if self._wake_event is not None:
+            self._wake_event.set()
+    
+    def _on_state_change(self, state):
+        self.notify("state")
+    
+    def _on_lock_state_change(self, locked):
+        self.notify("lock")
+    
+    def _on_config_change(self, snapshot, changed):
+        self.notify("config")
+    
+    def _count_wakeup(self, reasons):
+        self.wakeups += 1
+        for reason in reasons:
+            self.wakeup_reasons[reason] = self.wakeup_reasons.get(reason, 0) + 1
+            _loop_wakeups.labels(reason).inc()
+    
+    def wakeups_per_minute(self):
+        minutes = (time.monotonic() - self._counting_since) / 60.0
+        if minutes <= 0:
+            return 0.0
+        return self.wakeups / minutes
+    
+    def reset_counters(self):
+        self.wakeups = 0
+        self.wakeup_reasons = {}
+        self._counting_since = time.monotonic()
+    
+    def _configure_scheduler(self, snapshot):
+        policy = snapshot.scan_policy
+        if policy not in SCAN_POLICIES:
+            print(f"Unknown scan policy '{policy}', scanning continuously")
+            policy = POLICY_CONTINUOUS
+        if self.scheduler is None:
+            self.scheduler = DutyCycleScheduler(snapshot.scan_interval, snapshot.device_timeout, policy)
+        else:
+            self.scheduler.policy = policy
+            self.scheduler.set_bounds(snapshot.scan_interval, snapshot.device_timeout)
+    
+    def _duty_cycle(self):
+        """Switch the radio on or off for this moment; returns seconds until it next needs switching"""
+        scanner = self.scanner_instance
+        if scanner is None:
+            return None
+        scheduler = self.scheduler
+        scheduler.observe(scanner.last_state)
+        scheduler.set_script_locked(get_lock_owner() == LockOwner.SCRIPT)
+        radio_on = scheduler.radio_on()
+        if not scanner.set_radio(radio_on):
+            return None
+        return scheduler.next_change()
+    
+    def _wake_reset(self, snapshot):
+        """Keep the FAR counter at zero just after a wake; returns seconds until the next reset"""
+        remaining = WAKE_RESET_SECONDS - get_time_since_wake()
+        if remaining <= 0:
+            return None
+        if self.scanner_instance:
+            self.scanner_instance.reset_consecutive_far_count()
+        return min(snapshot.scan_interval, remaining)
+    
+    def _absence_check(self):
+        """Take target devices that have gone quiet as FAR; returns seconds until the next check"""
+        if self.scanner_instance is None:
+            return None
+        return self.scanner_instance.check_absence()
+    
     async def _monitor_loop(self):
-        global last_proximity
+        config = get_config()
+        lock_state = get_lock_state_service()
+        self.loop = asyncio.get_running_loop()
+        self._wake_event = asyncio.Event()
+        self._wake_reasons = {"start"}
+        config.subscribe(self._on_config_change)
+        lock_state.add_listener(self._on_lock_state_change)
         
         update_lock_state()
         
-        self.scanner_instance = ProximityScanner(proximity_callback)
+        self.scheduler = None
+        self.scanner_instance = self._create_scanner()
         await self.scanner_instance.start()
         
+        configured = None
         try:
             while self.monitoring:
-                update_lock_state()
+                reasons, self._wake_reasons = self._wake_reasons, set()
+                self._count_wakeup(reasons)
                 
-                time_since_wake = get_time_since_wake()
-                if time_since_wake < 2.0:
-                    if self.scanner_instance:
-                        self.scanner_instance.reset_consecutive_far_count()
+                if "lock" in reasons:
+                    update_lock_state()
                 
-                await asyncio.sleep(SCAN_INTERVAL)
+                snapshot = config.snapshot
+                if snapshot is not configured:
+                    self._configure_scheduler(snapshot)
+                    configured = snapshot
+                
+                # The radio is switched first, so the absence check knows whether it is listening
+                deadlines = [
+                    d for d in (self._duty_cycle(), self._wake_reset(snapshot), self._absence_check()) if d is not None
+                ]
+                self._wake_event.clear()
+                try:
+                    await asyncio.wait_for(self._wake_event.wait(), min(deadlines) if deadlines else None)
+                except asyncio.TimeoutError:
+                    self._wake_reasons.add("timer")
         finally:
+            config.unsubscribe(self._on_config_change)
+            lock_state.remove_listener(self._on_lock_state_change)
+            self._wake_event = None
             if self.scanner_instance:
                 try:
                     await self.scanner_instance.stop()
                 except Exception as e:
                     print(f"Error stopping scanner: {e}")
                 self.scanner_instance = None
+            self._close_recorder()
     
     def start(self):
         if self.monitoring:
@@ -139,6 +417,7 @@ class ProximityMonitor:
     
     def stop(self):
         self.monitoring = False
+        self.notify("stop")
     
     def is_running(self):
         return self.monitoring
@@ -148,10 +427,20 @@ _monitor_instance = ProximityMonitor()
 def start_monitoring():
     setup_sleep_watcher()
     set_wake_callback(_monitor_instance._on_wake)
+    get_lock_state_service().start()
+    get_config_watcher().start()
+    configure_logging(get_config().snapshot)
+    configure_tracing(get_config().snapshot)
+    start_exporters(get_config().snapshot)
+    _action_executor.start()
     _monitor_instance.start()
 
 def stop_monitoring():
     _monitor_instance.stop()
+    _action_executor.stop(timeout=1.0)
+    get_config_watcher().stop()
+    get_lock_state_service().stop()
+    stop_exporters()
 
 def is_monitoring():
     return _monitor_instance.is_running()
@@ -166,7 +455,7 @@ async def monitor():
     try:
         while True:
             update_lock_state()
-            await asyncio.sleep(SCAN_INTERVAL)
+            await asyncio.sleep(get_config().snapshot.scan_interval)
     finally:
         await scanner.stop()
 
@@ -0,0 +1,237 @@
+"""Platform-independent model of the menu bar menus with incremental diffs
+
+The model turns settings and device records into lists of MenuEntry and
+works out the smallest set of changes since the previous tick; the rumps
+adapter in menubar_app only applies those changes. Nothing here imports
+rumps or AppKit, so it runs (and is benchmarked) on Linux.
+"""
+from bisect import bisect_left
+
+from filters import FILTER_KINDS
+
+RSSI_FILTER_LABELS = {"none": "Off", "ewma": "EWMA", "median": "Median", "kalman": "Kalman"}
+RSSI_THRESHOLD_CHOICES = (-20, -30, -40, -50, -60, -70, -80, -90, -100)
+CONSECUTIVE_FAR_CHOICES = (3, 4, 5, 6, 7, 8, 9, 10)
+
+CHECK = "✓ "
+SCANNING = "Scanning…"
+
+
+class MenuEntry:
+    """One item: key identifies it across ticks, title is what is shown"""
+    __slots__ = ("key", "title", "enabled")
+
+    def __init__(self, key, title, enabled=True):
+        self.key = key
+        self.title = title
+        self.enabled = enabled
+
+    def __repr__(self):
+        return f"MenuEntry({self.key!r}, {self.title!r})"
+
+
+class MenuDiff:
+    """Changes turning one entry list into the next
+
+    Apply in this order: take out the items for removed and moved keys,
+    insert each (index, entry) of placed in ascending index order (moved
+    entries reuse their item), then set the titles in retitled.
+    """
+    __slots__ = ("removed", "moved", "placed", "retitled")
+
+    def __init__(self, removed=(), moved=(), placed=(), retitled=()):
+        self.removed = list(removed)
+        self.moved = list(moved)
+        self.placed = list(placed)
+        self.retitled = list(retitled)
+
+    def __bool__(self):
+        return bool(self.removed or self.moved or self.placed or self.retitled)
+
+    def op_count(self):
+        """Items inserted, removed or retitled (a move counts as one)"""
+        return len(self.removed) + len(self.placed) + len(self.retitled)
+
+    def __repr__(self):
+        return (f"MenuDiff(removed={self.removed!r}, moved={self.moved!r}, "
+                f"placed={self.placed!r}, retitled={self.retitled!r})")
+
+
+def _increasing_subsequence(values):
+    """Indices into values of one longest strictly increasing subsequence"""
+    tails = []
+    tail_indices = []
+    previous = [-1] * len(values)
+    for i, value in enumerate(values):
+        position = bisect_left(tails, value)
+        if position == len(tails):
+            tails.append(value)
+            tail_indices.append(i)
+        else:
+            tails[position] = value
+            tail_indices[position] = i
+        previous[i] = tail_indices[position - 1] if position > 0 else -1
+
+    members = []
+    i = tail_indices[-1] if tail_indices else -1
+    while i >= 0:
+        members.append(i)
+        i = previous[i]
+    return members
+
+
+def diff_entries(old, new):
+    """MenuDiff from entry list old to entry list new (keys must be unique)
+
+    Entries that keep their relative order stay put; only the fewest
+    entries needed to reach the new order are moved.
+    """
+    new_positions = {entry.key: i for i, entry in enumerate(new)}
+    old_by_key = {entry.key: entry for entry in old}
+
+    removed = [entry.key for entry in old if entry.key not in new_positions]
+    kept = [entry.key for entry in old if entry.key in new_positions]
+    positions = [new_positions[key] for key in kept]
+    staying = {positions[i] for i in _increasing_subsequence(positions)}
+
+    moved = [key for key, position in zip(kept, positions) if position not in staying]
+    placed = [(i, entry) for i, entry in enumerate(new) if i not in staying]
+    retitled = [
+        (entry.key, entry.title) for entry in new
+        if entry.key in old_by_key and old_by_key[entry.key].title != entry.title
+    ]
+    return MenuDiff(removed, moved, placed, retitled)
+
+
+class MenuSection:
+    """Remembers the entries last shown in one submenu"""
+
+    def __init__(self):
+        self.entries = []
+
+    def update(self, entries):
+        diff = diff_entries(self.entries, entries)
+        self.entries = list(entries)
+        return diff
+
+
+class MenuTitles:
+    """Remembers the titles last shown on top-level items"""
+
+    def __init__(self):
+        self.titles = {}
+
+    def update(self, titles):
+        """Return only the titles that differ from the last update"""
+        changed = {name: title for name, title in titles.items() if self.titles.get(name) != title}
+        self.titles.update(changed)
+        return changed
+
+
+def device_label(record):
+    if record.name and record.name != record.address:
+        device_display = record.name
+    else:
+        short_addr = record.address.replace(":", "")[-8:].upper()
+        device_display = f"Device {short_addr}"
+    rssi_str = f"+{record.rssi}" if record.rssi >= 0 else str(record.rssi)
+    return f"{device_display} ({rssi_str} dBm)"
+
+
+def enrolled_addresses(snapshot):
+    """Addresses in target_devices (entries enrolled by name have none)"""
+    addresses = set()
+    for entry in snapshot.target_devices or ():
+        address = entry if isinstance(entry, str) else entry.get("address")
+        if address:
+            addresses.add(address)
+    return addresses
+
+
+def device_entries(records, target_address, target_name, enrolled=()):
+    if not records:
+        return [MenuEntry(SCANNING, SCANNING, enabled=False)]
+    entries = []
+    for record in records:
+        label = device_label(record)
+        if (record.address == target_address or record.address in enrolled
+                or (record.name == target_name and not target_address)):
+            label = CHECK + label
+        entries.append(MenuEntry(record.address, label))
+    return entries
+
+
+def choice_entries(values, current, label):
+    return [MenuEntry(value, (CHECK if value == current else "") + label(value)) for value in values]
+
+
+def max_unlocking_choices(rssi_near, rssi_far):
+    """Values offered for max unlocking RSSI, or None if the thresholds are inverted"""
+    if rssi_near <= rssi_far:
+        return None
+    values = set(range(rssi_far, rssi_near + 1, 5))
+    values.add(rssi_near)
+    return sorted(values, reverse=True)
+
+
+def _dbm(value):
+    return f"{value} dBm"
+
+
+def _filter_label(kind):
+    return RSSI_FILTER_LABELS.get(kind, kind)
+
+
+def settings_titles(snapshot, monitoring):
+    return {
+        "rssi_near": f"Unlocking threshold (near): {snapshot.rssi_near} dBm",
+        "rssi_far": f"Locking threshold (far): {snapshot.rssi_far} dBm",
+        "max_unlocking_rssi": f"Max unlocking RSSI: {snapshot.max_unlocking_rssi} dBm",
+        "consecutive_far": f"Consecutive FAR required: {snapshot.consecutive_far_required}",
+        "rssi_filter": f"RSSI smoothing: {_filter_label(snapshot.rssi_filter)}",
+        "screen_saver_lock": (CHECK if snapshot.use_screen_saver_lock else "") + "Use Screen Saver Lock",
+        "lock_only_mode": (CHECK if snapshot.lock_only_mode else "") + "Lock Only Mode",
+        "monitoring": "Stop Monitoring" if monitoring else "Start Monitoring",
+    }
+
+
+def settings_sections(snapshot):
+    """Entries for every settings submenu"""
+    max_unlocking = max_unlocking_choices(snapshot.rssi_near, snapshot.rssi_far)
+    if max_unlocking is None:
+        max_unlocking_entries = [MenuEntry("invalid", "Invalid thresholds", enabled=False)]
+    else:
+        max_unlocking_entries = choice_entries(max_unlocking, snapshot.max_unlocking_rssi, _dbm)
+    return {
+        "rssi_near": choice_entries(RSSI_THRESHOLD_CHOICES, snapshot.rssi_near, _dbm),
+        "rssi_far": choice_entries(RSSI_THRESHOLD_CHOICES, snapshot.rssi_far, _dbm),
+        "max_unlocking_rssi": max_unlocking_entries,
+        "consecutive_far": choice_entries(CONSECUTIVE_FAR_CHOICES, snapshot.consecutive_far_required, str),
+        "rssi_filter": choice_entries(FILTER_KINDS, snapshot.rssi_filter, _filter_label),
+    }
+
+
+class ProxiLockMenuModel:
+    """Everything the menu bar shows, as diffs against what it showed last"""
+
+    def __init__(self):
+        self.devices = MenuSection()
+        self.sections = {}
+        self.titles = MenuTitles()
+
+    def update_devices(self, records, snapshot):
+        return self.devices.update(device_entries(
+            records, snapshot.target_address, snapshot.target_name, enrolled_addresses(snapshot)
+        ))
+
+    def update_settings(self, snapshot, monitoring):
+        """Return (changed top-level titles, {submenu name: MenuDiff} for submenus that changed)"""
+        diffs = {}
+        for name, entries in settings_sections(snapshot).items():
+            section = self.sections.get(name)
+            if section is None:
+                section = self.sections[name] = MenuSection()
+            diff = section.update(entries)
+            if diff:
+                diffs[name] = diff
+        return self.titles.update(settings_titles(snapshot, monitoring)), diffs
@@ -1,46 +1,127 @@
 import rumps
-import asyncio
-import threading
-import time
 import subprocess
 import getpass
-from bleak import BleakScanner
-from config import get_config, KEYCHAIN_ITEM
+from config import get_config
 from main import start_monitoring, stop_monitoring, is_monitoring
 from native_dialogs import show_alert, show_text_input_dialog, show_confirm_dialog, show_password_dialog
 from sleep_watcher import setup_sleep_watcher
+from secret_provider import get_secret_provider
+from device_table import DeviceTable
+from scanner_hub import LATEST_PER_ADDRESS, get_scanner_hub
+from menu_model import ProxiLockMenuModel, RSSI_FILTER_LABELS, enrolled_addresses
+
+# Advertisers kept for the Devices menu, how long they stay listed and how many are shown
+DEVICE_TABLE_CAPACITY = 512
+DEVICE_TTL = 10.0
+DEVICE_MENU_LIMIT = 25
+
+# rumps' public Menu API (insert_after, del menu[key]) is keyed by the title an
+# item had when it was added. Device names repeat, a retitled entry keeps its
+# old key, and there is no insert at an index. So RumpsMenuSection edits the
+# Cocoa menu directly, and these two helpers are the only code that reaches
+# into rumps' private attributes.
+def _ns_menu(parent):
+    """NSMenu of a rumps MenuItem's submenu, created if rumps has not made it yet"""
+    if parent._menu is None:
+        # rumps creates the NSMenu on the first add
+        parent.add(rumps.separator)
+        parent.clear()
+    return parent._menu
+
+def _ns_item(item):
+    """NSMenuItem behind a rumps MenuItem"""
+    return item._menuitem
+
+class RumpsMenuSection:
+    """Applies menu_model diffs to a rumps submenu, reusing its MenuItems
+
+    Items are inserted into the submenu's NSMenu after the first `offset`
+    fixed items; only entries that changed are touched.
+    """
+
+    def __init__(self, parent, callback, offset=0):
+        _ns_menu(parent)
+        self.parent = parent
+        self.callback = callback
+        self.offset = offset
+        self.items = {}
+
+    def apply(self, diff):
+        menu = _ns_menu(self.parent)
+        for key in diff.removed:
+            menu.removeItem_(_ns_item(self.items.pop(key)))
+        for key in diff.moved:
+            menu.removeItem_(_ns_item(self.items[key]))
+        for index, entry in diff.placed:
+            item = self.items.get(entry.key)
+            if item is None:
+                item = rumps.MenuItem(entry.title, callback=self.callback if entry.enabled else None)
+                item.menu_key = entry.key
+                self.items[entry.key] = item
+            menu.insertItem_atIndex_(_ns_item(item), self.offset + index)
+        for key, title in diff.retitled:
+            self.items[key].title = title
 
 class ProxiLockMenuBar(rumps.App):
     def __init__(self):
         super().__init__("Proxi-Lock")
 
-        self.devices = {}
-        self.lock = threading.Lock()
+        self.devices = DeviceTable(capacity=DEVICE_TABLE_CAPACITY, ttl=DEVICE_TTL)
         self.config = get_config()
         
         setup_sleep_watcher()
         rumps.events.before_quit.register(self._on_quit)
 
+        self.menu_model = ProxiLockMenuModel()
+
         self.devices_menu = rumps.MenuItem("Devices")
-        self.devices_menu.add("Scanning…")
+        self.devices_section = RumpsMenuSection(self.devices_menu, self.on_device_clicked)
 
         self.rssi_near_menu = rumps.MenuItem("Unlocking threshold (near)")
-        self._build_rssi_menu(self.rssi_near_menu, "near")
+        self._add_closest_farthest(self.rssi_near_menu)
 
         self.rssi_far_menu = rumps.MenuItem("Locking threshold (far)")
-        self._build_rssi_menu(self.rssi_far_menu, "far")
+        self._add_closest_farthest(self.rssi_far_menu)
 
         self.max_unlocking_rssi_menu = rumps.MenuItem("Max unlocking RSSI")
-        self._build_max_unlocking_rssi_menu()
-
         self.consecutive_far_menu = rumps.MenuItem("Consecutive FAR required")
-        self._build_consecutive_far_menu()
+        self.rssi_filter_menu = rumps.MenuItem("RSSI smoothing")
 
         self.screen_saver_lock_item = rumps.MenuItem("Use Screen Saver Lock", callback=self.toggle_screen_saver_lock)
         self.lock_only_mode_item = rumps.MenuItem("Lock Only Mode", callback=self.toggle_lock_only_mode)
         self.set_password_item = rumps.MenuItem("Set Password", callback=self.set_password)
         self.monitoring_item = rumps.MenuItem("Start Monitoring", callback=self.toggle_monitoring)
 
+        self.settings_sections = {
+            "rssi_near": RumpsMenuSection(
+                self.rssi_near_menu, lambda sender: self._set_rssi_threshold("near", sender.menu_key), offset=2
+            ),
+            "rssi_far": RumpsMenuSection(
+                self.rssi_far_menu, lambda sender: self._set_rssi_threshold("far", sender.menu_key), offset=2
+            ),
+            "max_unlocking_rssi": RumpsMenuSection(
+                self.max_unlocking_rssi_menu, lambda sender: self._set_max_unlocking_rssi(sender.menu_key)
+            ),
+            "consecutive_far": RumpsMenuSection(
+                self.consecutive_far_menu, lambda sender: self._set_consecutive_far_required(sender.menu_key)
+            ),
+            "rssi_filter": RumpsMenuSection(
+                self.rssi_filter_menu, lambda sender: self._set_rssi_filter(sender.menu_key)
+            ),
+        }
+        self.settings_items = {
+            "rssi_near": self.rssi_near_menu,
+            "rssi_far": self.rssi_far_menu,
+            "max_unlocking_rssi": self.max_unlocking_rssi_menu,
+            "consecutive_far": self.consecutive_far_menu,
+            "rssi_filter": self.rssi_filter_menu,
+            "screen_saver_lock": self.screen_saver_lock_item,
+            "lock_only_mode": self.lock_only_mode_item,
+            "monitoring": self.monitoring_item,
+        }
+        self.update_menu(None)
+        self.update_threshold_menus(None)
+
         self.menu = [
             self.devices_menu,
             rumps.separator,
@@ -50,13 +131,21 @@ class ProxiLockMenuBar(rumps.App):
             self.rssi_far_menu,
             self.max_unlocking_rssi_menu,
             self.consecutive_far_menu,
+            self.rssi_filter_menu,
             self.screen_saver_lock_item,
             self.lock_only_mode_item,
             self.set_password_item,
             rumps.separator
         ]
 
-        threading.Thread(target=self._ble_thread, daemon=True).start()
+        # Shares the monitor's scanner; the table only needs each device's latest advert,
+        # and follows the monitor's duty cycle rather than keeping the radio on itself
+        self.scan_subscription = get_scanner_hub().subscribe(
+            self._on_advert,
+            max_queue=DEVICE_TABLE_CAPACITY,
+            drop_policy=LATEST_PER_ADDRESS,
+            wants_radio=None
+        )
 
         self.timer = rumps.Timer(self.update_menu, 1)
         self.timer.start()
@@ -65,178 +154,58 @@ class ProxiLockMenuBar(rumps.App):
         self.password_check_timer = rumps.Timer(self._check_password_setup_once, 0.5)
         self.password_check_timer.start()
 
-    def _ble_thread(self):
-        asyncio.run(self.scan_loop())
-
-    async def scan_loop(self):
-        last_detection_time_ref = {"time": time.time()}
-        
-        def on_detect(device, adv):
-            last_detection_time_ref["time"] = time.time()
-            with self.lock:
-                self.devices[device.address] = {
-                    "address": device.address,
-                    "name": device.name or device.address,
-                    "rssi": adv.rssi,
-                    "last_seen": time.time()
-                }
-
-        scanner = None
-
-        while True:
-            try:
-                if scanner is None:
-                    scanner = BleakScanner(on_detect)
-                    await scanner.start()
-                    print("BLE scanner started")
-                    last_detection_time_ref["time"] = time.time()
-                
-                current_time = time.time()
-                if current_time - last_detection_time_ref["time"] > 30:
-                    print("No devices detected for 30s, restarting scanner...")
-                    try:
-                        await scanner.stop()
-                    except:
-                        pass
-                    scanner = None
-                    await asyncio.sleep(1)
-                    continue
-                await asyncio.sleep(1)
-
-            except Exception as e:
-                print(f"BLE scanner error: {e}")
-                if scanner:
-                    try:
-                        await scanner.stop()
-                    except:
-                        pass
-                    scanner = None
-                await asyncio.sleep(2)
+    def _on_advert(self, device, adv):
+        self.devices.update(device.address, device.name or device.address, adv.rssi)
 
     def update_menu(self, _):
-        self.devices_menu.clear()
-
-        now = time.time()
-        with self.lock:
-            devices = [
-                d for d in self.devices.values()
-                if now - d["last_seen"] < 10
-            ]
+        devices = self.devices.top_k(DEVICE_MENU_LIMIT)
 
-        if not devices:
-            self.devices_menu.add("Scanning…")
-            return
-
-        for d in sorted(devices, key=lambda x: x["rssi"], reverse=True):
-            if d["name"] and d["name"] != d["address"]:
-                device_display = d["name"]
-            else:
-                short_addr = d["address"].replace(":", "")[-8:].upper()
-                device_display = f"Device {short_addr}"
-            
-            rssi_str = f"+{d['rssi']}" if d['rssi'] >= 0 else str(d['rssi'])
-            label = f'{device_display} ({rssi_str} dBm)'
-            
-            is_selected = (d["address"] == self.config.target_address) or (d["name"] == self.config.target_name and not self.config.target_address)
-            if is_selected:
-                label = "✓ " + label
+        # Keep the monitored devices listed even when they are not among the strongest
+        snapshot = self.config.snapshot
+        targets = enrolled_addresses(snapshot)
+        if snapshot.target_address:
+            targets.add(snapshot.target_address)
+        shown = {d.address for d in devices}
+        for address in sorted(targets - shown):
+            target = self.devices.get(address)
+            if target is not None:
+                devices.append(target)
 
-            item = rumps.MenuItem(label, callback=self.on_device_clicked)
-            item.device_address = d["address"]
-            item.device_name = d["name"]
-            self.devices_menu.add(item)
+        diff = self.menu_model.update_devices(devices, snapshot)
+        if diff:
+            self.devices_section.apply(diff)
 
     def on_device_clicked(self, sender):
-        addr = getattr(sender, "device_address", None)
+        addr = getattr(sender, "menu_key", None)
         if not addr:
             return
 
-        with self.lock:
-            d = self.devices.get(addr)
+        d = self.devices.get(addr)
 
         if d:
-            self.config.target_address = d['address']
-            device_display = d['name'] if d['name'] and d['name'] != d['address'] else d['address'][:17]
+            self.config.target_address = d.address
+            device_display = d.name if d.name and d.name != d.address else d.address[:17]
             rumps.notification(
                 "Proxi-Lock",
                 "Device Selected",
                 f"Now monitoring: {device_display}"
             )
+            self.update_menu(None)
 
-    def _build_rssi_menu(self, parent_menu, threshold_type):
-        if parent_menu._menu is not None:
-            parent_menu.clear()
-        rssi_values = [-20, -30, -40, -50, -60, -70, -80, -90, -100]
-        
+    def _add_closest_farthest(self, parent_menu):
         parent_menu.add(rumps.MenuItem("Closest", callback=None))
         parent_menu.add(rumps.separator)
-        
-        for value in rssi_values:
-            current_value = self.config.rssi_near if threshold_type == "near" else self.config.rssi_far
-            label = f"{value} dBm"
-            if value == current_value:
-                label = "✓ " + label
-            
-            menu_item = rumps.MenuItem(
-                label,
-                callback=lambda sender, v=value, t=threshold_type: self._set_rssi_threshold(t, v)
-            )
-            parent_menu.add(menu_item)
-        
         parent_menu.add(rumps.separator)
         parent_menu.add(rumps.MenuItem("Farthest", callback=None))
     
-    def _build_max_unlocking_rssi_menu(self):
-        if self.max_unlocking_rssi_menu._menu is not None:
-            self.max_unlocking_rssi_menu.clear()
-        
-        rssi_near = self.config.rssi_near
-        rssi_far = self.config.rssi_far
-        
-        if rssi_near <= rssi_far:
-            self.max_unlocking_rssi_menu.add("Invalid thresholds")
-            return
-        
-        values = []
-        current = rssi_far
-        while current <= rssi_near:
-            values.append(current)
-            current += 5
-        
-        if rssi_near not in values:
-            values.append(rssi_near)
-        
-        values = sorted(set(values), reverse=True)
-        
-        for value in values:
-            current_value = self.config.max_unlocking_rssi
-            label = f"{value} dBm"
-            if value == current_value:
-                label = "✓ " + label
-            
-            menu_item = rumps.MenuItem(
-                label,
-                callback=lambda sender, v=value: self._set_max_unlocking_rssi(v)
-            )
-            self.max_unlocking_rssi_menu.add(menu_item)
-    
-    def _build_consecutive_far_menu(self):
-        if self.consecutive_far_menu._menu is not None:
-            self.consecutive_far_menu.clear()
-        
-        values = [3, 4, 5, 6, 7, 8, 9, 10]
-        
-        for value in values:
-            current_value = self.config.consecutive_far_required
-            label = f"{value}"
-            if value == current_value:
-                label = "✓ " + label
-            
-            menu_item = rumps.MenuItem(
-                label,
-                callback=lambda sender, v=value: self._set_consecutive_far_required(v)
-            )
-            self.consecutive_far_menu.add(menu_item)
+    def _set_rssi_filter(self, kind):
+        self.config.rssi_filter = kind
+        rumps.notification(
+            "Proxi-Lock",
+            "RSSI Smoothing Updated",
+            f"Set to {RSSI_FILTER_LABELS.get(kind, kind)}"
+        )
+        self.update_threshold_menus(None)
     
     def _set_consecutive_far_required(self, value):
         self.config.consecutive_far_required = value
@@ -245,7 +214,7 @@ class ProxiLockMenuBar(rumps.App):
             "Consecutive FAR Updated",
             f"Set to {value} consecutive readings"
         )
-        self._build_consecutive_far_menu()
+        self.update_threshold_menus(None)
     
     def _set_rssi_threshold(self, threshold_type, value):
         if threshold_type == "near":
@@ -255,8 +224,6 @@ class ProxiLockMenuBar(rumps.App):
                 "Unlocking Threshold Updated",
                 f"Set to {value} dBm (closer = unlock)"
             )
-            self._build_rssi_menu(self.rssi_near_menu, "near")
-            self._build_max_unlocking_rssi_menu()
         elif threshold_type == "far":
             self.config.rssi_far = value
             rumps.notification(
@@ -264,8 +231,7 @@ class ProxiLockMenuBar(rumps.App):
                 "Locking Threshold Updated",
                 f"Set to {value} dBm (farther = lock)"
             )
-            self._build_rssi_menu(self.rssi_far_menu, "far")
-            self._build_max_unlocking_rssi_menu()
+        self.update_threshold_menus(None)
     
     def _set_max_unlocking_rssi(self, value):
         self.config.max_unlocking_rssi = value
@@ -274,28 +240,14 @@ class ProxiLockMenuBar(rumps.App):
             "Max Unlocking RSSI Updated",
             f"Set to {value} dBm (between {self.config.rssi_far} and {self.config.rssi_near})"
         )
-        self._build_max_unlocking_rssi_menu()
+        self.update_threshold_menus(None)
     
     def update_threshold_menus(self, _):
-        self.rssi_near_menu.title = f"Unlocking threshold (near): {self.config.rssi_near} dBm"
-        self.rssi_far_menu.title = f"Locking threshold (far): {self.config.rssi_far} dBm"
-        self.max_unlocking_rssi_menu.title = f"Max unlocking RSSI: {self.config.max_unlocking_rssi} dBm"
-        self.consecutive_far_menu.title = f"Consecutive FAR required: {self.config.consecutive_far_required}"
-        
-        if self.config.use_screen_saver_lock:
-            self.screen_saver_lock_item.title = "✓ Use Screen Saver Lock"
-        else:
-            self.screen_saver_lock_item.title = "Use Screen Saver Lock"
-        
-        if self.config.lock_only_mode:
-            self.lock_only_mode_item.title = "✓ Lock Only Mode"
-        else:
-            self.lock_only_mode_item.title = "Lock Only Mode"
-        
-        if is_monitoring():
-            self.monitoring_item.title = "Stop Monitoring"
-        else:
-            self.monitoring_item.title = "Start Monitoring"
+        titles, diffs = self.menu_model.update_settings(self.config.snapshot, is_monitoring())
+        for name, title in titles.items():
+            self.settings_items[name].title = title
+        for name, diff in diffs.items():
+            self.settings_sections[name].apply(diff)
     
     def toggle_screen_saver_lock(self, sender):
         self.config.use_screen_saver_lock = not self.config.use_screen_saver_lock
@@ -305,6 +257,7 @@ class ProxiLockMenuBar(rumps.App):
             "Screen Saver Lock",
             f"Screen saver lock {status}"
         )
+        self.update_threshold_menus(None)
     
     def toggle_lock_only_mode(self, sender):
         self.config.lock_only_mode = not self.config.lock_only_mode
@@ -314,6 +267,7 @@ class ProxiLockMenuBar(rumps.App):
             "Lock Only Mode",
             f"Lock-only mode {status} (will lock but never unlock)"
         )
+        self.update_threshold_menus(None)
     
     def _check_password_setup_once(self, _):
         if hasattr(self, 'password_check_timer'):
@@ -369,16 +323,17 @@ class ProxiLockMenuBar(rumps.App):
                     "security",
                     "find-generic-password",
                     "-a", getpass.getuser(),
-                    "-s", KEYCHAIN_ITEM
+                    "-s", self.config.keychain_item
                 ], check=True, capture_output=True)
                 subprocess.run([
                     "security",
                     "add-generic-password",
                     "-a", getpass.getuser(),
-                    "-s", KEYCHAIN_ITEM,
+                    "-s", self.config.keychain_item,
                     "-w", password,
                     "-U"
                 ], check=True, capture_output=True)
+                get_secret_provider().invalidate()
                 rumps.notification(
                     "Proxi-Lock",
                     "Password Updated",
@@ -389,9 +344,10 @@ class ProxiLockMenuBar(rumps.App):
                     "security",
                     "add-generic-password",
                     "-a", getpass.getuser(),
-                    "-s", KEYCHAIN_ITEM,
+                    "-s", self.config.keychain_item,
                     "-w", password
                 ], check=True, capture_output=True)
+                get_secret_provider().invalidate()
                 rumps.notification(
                     "Proxi-Lock",
                     "Password Set",
@@ -410,7 +366,7 @@ class ProxiLockMenuBar(rumps.App):
             self.start_monitoring()
 
     def start_monitoring(self):
-        if not self.config.target_address and not self.config.target_name:
+        if not self.config.target_address and not self.config.target_name and not self.config.target_devices:
             show_alert(
                 "No Device Selected",
                 "Please select a device from the Devices menu first."
@@ -418,8 +374,11 @@ class ProxiLockMenuBar(rumps.App):
             return
         
         start_monitoring()
-        self.monitoring_item.title = "Stop Monitoring"
+        self.update_threshold_menus(None)
         target_display = self.config.target_name if self.config.target_name else (self.config.target_address[:17] if self.config.target_address else "Unknown")
+        extra = len(self.config.target_devices)
+        if extra:
+            target_display = f"{target_display} + {extra} more" if target_display != "Unknown" else f"{extra} devices"
         rumps.notification(
             "Proxi-Lock",
             "Monitoring Started",
@@ -428,7 +387,7 @@ class ProxiLockMenuBar(rumps.App):
 
     def stop_monitoring(self):
         stop_monitoring()
-        self.monitoring_item.title = "Start Monitoring"
+        self.update_threshold_menus(None)
         rumps.notification(
             "Proxi-Lock",
             "Monitoring Stopped",
@@ -436,6 +395,7 @@ class ProxiLockMenuBar(rumps.App):
         )
 
     def _on_quit(self, _):
+        get_scanner_hub().unsubscribe(self.scan_subscription)
         if is_monitoring():
             stop_monitoring()
 
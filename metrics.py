@@ -0,0 +1,416 @@
+"""Counters, gauges and fixed-bucket histograms with Prometheus text and JSON export
+
+Modules create their metrics once at import time through get_metrics()
+and keep the children they update (metric.labels(...)) in module globals,
+so the hot path is a plain float add on a preallocated slot: no lock and
+no allocation (float results come from CPython's free list). Each child is
+meant to have one writer thread at a time; exporters read concurrently and
+may see a histogram's sum a moment ahead of its buckets.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# Seconds; tuned for per-advert work (microseconds) up to subprocesses (seconds)
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+ACTION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0)
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 7, 8, 10, 15, 20, 30, 50, 100)
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        self.value += amount
+
+    def get(self):
+        return self.value
+
+
+class GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1.0):
+        self.value += amount
+
+    def dec(self, amount=1.0):
+        self.value -= amount
+
+    def set_function(self, function):
+        """Read the value from function() at export time instead"""
+        self.function = function
+
+    def get(self):
+        function = self.function
+        if function is None:
+            return self.value
+        try:
+            return float(function())
+        except Exception:
+            return float("nan")
+
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One slot per bound plus the +Inf bucket; counts are per bucket, not cumulative
+        self.counts = [0.0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1.0
+        self.sum += value
+
+    def get(self):
+        """(cumulative bucket counts, sum, count)"""
+        cumulative = []
+        total = 0.0
+        for count in list(self.counts):
+            total += count
+            cumulative.append(total)
+        return cumulative, self.sum, total
+
+
+class MetricFamily:
+    """A named metric and its children, one per combination of label values"""
+
+    def __init__(self, kind, name, help_text, labelnames=(), buckets=None):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) if buckets is not None else None
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        if self.kind == COUNTER:
+            return CounterChild()
+        if self.kind == GAUGE:
+            return GaugeChild()
+        return HistogramChild(self.buckets)
+
+    def labels(self, *values):
+        """The child for these label values, created on first use (keep a reference to it)"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def children(self):
+        with self._lock:
+            return sorted(self._children.items())
+
+    def reset(self):
+        with self._lock:
+            for child in self._children.values():
+                if self.kind == HISTOGRAM:
+                    child.counts[:] = [0.0] * len(child.counts)
+                    child.sum = 0.0
+                else:
+                    child.value = 0.0
+
+
+def _format_value(value):
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class MetricsRegistry:
+    """Every metric in the process, in registration order"""
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _family(self, kind, name, help_text, labelnames, buckets=None):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = MetricFamily(kind, name, help_text, labelnames, buckets)
+            elif family.kind != kind or family.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered as a different {family.kind}")
+            return family
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._family(COUNTER, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._family(GAUGE, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._family(HISTOGRAM, name, help_text, labelnames, buckets)
+
+    def families(self):
+        with self._lock:
+            return list(self._families.values())
+
+    def reset(self):
+        """Zero every value (benchmarks); children stay valid"""
+        for family in self.families():
+            family.reset()
+
+    def render_prometheus(self):
+        """Prometheus text exposition format 0.0.4"""
+        lines = []
+        for family in self.families():
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for values, child in family.children():
+                if family.kind != HISTOGRAM:
+                    lines.append(f"{family.name}{_label_text(family.labelnames, values)} {_format_value(child.get())}")
+                    continue
+                cumulative, total_sum, count = child.get()
+                bounds = [_format_value(b) for b in family.buckets] + ["+Inf"]
+                for bound, value in zip(bounds, cumulative):
+                    labels = _label_text(family.labelnames, values, ("le", bound))
+                    lines.append(f"{family.name}_bucket{labels} {_format_value(value)}")
+                labels = _label_text(family.labelnames, values)
+                lines.append(f"{family.name}_sum{labels} {_format_value(total_sum)}")
+                lines.append(f"{family.name}_count{labels} {_format_value(count)}")
+        return "\n".join(lines) + "\n"
+
+    def as_dict(self):
+        result = {}
+        for family in self.families():
+            samples = []
+            for values, child in family.children():
+                sample = {"labels": dict(zip(family.labelnames, values))}
+                if family.kind == HISTOGRAM:
+                    cumulative, total_sum, count = child.get()
+                    sample["buckets"] = dict(zip([str(b) for b in family.buckets] + ["+Inf"], cumulative))
+                    sample["sum"] = total_sum
+                    sample["count"] = count
+                else:
+                    sample["value"] = child.get()
+                samples.append(sample)
+            result[family.name] = {"type": family.kind, "help": family.help, "samples": samples}
+        return result
+
+    def render_json(self):
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+
+class _Timer:
+    __slots__ = ("seconds", "failures", "started")
+
+    def __init__(self, seconds, failures):
+        self.seconds = seconds
+        self.failures = failures
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds.observe(time.perf_counter() - self.started)
+        if exc_type is not None:
+            self.failures.inc()
+        return False
+
+
+def time_spawn(command):
+    """Context manager counting one subprocess spawn of command and timing it until exit"""
+    _spawns.labels(command).inc()
+    return _Timer(_spawn_seconds.labels(command), _spawn_failures.labels(command))
+
+
+def count_spawn(command):
+    """Count a spawn whose lifetime is not timed (a long-lived helper process)"""
+    _spawns.labels(command).inc()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body = self.registry.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = self.registry.render_json().encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsHttpServer:
+    """Serves /metrics (Prometheus text) and /metrics.json on a local port"""
+
+    def __init__(self, registry, host="127.0.0.1", port=9464):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        if self._server is not None:
+            return
+        handler = type("MetricsHandler", (_Handler,), {"registry": self.registry})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join(timeout=2.0)
+        self._server = None
+        self._thread = None
+
+
+class TextfileExporter:
+    """Rewrites path every interval seconds: JSON for *.json, Prometheus text otherwise
+
+    Files are replaced atomically, so node_exporter's textfile collector
+    or any other reader never sees a partial write.
+    """
+
+    def __init__(self, registry, path, interval=15.0):
+        self.registry = registry
+        self.path = os.path.expanduser(path)
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def write_now(self):
+        if self.path.endswith(".json"):
+            text = self.registry.render_json()
+        else:
+            text = self.registry.render_prometheus()
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(prefix=".proxi_lock_metrics_", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(text)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout=2.0)
+        self._thread = None
+        self._write()
+
+    def _write(self):
+        try:
+            self.write_now()
+        except OSError as e:
+            print(f"Failed to write metrics to {self.path}: {e}")
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._write()
+
+
+_registry = MetricsRegistry()
+_exporters = []
+
+_spawns = _registry.counter("proxilock_subprocess_spawns_total", "Subprocesses started, by command", ("command",))
+_spawn_failures = _registry.counter(
+    "proxilock_subprocess_failures_total", "Subprocesses that failed or timed out, by command", ("command",)
+)
+_spawn_seconds = _registry.histogram(
+    "proxilock_subprocess_seconds", "Subprocess run time until exit, by command", ("command",)
+)
+
+
+def get_metrics():
+    return _registry
+
+
+def start_exporters(snapshot):
+    """Start the HTTP endpoint and/or textfile writer selected in ProxiLockConfig"""
+    if _exporters:
+        return
+    if snapshot.metrics_port:
+        server = MetricsHttpServer(_registry, port=int(snapshot.metrics_port))
+        try:
+            server.start()
+            _exporters.append(server)
+        except OSError as e:
+            print(f"Could not serve metrics on port {snapshot.metrics_port}: {e}")
+    if snapshot.metrics_textfile:
+        exporter = TextfileExporter(_registry, snapshot.metrics_textfile, snapshot.metrics_interval)
+        exporter.start()
+        _exporters.append(exporter)
+
+
+def stop_exporters():
+    while _exporters:
+        _exporters.pop().stop()
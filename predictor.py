@@ -0,0 +1,119 @@
+"""Walk-away prediction from the RSSI trend"""
+from collections import deque
+
+# Rebase a fit's time origin this often so the running sums keep their precision
+_REBASE_EVERY = 256
+
+
+class _SlidingFit:
+    """Least-squares line through the (t, rssi) samples of the last span seconds, from running sums"""
+    __slots__ = ("span", "samples", "_origin", "_since_rebase", "_sx", "_sy", "_sxx", "_sxy", "_syy")
+
+    def __init__(self, span):
+        self.span = span
+        self.samples = deque()
+        self._origin = None
+        self._since_rebase = 0
+        self._sx = self._sy = self._sxx = self._sxy = self._syy = 0.0
+
+    def _add(self, x, y, sign):
+        self._sx += sign * x
+        self._sy += sign * y
+        self._sxx += sign * x * x
+        self._sxy += sign * x * y
+        self._syy += sign * y * y
+
+    def add(self, now, rssi):
+        samples = self.samples
+        if self._origin is None:
+            self._origin = now
+        origin = self._origin
+        samples.append((now, rssi))
+        self._add(now - origin, rssi, 1.0)
+        cutoff = now - self.span
+        while samples[0][0] < cutoff:
+            t, y = samples.popleft()
+            self._add(t - origin, y, -1.0)
+        self._since_rebase += 1
+        if self._since_rebase >= _REBASE_EVERY:
+            self._origin = now
+            self._since_rebase = 0
+            self._sx = self._sy = self._sxx = self._sxy = self._syy = 0.0
+            for t, y in samples:
+                self._add(t - now, y, 1.0)
+
+    def line(self, now, horizon):
+        """(slope dB/s, R^2, level projected horizon seconds after now), or None if degenerate"""
+        n = len(self.samples)
+        sxx = n * self._sxx - self._sx * self._sx
+        syy = n * self._syy - self._sy * self._sy
+        if sxx <= 0 or syy <= 0:
+            return None
+        sxy = n * self._sxy - self._sx * self._sy
+        slope = sxy / sxx
+        projected = (self._sy + slope * ((now - self._origin + horizon) * n - self._sx)) / n
+        return slope, sxy * sxy / (sxx * syy), projected
+
+
+class TrendPredictor:
+    """Sliding-window regression of RSSI against time for one device
+
+    update() reports "departing" when the signal is falling steadily: a
+    line fitted over the last window seconds (at least min_samples
+    readings spanning half of it) explains at least min_r2 of the
+    variance and reaches the FAR threshold within horizon seconds, and a
+    second fit over just the newest half window agrees. The second fit is
+    what tells a walk from a single step down -- leaning back in the chair
+    drops the RSSI at once and then holds it, so its recent half is flat.
+    """
+    __slots__ = ("window", "horizon", "min_r2", "min_samples", "_full", "_recent", "slope", "r2", "departing")
+
+    def __init__(self, window=3.0, horizon=1.0, min_r2=0.8, min_samples=5):
+        if window <= 0 or horizon < 0:
+            raise ValueError("window must be positive and horizon non-negative")
+        self.window = window
+        self.horizon = horizon
+        self.min_r2 = min_r2
+        self.min_samples = max(3, int(min_samples))
+        self.reset()
+
+    def reset(self):
+        self._full = _SlidingFit(self.window)
+        self._recent = _SlidingFit(self.window / 2)
+        self.slope = 0.0
+        self.r2 = 0.0
+        self.departing = False
+
+    def update(self, now, rssi, rssi_far):
+        """Add one (filtered) reading at now (seconds); returns whether the device is departing"""
+        if rssi is None or rssi != rssi:
+            # No reading is not evidence of a trend either way
+            return self.departing
+        full = self._full
+        full.add(now, rssi)
+        self._recent.add(now, rssi)
+
+        departing = False
+        samples = full.samples
+        if len(samples) >= self.min_samples and now - samples[0][0] >= self.window / 2:
+            fit = full.line(now, self.horizon)
+            if fit is not None:
+                self.slope, self.r2, projected = fit
+                if self.slope < 0 and self.r2 >= self.min_r2 and projected <= rssi_far:
+                    recent = self._recent.line(now, self.horizon) if len(self._recent.samples) >= 3 else None
+                    departing = recent is not None and recent[0] < 0 and recent[2] <= rssi_far
+        self.departing = departing
+        return departing
+
+
+def predictor_factory_from_config(config):
+    """Zero-argument factory for per-device predictors, or None when predictive locking is off"""
+    if not config.predictive_lock:
+        return None
+    window = config.predict_window
+    horizon = config.predict_horizon
+    min_r2 = config.predict_min_r2
+
+    def factory():
+        return TrendPredictor(window, horizon, min_r2)
+    return factory
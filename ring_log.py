@@ -0,0 +1,297 @@
+"""Hot-path logging: records go into a preallocated ring buffer, a background thread formats and writes them"""
+import atexit
+import itertools
+import os
+import sys
+import threading
+import time
+
+from metrics import get_metrics
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+DEFAULT_CAPACITY = 4096
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_BACKUPS = 3
+
+
+class StreamSink:
+    """Writes bare messages to stdout, as print() did
+
+    sys.stdout is looked up on every write so redirect_stdout still works.
+    """
+
+    def write(self, text):
+        stream = sys.stdout
+        if stream is not None:
+            stream.write(text)
+            stream.flush()
+
+    def format(self, timestamp, level, message):
+        return message + "\n"
+
+    def close(self):
+        pass
+
+
+class RotatingFileSink:
+    """Appends timestamped lines to path, keeping backups old files of up to max_bytes each"""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = None
+        self._size = 0
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def write(self, text):
+        if self._file is None:
+            self._open()
+        if self._size and self._size + len(text) > self.max_bytes:
+            self._rotate()
+            self._open()
+        self._file.write(text)
+        self._file.flush()
+        self._size += len(text)
+
+    def format(self, timestamp, level, message):
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+        return f"{stamp}.{int(timestamp % 1 * 1000):03d} {LEVEL_NAMES.get(level, level)} {message}\n"
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _level_method(level):
+    """RingLogger.debug() and friends, each with its level baked in to save a call"""
+    index = level // 10
+
+    def method(self, template, *args):
+        if level < self.level:
+            return
+        every = self._every[index]
+        if every > 1:
+            seen = self._seen[index] + 1
+            self._seen[index] = seen
+            if seen % every:
+                self.sampled_out += 1
+                return
+        seq = next(self._sequence)
+        self._slots[seq % self.capacity] = (seq, self.clock(), level, template, args)
+        self._head = seq + 1
+        if seq - self._tail == self._high_water:
+            self._wakeup.set()
+        elif self._thread is None:
+            self._start()
+    method.__name__ = LEVEL_NAMES[level].lower()
+    return method
+
+
+class RingLogger:
+    """Logs by storing (sequence, time, level, template, args) in a fixed ring of slots
+
+    The caller pays for a level check, the sampling check, a sequence
+    number and one slot store -- no lock, since next() on the counter and
+    the store are each atomic. str.format runs later on the drain thread,
+    which wakes every flush_interval seconds (or when the ring is half
+    full) and writes whole batches to the sink. When the sink falls behind,
+    new records overwrite the oldest unread ones; the drain spots the gap
+    in sequence numbers, counts it in dropped and logs how many were lost.
+
+    sample maps a level to N, keeping one record in N at that level.
+    """
+
+    def __init__(self, sink=None, capacity=DEFAULT_CAPACITY, level=DEBUG, sample=None,
+                 flush_interval=0.25, clock=time.time):
+        self.sink = sink if sink is not None else StreamSink()
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.level = level
+        self._slots = [(-1, 0.0, 0, "", ())] * capacity
+        self._sequence = itertools.count()
+        self._head = 0
+        self._tail = 0
+        self._high_water = capacity // 2
+        self._drain_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopping = False
+        # Per-level sampling, indexed by level // 10
+        self._every = [1] * 6
+        self._seen = [0] * 6
+        self.set_sample(sample or {})
+        self.dropped = 0
+        self.sampled_out = 0
+        self.written = 0
+        self._reported_drops = 0
+
+    def set_sample(self, sample):
+        every = [1] * 6
+        for level, n in sample.items():
+            level = LEVELS.get(level, level) if isinstance(level, str) else level
+            every[min(level // 10, 5)] = max(1, int(n))
+        self._every = every
+
+    def log(self, level, template, *args):
+        self._by_level[level](self, template, *args)
+
+    debug = _level_method(DEBUG)
+    info = _level_method(INFO)
+    warning = _level_method(WARNING)
+    error = _level_method(ERROR)
+    _by_level = {DEBUG: debug, INFO: info, WARNING: warning, ERROR: error}
+
+    def pending(self):
+        return max(0, self._head - self._tail)
+
+    def _start(self):
+        with self._drain_lock:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="ring-log", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.drain()
+        self.drain()
+
+    def drain(self):
+        """Format and write everything logged so far; returns the number of lines written"""
+        with self._drain_lock:
+            sink = self.sink
+            slots = self._slots
+            capacity = self.capacity
+            head = self._head
+            tail = self._tail
+            lost = 0
+            if head - tail > capacity:
+                lost = head - capacity - tail
+                tail = head - capacity
+            lines = []
+            while tail < head:
+                seq, timestamp, level, template, args = slots[tail % capacity]
+                if seq < tail:
+                    # Sequence taken but the slot not stored yet; pick it up next time
+                    break
+                if seq > tail:
+                    lost += 1
+                    tail += 1
+                    continue
+                try:
+                    message = template.format(*args) if args else template
+                except Exception as e:
+                    message = f"{template!r} {args!r} (format failed: {e})"
+                lines.append(sink.format(timestamp, level, message))
+                tail += 1
+            self._tail = tail
+            self.dropped += lost
+            dropped = self.dropped - self._reported_drops
+            if dropped:
+                self._reported_drops += dropped
+                lines.append(sink.format(self.clock(), WARNING, f"{dropped} log records dropped (buffer full)"))
+            if lines:
+                try:
+                    sink.write("".join(lines))
+                except Exception as e:
+                    print(f"Log write failed: {e}", file=sys.stderr)
+            self.written += len(lines)
+            return len(lines)
+
+    def set_sink(self, sink):
+        with self._drain_lock:
+            old = self.sink
+            self.sink = sink
+        self.drain()
+        if old is not sink:
+            old.close()
+
+    def close(self):
+        thread = self._thread
+        if thread is not None:
+            self._stopping = True
+            self._wakeup.set()
+            thread.join(timeout=2.0)
+            self._thread = None
+        else:
+            self.drain()
+        self.sink.close()
+
+
+_logger = RingLogger()
+_configured = False
+
+_metrics = get_metrics()
+_metrics.gauge("proxilock_log_dropped_records", "Log records dropped because the ring buffer was full").labels().set_function(
+    lambda: _logger.dropped
+)
+_metrics.gauge("proxilock_log_sampled_records", "Log records skipped by per-level sampling").labels().set_function(
+    lambda: _logger.sampled_out
+)
+
+
+def _sink_for(snapshot):
+    if snapshot.log_path:
+        return RotatingFileSink(snapshot.log_path, snapshot.log_max_bytes, snapshot.log_backups)
+    return StreamSink()
+
+
+def _apply(snapshot, changed):
+    if "log_level" in changed:
+        level = LEVELS.get(str(snapshot.log_level).lower())
+        if level is None:
+            print(f"Unknown log level: {snapshot.log_level}, using debug")
+            level = DEBUG
+        _logger.level = level
+    if "log_sample" in changed:
+        _logger.set_sample(snapshot.log_sample or {})
+    if changed & {"log_path", "log_max_bytes", "log_backups"}:
+        _logger.set_sink(_sink_for(snapshot))
+
+
+def configure_logging(snapshot):
+    """Apply the log_* settings and follow later config changes"""
+    global _configured
+    _apply(snapshot, {"log_level", "log_sample", "log_path", "log_max_bytes", "log_backups"})
+    if not _configured:
+        from config import get_config
+        get_config().subscribe(_apply)
+        _configured = True
+
+
+def get_logger():
+    return _logger
+
+
+atexit.register(_logger.close)
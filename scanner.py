@@ -1,43 +1,203 @@
 """BLE scanning / proximity detection"""
-from bleak import BleakScanner
+import asyncio
+import threading
+from time import perf_counter
+
+from absence import watchdog_from_config
 from config import get_config
-from controller import ProximityController
+from controller import FAR, NEAR, PROXIMITY_NAMES, ProximityController
+from device_group import group_from_config
+from filters import filter_factory_from_config
+from hysteresis import hysteresis_from_config
+from predictor import predictor_factory_from_config
+from metrics import COUNT_BUCKETS, get_metrics
+from scanner_hub import HubScanner, ScanFilter
+from ring_log import get_logger
+from tracing import get_tracer
+
+_THRESHOLD_KEYS = frozenset(("rssi_near", "rssi_far", "max_unlocking_rssi"))
+_FILTER_KEYS = frozenset((
+    "rssi_filter",
+    "rssi_filter_alpha",
+    "rssi_filter_window",
+    "rssi_filter_process_noise",
+    "rssi_filter_measurement_noise",
+))
+_PREDICT_KEYS = frozenset((
+    "predictive_lock",
+    "predict_window",
+    "predict_horizon",
+    "predict_min_r2",
+))
+_HYSTERESIS_KEYS = frozenset(("hysteresis_mode", "device_timeout", "state_debounce_time"))
+_ABSENCE_KEYS = frozenset(("absence_watchdog", "absence_interval_factor", "device_timeout"))
+_TARGET_KEYS = frozenset((
+    "target_address",
+    "target_name",
+    "target_devices",
+    "lock_combinator",
+    "unlock_combinator",
+    "combinator_quorum",
+    "lock_distance",
+    "unlock_distance",
+    "rssi_at_1m",
+    "path_loss_exponent",
+))
+_WATCHDOG_REBUILD_KEYS = _TARGET_KEYS | {"absence_watchdog"}
+
+_metrics = get_metrics()
+_adverts_received = _metrics.counter(
+    "proxilock_adverts_received_total", "Adverts delivered to the proximity scanner"
+).labels()
+_adverts_filtered = _metrics.counter(
+    "proxilock_adverts_filtered_total", "Adverts dropped because they are not from a target device"
+).labels()
+_advert_seconds = _metrics.histogram(
+    "proxilock_advert_processing_seconds", "Time to process one target advert, decision included"
+).labels()
+_far_streaks = _metrics.histogram(
+    "proxilock_consecutive_far_streak", "Length of each run of consecutive FAR adverts when it ends",
+    buckets=COUNT_BUCKETS
+).labels()
+_absences = _metrics.counter(
+    "proxilock_device_absences_total", "Target devices taken as FAR because they stopped advertising"
+).labels()
+_log = get_logger()
+_tracer = get_tracer()
 
 class ProximityScanner:
-    def __init__(self, proximity_callback):
+    """Follows the target devices and reports the combined proximity
+
+    Each enrolled device (target_devices plus the single target_address or
+    target_name) has its own controller state, RSSI filter and FAR
+    counter; the group combinators decide the proximity passed to
+    proximity_callback, and consecutive_far_count counts adverts while
+    the group is FAR. In the "time" hysteresis mode the combined state
+    goes through a TimedHysteresis first, so locking waits on how long
+    FAR has held rather than on how many adverts arrived.
+
+    A device that stops advertising altogether (out of range, Bluetooth
+    off) never calls back, so with absence_watchdog on an AbsenceWatchdog
+    tracks every device's silence and check_absence(), run by the monitor
+    loop, feeds each silent one through the same path as a FAR advert.
+    """
+
+    def __init__(self, proximity_callback, scanner_factory=None, recorder=None, on_state_change=None):
         self.config = get_config()
         self.controller = ProximityController(
             self.config.rssi_near, 
             self.config.rssi_far, 
             max_unlocking_rssi=self.config.max_unlocking_rssi
         )
+        self.filter_factory = filter_factory_from_config(self.config)
+        self.predictor_factory = predictor_factory_from_config(self.config.snapshot)
+        self.group = group_from_config(
+            self.config.snapshot, self.controller, self.filter_factory, self.predictor_factory
+        )
+        self.hysteresis = hysteresis_from_config(self.config.snapshot)
+        # Whether the radio is listening, as last set by set_radio()
+        self.listening = True
+        self.watchdog = watchdog_from_config(self.config.snapshot, self.group.devices, perf_counter)
         self.proximity_callback = proximity_callback
         self.last_proximity = None
+        self.last_state = None
         self.consecutive_far_count = 0
+        # perf_counter time of the first FAR advert in the current run, for tracing
+        self.far_started = 0.0
+        self.scanner_factory = scanner_factory
+        self.recorder = recorder
+        self.on_state_change = on_state_change
+        self.scanner = None
+        # The loop adverts are delivered on, once started
+        self.loop = None
+        self._loop_thread = None
+        self.config.subscribe(self._on_config_change)
+
+    def _on_config_change(self, snapshot, changed):
+        # Changes are published on the thread that made them (the menu bar or
+        # the file watcher). Rebuilding thresholds, the group and the counters
+        # takes several stores, so apply them on the loop, between two adverts
+        loop = self.loop
+        if loop is not None and threading.get_ident() != self._loop_thread:
+            try:
+                loop.call_soon_threadsafe(self._apply_config, snapshot, changed)
+                return
+            except RuntimeError:
+                # The loop has closed, so no advert can be in flight
+                pass
+        self._apply_config(snapshot, changed)
+
+    def _apply_config(self, snapshot, changed):
+        if changed & _THRESHOLD_KEYS:
+            self.group.set_thresholds(snapshot.rssi_near, snapshot.rssi_far, snapshot.max_unlocking_rssi)
+        if changed & _FILTER_KEYS:
+            self.filter_factory = filter_factory_from_config(snapshot)
+            self.group.set_filter_factory(self.filter_factory)
+        if changed & _PREDICT_KEYS:
+            self.predictor_factory = predictor_factory_from_config(snapshot)
+            self.group.set_predictor_factory(self.predictor_factory)
+        if changed & _HYSTERESIS_KEYS:
+            self.hysteresis = hysteresis_from_config(snapshot)
+        if changed & _TARGET_KEYS:
+            self.group = group_from_config(snapshot, self.controller, self.filter_factory, self.predictor_factory)
+            self.consecutive_far_count = 0
+            if self.hysteresis is not None:
+                self.hysteresis.reset()
+            self._update_scan_filter(snapshot)
+        if changed & (_ABSENCE_KEYS | _TARGET_KEYS):
+            watchdog = self.watchdog
+            if watchdog is not None and snapshot.absence_watchdog and not changed & _WATCHDOG_REBUILD_KEYS:
+                # Keep the learned intervals
+                watchdog.set_limits(snapshot.device_timeout, snapshot.absence_interval_factor)
+            else:
+                self.watchdog = watchdog_from_config(snapshot, self.group.devices, perf_counter, self.listening)
+
+    def _update_scan_filter(self, snapshot):
+        """Have the hub drop other advertisers before they reach this loop (unless recording all)"""
+        set_filter = getattr(self.scanner, "set_filter", None)
+        if set_filter is None or self.recorder is not None:
+            return
+        addresses = self.group.addresses()
+        names = self.group.names()
+        if not names:
+            set_filter(ScanFilter(addresses=addresses))
+        elif not addresses:
+            set_filter(ScanFilter(names=names))
+        else:
+            # Address and name targets mixed: a ScanFilter can only AND them
+            set_filter(None)
 
     def _detection_callback(self, device, advertisement_data):
-        target_address = self.config.target_address
-        target_name = self.config.target_name
+        if self.recorder is not None:
+            self.recorder.record(device, advertisement_data)
         
-        if not target_address and not target_name:
+        _adverts_received.inc()
+        group = self.group
+        tracked = group.lookup(device.address, device.name)
+        if tracked is None:
+            _adverts_filtered.inc()
             return
-        
-        if target_address:
-            if device.address != target_address:
-                return
-        else:
-            device_name = device.name or ""
-            if device_name != target_name:
-                return
 
-        rssi = advertisement_data.rssi
-        proximity = self.controller.get_proximity(rssi)
+        started = perf_counter()
+        decision = _tracer.new_decision() if _tracer.enabled else None
+        watchdog = self.watchdog
+        if watchdog is not None:
+            watchdog.seen(tracked, started)
+        rssi = group.observe(tracked, advertisement_data.rssi, advertisement_data.tx_power, started)
+        state = group.state
+        hysteresis = self.hysteresis
+        if hysteresis is not None:
+            state = hysteresis.update(state, started)
+        proximity = PROXIMITY_NAMES[state]
         
-        if proximity == "FAR":
+        if state == FAR:
             self.consecutive_far_count += 1
-        elif proximity == "NEAR":
+            if self.consecutive_far_count == 1:
+                self.far_started = started
+        elif state == NEAR:
             if self.consecutive_far_count > 0:
-                print(f"NEAR detected | Reset FAR counter (was {self.consecutive_far_count})")
+                _log.debug("NEAR detected | Reset FAR counter (was {})", self.consecutive_far_count)
+                _far_streaks.observe(self.consecutive_far_count)
             self.consecutive_far_count = 0
         
         self.proximity_callback(
@@ -47,21 +207,119 @@ class ProximityScanner:
         )
         
         self.last_proximity = proximity
+        if state != self.last_state:
+            self.last_state = state
+            if self.on_state_change is not None:
+                self.on_state_change(state)
+        ended = perf_counter()
+        _advert_seconds.observe(ended - started)
+        if decision is not None:
+            _tracer.complete(
+                "advert", started, ended, decision,
+                address=tracked.address, rssi=rssi, state=proximity, far_count=self.consecutive_far_count
+            )
+            _tracer.set_current(None)
     
+    def check_absence(self, now=None):
+        """Take devices silent past their deadline as FAR; returns seconds until the next check, or None"""
+        watchdog = self.watchdog
+        if watchdog is None:
+            return None
+        now = perf_counter() if now is None else now
+        for tracked, silent_since in watchdog.expire(now):
+            self._on_silence(tracked, silent_since, now)
+        return watchdog.next_deadline(now)
+
+    def _on_silence(self, tracked, silent_since, now):
+        group = self.group
+        if tracked not in group.devices:
+            # Swapped out by a target change since the watchdog fired
+            return
+        _absences.inc()
+        decision = _tracer.new_decision() if _tracer.enabled else None
+        _log.info("No adverts from {} for {:.1f}s | Taking it as FAR", tracked.address or tracked.name, now - silent_since)
+        # The smoothed RSSI from before the silence says nothing about where the device is now
+        tracked.rssi_filter.reset()
+        group.observe(tracked, None, None, now)
+        state = group.state
+        hysteresis = self.hysteresis
+        if hysteresis is not None:
+            if state == FAR:
+                # FAR has held since the last advert, not since the watchdog noticed
+                hysteresis.backdate(FAR, silent_since)
+            state = hysteresis.update(state, now)
+
+        if state == FAR:
+            # Each report is one missed reading: in count mode a silent device
+            # locks after consecutive_far_required silence limits
+            if self.consecutive_far_count == 0:
+                self.far_started = silent_since
+            self.consecutive_far_count += 1
+        proximity = PROXIMITY_NAMES[state]
+
+        self.proximity_callback(
+            proximity=proximity,
+            rssi=None,
+            consecutive_far_count=self.consecutive_far_count
+        )
+
+        self.last_proximity = proximity
+        if state != self.last_state:
+            self.last_state = state
+            if self.on_state_change is not None:
+                self.on_state_change(state)
+        if decision is not None:
+            _tracer.complete(
+                "absence", silent_since, perf_counter(), decision,
+                address=tracked.address, state=proximity, far_count=self.consecutive_far_count
+            )
+            _tracer.set_current(None)
+
     async def start(self):
-        target_address = self.config.target_address
-        target_name = self.config.target_name
-        if not target_address and not target_name:
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        if not len(self.group):
             return
-        self.scanner = BleakScanner(self._detection_callback)
+        
+        scanner_factory = self.scanner_factory
+        if scanner_factory is None:
+            scanner_factory = HubScanner
+        self.scanner = scanner_factory(self._detection_callback)
+        self._update_scan_filter(self.config.snapshot)
         await self.scanner.start()
     
+    def set_radio(self, wanted):
+        """Ask the scanner to listen (True) or rest (False); False if it cannot duty-cycle
+
+        While recording a trace the radio stays on, so the trace has no gaps.
+        """
+        set_wants_radio = getattr(self.scanner, "set_wants_radio", None)
+        if set_wants_radio is None or self.recorder is not None:
+            return False
+        set_wants_radio(wanted)
+        self.listening = wanted
+        if self.watchdog is not None:
+            # Nothing can be heard while the radio rests, so that time is not silence
+            self.watchdog.set_listening(wanted)
+        return True
+
     async def stop(self):
-        await self.scanner.stop()
+        self.config.unsubscribe(self._on_config_change)
+        try:
+            if self.scanner is not None:
+                await self.scanner.stop()
+        finally:
+            if self.recorder is not None:
+                self.recorder.flush()
     
     def get_consecutive_far_count(self):
         return self.consecutive_far_count
     
     def reset_consecutive_far_count(self):
+        if self.consecutive_far_count > 0:
+            _far_streaks.observe(self.consecutive_far_count)
         self.consecutive_far_count = 0
+        self.group.reset_far_counts()
+        if self.hysteresis is not None:
+            self.hysteresis.restart_far()
 
@@ -0,0 +1,465 @@
+"""One shared BLE scanner fanning adverts out to filtered subscribers"""
+import asyncio
+import threading
+import time
+from collections import deque
+
+from ble_trace import TraceDevice
+from metrics import get_metrics
+from tracing import get_tracer, now as trace_now
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+LATEST_PER_ADDRESS = "latest_per_address"
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, LATEST_PER_ADDRESS)
+
+_metrics = get_metrics()
+_hub_adverts = _metrics.counter("proxilock_scanner_adverts_total", "Adverts received from the BLE scanner").labels()
+_queue_drops = _metrics.counter(
+    "proxilock_subscriber_drops_total", "Adverts dropped or coalesced in full subscriber queues"
+).labels()
+scanner_restarts = _metrics.counter("proxilock_scanner_restarts_total", "BLE scanner restarts, by reason", ("reason",))
+_restarts_requested = scanner_restarts.labels("requested")
+_restarts_silence = scanner_restarts.labels("silence")
+_restarts_error = scanner_restarts.labels("error")
+_tracer = get_tracer()
+
+
+class ScanFilter:
+    """Matches adverts by address, device name or advertised service UUID
+
+    Each criterion given must match; a criterion left as None matches
+    everything. Address and name checks are set lookups.
+    """
+    __slots__ = ("addresses", "names", "service_uuids")
+
+    def __init__(self, addresses=None, names=None, service_uuids=None):
+        self.addresses = frozenset(addresses) if addresses is not None else None
+        self.names = frozenset(names) if names is not None else None
+        self.service_uuids = frozenset(u.lower() for u in service_uuids) if service_uuids is not None else None
+
+    def matches(self, device, advertisement_data):
+        if self.addresses is not None and device.address not in self.addresses:
+            return False
+        if self.names is not None and (device.name or "") not in self.names:
+            return False
+        if self.service_uuids is not None:
+            uuids = getattr(advertisement_data, "service_uuids", None) or ()
+            if not any(uuid.lower() in self.service_uuids for uuid in uuids):
+                return False
+        return True
+
+
+class Subscription:
+    """A subscriber's filter, bounded queue and drop policy
+
+    The hub thread only enqueues; the callback runs on the subscriber's
+    event loop (the hub's own loop if none was given), draining everything
+    queued since the last run in one batch. When the queue is full,
+    DROP_OLDEST discards the oldest advert, DROP_NEWEST the incoming one,
+    and LATEST_PER_ADDRESS keeps just the newest advert of each address.
+
+    wants_radio is True for a subscriber that needs the scanner running,
+    False while it is resting (see ScannerHub.set_wants_radio), and None
+    for one that takes adverts whenever someone else scans.
+    """
+
+    def __init__(self, hub, callback, scan_filter=None, max_queue=256, drop_policy=DROP_OLDEST, loop=None,
+                 wants_radio=True):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.hub = hub
+        self.callback = callback
+        self.scan_filter = scan_filter
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+        self.loop = loop
+        self.wants_radio = wants_radio
+        # dicts keep insertion order, so the first key is the oldest advert
+        self._queue = {} if drop_policy == LATEST_PER_ADDRESS else deque()
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._scheduled_at = 0.0
+        self.delivered = 0
+        self.dropped = 0
+
+    def offer(self, device, advertisement_data):
+        """Queue an advert (hub thread); returns False if it was dropped"""
+        with self._lock:
+            queue = self._queue
+            if self.drop_policy == LATEST_PER_ADDRESS:
+                address = device.address
+                if queue.pop(address, None) is not None:
+                    self.dropped += 1
+                    _queue_drops.inc()
+                elif len(queue) >= self.max_queue:
+                    del queue[next(iter(queue))]
+                    self.dropped += 1
+                    _queue_drops.inc()
+                queue[address] = (device, advertisement_data)
+            elif len(queue) >= self.max_queue:
+                self.dropped += 1
+                _queue_drops.inc()
+                if self.drop_policy == DROP_NEWEST:
+                    return False
+                queue.popleft()
+                queue.append((device, advertisement_data))
+            else:
+                queue.append((device, advertisement_data))
+
+            if self._scheduled:
+                return True
+            self._scheduled = True
+            if _tracer.enabled:
+                self._scheduled_at = trace_now()
+
+        try:
+            if self.loop is None:
+                # Offers arrive on the hub loop itself, so no cross-thread wakeup is needed
+                self.hub.loop.call_soon(self._drain)
+            else:
+                self.loop.call_soon_threadsafe(self._drain)
+        except (RuntimeError, AttributeError):
+            # The subscriber's loop has closed without unsubscribing
+            self.hub.unsubscribe(self)
+        return True
+
+    def pending(self):
+        with self._lock:
+            return len(self._queue)
+
+    def _drain(self):
+        with self._lock:
+            queue = self._queue
+            items = list(queue.values()) if self.drop_policy == LATEST_PER_ADDRESS else list(queue)
+            queue.clear()
+            self._scheduled = False
+            scheduled_at = self._scheduled_at
+            self._scheduled_at = 0.0
+
+        if scheduled_at and _tracer.enabled:
+            # Time the first advert of the batch waited for the subscriber's loop
+            _tracer.complete("hub_queue_wait", scheduled_at, trace_now(), adverts=len(items))
+
+        callback = self.callback
+        for device, advertisement_data in items:
+            try:
+                callback(device, advertisement_data)
+            except Exception as e:
+                print(f"Scanner subscriber error: {e}")
+        self.delivered += len(items)
+
+
+class ScannerHub:
+    """Owns the only BLE scanner and dispatches its adverts to subscribers
+
+    The scanner runs on the hub's own thread and event loop while anyone is
+    subscribed, and is restarted after silence_restart seconds without an
+    advert or on restart() (e.g. after wake). scanner_factory builds a
+    BleakScanner-like object from a detection callback.
+
+    The radio is on while any subscriber wants it, or while every
+    subscriber is indifferent; once all that care are resting, the scanner
+    is stopped but the thread stays up so resuming is cheap. radio_time()
+    reports how long it has been on.
+    """
+
+    def __init__(self, scanner_factory=None, silence_restart=30.0):
+        self.scanner_factory = scanner_factory
+        self.silence_restart = silence_restart
+        self.loop = None
+        self.scanner = None
+        self._subscribers = ()
+        self._mutex = threading.Lock()
+        self._thread = None
+        self._stop_event = None
+        self._restart_event = None
+        self._radio_event = None
+        self._radio_since = None
+        self._radio_seconds = 0.0
+        self._ready = threading.Event()
+        self._last_advert = 0.0
+        self.advert_count = 0
+        self.scanner_starts = 0
+
+    def subscribe(self, callback, scan_filter=None, max_queue=256, drop_policy=DROP_OLDEST, loop=None,
+                  wants_radio=True):
+        """Register callback(device, advertisement_data); starts the scanner if needed"""
+        subscription = Subscription(self, callback, scan_filter, max_queue, drop_policy, loop, wants_radio)
+        with self._mutex:
+            self._subscribers = self._subscribers + (subscription,)
+            self._ensure_running()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscription; the scanner stops with the last one"""
+        with self._mutex:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscription)
+            idle = not self._subscribers
+        if idle:
+            self.stop()
+
+    @property
+    def subscribers(self):
+        return self._subscribers
+
+    def set_wants_radio(self, subscription, wants_radio):
+        """Let a subscriber rest the radio (False) or need it again (True)"""
+        if subscription.wants_radio == wants_radio:
+            return
+        subscription.wants_radio = wants_radio
+        loop = self.loop
+        radio_event = self._radio_event
+        if loop is not None and radio_event is not None:
+            try:
+                loop.call_soon_threadsafe(radio_event.set)
+            except RuntimeError:
+                pass
+
+    def radio_wanted(self):
+        wants = [s.wants_radio for s in self._subscribers if s.wants_radio is not None]
+        return any(wants) or not wants
+
+    def radio_time(self):
+        """Seconds the scanner has been running since the hub was created"""
+        since = self._radio_since
+        return self._radio_seconds + (time.monotonic() - since if since is not None else 0.0)
+
+    def _on_advert(self, device, advertisement_data):
+        self.advert_count += 1
+        _hub_adverts.inc()
+        self._last_advert = time.monotonic()
+        for subscription in self._subscribers:
+            scan_filter = subscription.scan_filter
+            if scan_filter is None or scan_filter.matches(device, advertisement_data):
+                subscription.offer(device, advertisement_data)
+
+    def _ensure_running(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._thread_main, daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=2.0)
+
+    def restart(self):
+        """Restart the underlying scanner (e.g. after the system wakes)"""
+        loop = self.loop
+        if loop is not None and self._restart_event is not None:
+            loop.call_soon_threadsafe(self._restart_event.set)
+
+    def stop(self):
+        with self._mutex:
+            thread = self._thread
+            loop = self.loop
+            stop_event = self._stop_event
+            if thread is None:
+                return
+            self._thread = None
+        if loop is not None and stop_event is not None:
+            try:
+                loop.call_soon_threadsafe(stop_event.set)
+            except RuntimeError:
+                pass
+        if thread is not threading.current_thread():
+            thread.join(timeout=3.0)
+
+    def _thread_main(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._run())
+        except Exception as e:
+            print(f"Scanner hub error: {e}")
+        finally:
+            if self.loop is loop:
+                self.loop = None
+            loop.close()
+
+    async def _start_scanner(self):
+        factory = self.scanner_factory
+        if factory is None:
+            from bleak import BleakScanner
+            factory = BleakScanner
+        scanner = factory(self._on_advert)
+        await scanner.start()
+        self.scanner = scanner
+        self.scanner_starts += 1
+        self._last_advert = self._radio_since = time.monotonic()
+        return scanner
+
+    async def _stop_scanner(self, scanner):
+        if self.scanner is scanner:
+            self.scanner = None
+            if self._radio_since is not None:
+                self._radio_seconds += time.monotonic() - self._radio_since
+                self._radio_since = None
+        try:
+            await scanner.stop()
+        except Exception as e:
+            print(f"Error stopping BLE scanner: {e}")
+
+    async def _run(self):
+        # Events are local to this run so a hub restarted quickly never mixes them up
+        stop_event = asyncio.Event()
+        restart_event = asyncio.Event()
+        radio_event = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        self._stop_event = stop_event
+        self._restart_event = restart_event
+        self._radio_event = radio_event
+        self._ready.set()
+
+        scanner = None
+        resting = False
+        try:
+            while not stop_event.is_set():
+                try:
+                    radio_event.clear()
+                    wanted = self.radio_wanted()
+                    if scanner is None and wanted:
+                        scanner = await self._start_scanner()
+                        if not resting:
+                            print("BLE scanner started")
+                        resting = False
+                    elif scanner is not None and not wanted:
+                        # Duty-cycled off: stop the radio but keep the thread and loop
+                        stale, scanner = scanner, None
+                        await self._stop_scanner(stale)
+                        resting = True
+
+                    waiters = [asyncio.ensure_future(e.wait()) for e in (restart_event, stop_event, radio_event)]
+                    # While resting there is no silence to watch for, so sleep until told otherwise
+                    timeout = 1.0 if scanner is not None else None
+                    await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                    for waiter in waiters:
+                        waiter.cancel()
+
+                    if stop_event.is_set():
+                        break
+                    if scanner is None:
+                        restart_event.clear()
+                        continue
+                    if restart_event.is_set():
+                        restart_event.clear()
+                        print("Restarting BLE scanner...")
+                        _restarts_requested.inc()
+                    elif time.monotonic() - self._last_advert > self.silence_restart:
+                        print(f"No devices detected for {self.silence_restart:.0f}s, restarting scanner...")
+                        _restarts_silence.inc()
+                    else:
+                        continue
+                    stale, scanner = scanner, None
+                    await self._stop_scanner(stale)
+                    await asyncio.sleep(1.0)
+                except Exception as e:
+                    print(f"BLE scanner error: {e}")
+                    _restarts_error.inc()
+                    if scanner is not None:
+                        stale, scanner = scanner, None
+                        await self._stop_scanner(stale)
+                    await asyncio.sleep(2.0)
+        finally:
+            if scanner is not None:
+                await self._stop_scanner(scanner)
+
+
+class HubScanner:
+    """BleakScanner-shaped view of the shared hub for code that expects its own scanner
+
+    Callbacks run on the event loop that called start().
+    """
+
+    def __init__(self, detection_callback, hub=None, scan_filter=None, max_queue=256, drop_policy=DROP_OLDEST):
+        self.detection_callback = detection_callback
+        self.hub = hub
+        self.scan_filter = scan_filter
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+        self.wants_radio = True
+        self.subscription = None
+
+    async def start(self):
+        hub = self.hub or get_scanner_hub()
+        self.subscription = hub.subscribe(
+            self.detection_callback,
+            scan_filter=self.scan_filter,
+            max_queue=self.max_queue,
+            drop_policy=self.drop_policy,
+            loop=asyncio.get_running_loop(),
+            wants_radio=self.wants_radio
+        )
+
+    async def stop(self):
+        if self.subscription is not None:
+            self.subscription.hub.unsubscribe(self.subscription)
+            self.subscription = None
+
+    def set_filter(self, scan_filter):
+        self.scan_filter = scan_filter
+        if self.subscription is not None:
+            self.subscription.scan_filter = scan_filter
+
+    def set_wants_radio(self, wants_radio):
+        self.wants_radio = wants_radio
+        if self.subscription is not None:
+            self.subscription.hub.set_wants_radio(self.subscription, wants_radio)
+
+
+class FakeAdvertisement:
+    """Stand-in for bleak's AdvertisementData"""
+    __slots__ = ("rssi", "tx_power", "manufacturer_data", "service_uuids", "local_name")
+
+    def __init__(self, rssi, tx_power=None, manufacturer_data=None, service_uuids=(), local_name=None):
+        self.rssi = rssi
+        self.tx_power = tx_power
+        self.manufacturer_data = manufacturer_data or {}
+        self.service_uuids = list(service_uuids)
+        self.local_name = local_name
+
+
+class FakeBleScanner:
+    """In-memory scanner backend for Linux tests and benchmarks
+
+    emit() builds fresh device/advertisement objects on every call, the
+    way a real backend decodes each advert, and may be called from any
+    thread; emit_now() delivers synchronously and must run on the hub loop.
+    """
+
+    def __init__(self, detection_callback):
+        self.detection_callback = detection_callback
+        self.running = False
+        self._loop = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.running = True
+
+    async def stop(self):
+        self.running = False
+
+    def emit_now(self, address, rssi, name=None, service_uuids=()):
+        if self.running:
+            self.detection_callback(TraceDevice(address, name), FakeAdvertisement(rssi, service_uuids=service_uuids))
+
+    def emit(self, address, rssi, name=None, service_uuids=()):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.emit_now, address, rssi, name, service_uuids)
+
+
+_hub = None
+
+
+def get_scanner_hub():
+    global _hub
+    if _hub is None:
+        _hub = ScannerHub()
+    return _hub
+
+
+def set_scanner_hub(hub):
+    """Swap the process-wide hub (e.g. one backed by FakeBleScanner on Linux)"""
+    global _hub
+    if _hub is not None and _hub is not hub:
+        _hub.stop()
+    _hub = hub
@@ -0,0 +1,369 @@
+"""AppleScript execution through a warm, long-lived interpreter process"""
+import asyncio
+import itertools
+import json
+import subprocess
+import sys
+import threading
+
+from metrics import count_spawn, time_spawn
+
+# JXA host: reads {"id", "script"} JSON lines on stdin, runs each script with
+# NSAppleScript and answers {"id", "ok", "result"|"error"} on stdout.
+JXA_HOST = r"""
+ObjC.import('Foundation');
+var stdin = $.NSFileHandle.fileHandleWithStandardInput;
+var stdout = $.NSFileHandle.fileHandleWithStandardOutput;
+function send(message) {
+    var line = $(JSON.stringify(message) + '\n');
+    stdout.writeData(line.dataUsingEncoding($.NSUTF8StringEncoding));
+}
+function run(request) {
+    var error = Ref();
+    var script = $.NSAppleScript.alloc.initWithSource(request.script);
+    var descriptor = script.executeAndReturnError(error);
+    if (error[0] && !error[0].isNil()) {
+        var message = error[0].objectForKey('NSAppleScriptErrorMessage');
+        return {id: request.id, ok: false, error: message.isNil() ? 'AppleScript error' : ObjC.unwrap(message)};
+    }
+    if (descriptor.isNil()) {
+        return {id: request.id, ok: true, result: ''};
+    }
+    var text = descriptor.stringValue;
+    var result = (text && !text.isNil()) ? ObjC.unwrap(text) : String(descriptor.booleanValue);
+    return {id: request.id, ok: true, result: result};
+}
+var buffer = '';
+while (true) {
+    var data = stdin.availableData;
+    if (data.length == 0) { break; }
+    buffer += ObjC.unwrap($.NSString.alloc.initWithDataEncoding(data, $.NSUTF8StringEncoding));
+    var newline;
+    while ((newline = buffer.indexOf('\n')) >= 0) {
+        var line = buffer.slice(0, newline);
+        buffer = buffer.slice(newline + 1);
+        if (line.length == 0) { continue; }
+        var request = JSON.parse(line);
+        try {
+            send(run(request));
+        } catch (e) {
+            send({id: request.id, ok: false, error: String(e)});
+        }
+    }
+}
+"""
+
+# Stand-in interpreter speaking the same protocol, for Linux tests and
+# benchmarks. A script "sleep S" waits S seconds, "error MSG" fails with
+# MSG, "crash" exits, and anything else is echoed back as the result.
+# Given the script as an argument it runs it once, like `osascript -e`.
+STAND_IN_HOST = r"""
+import json, sys, time
+def run(script):
+    if script.startswith("sleep "):
+        time.sleep(float(script.split()[1]))
+        return True, ""
+    if script.startswith("error "):
+        return False, script[6:]
+    if script == "crash":
+        sys.exit(3)
+    return True, script
+if len(sys.argv) > 1:
+    ok, text = run(sys.argv[1])
+    (sys.stdout if ok else sys.stderr).write(text + "\n")
+    sys.exit(0 if ok else 1)
+for line in sys.stdin:
+    if not line.strip():
+        continue
+    request = json.loads(line)
+    ok, text = run(request["script"])
+    message = {"id": request["id"], "ok": ok}
+    message["result" if ok else "error"] = text
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+"""
+
+
+def osascript_host_command():
+    return ["osascript", "-l", "JavaScript", "-e", JXA_HOST]
+
+
+def stand_in_host_command():
+    return [sys.executable, "-c", STAND_IN_HOST]
+
+
+class SubprocessScriptRunner:
+    """Cold path: one fresh interpreter per script (the original behaviour)"""
+
+    def __init__(self, command=("osascript", "-e")):
+        self.command = list(command)
+
+    def run(self, script, timeout):
+        with time_spawn("osascript"):
+            result = subprocess.run(
+                self.command + [script],
+                check=True,
+                capture_output=True,
+                timeout=timeout
+            )
+        return result.stdout.decode("utf-8", errors="ignore").strip()
+
+    def close(self):
+        pass
+
+
+class _PendingRequest:
+    __slots__ = ("event", "ok", "text")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.ok = False
+        self.text = ""
+
+
+class PersistentScriptRunner:
+    """Keeps one interpreter process warm and multiplexes requests over its pipes
+
+    Each request carries an ID so late answers to timed-out requests are
+    ignored. A timeout kills the host (an AppleScript in flight cannot be
+    interrupted) and, like a crash, the host is respawned on the next run.
+    Failures are raised as the same subprocess exceptions the cold path
+    raises, so callers handle both identically.
+    """
+
+    def __init__(self, command=None):
+        self.command = list(command or osascript_host_command())
+        self._process = None
+        self._reader = None
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.spawn_count = 0
+
+    def _ensure_process(self):
+        process = self._process
+        if process is not None and process.poll() is None:
+            return process
+
+        process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1
+        )
+        self._process = process
+        self.spawn_count += 1
+        count_spawn("osascript-host")
+        self._reader = threading.Thread(target=self._read_responses, args=(process,), daemon=True)
+        self._reader.start()
+        return process
+
+    def _read_responses(self, process):
+        for line in process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            with self._lock:
+                entry = self._pending.pop(message.get("id"), None)
+            if entry is None:
+                continue
+            pending = entry[1]
+            pending.ok = bool(message.get("ok"))
+            pending.text = message.get("result" if pending.ok else "error") or ""
+            pending.event.set()
+
+        # Host exited: fail everything still waiting on it
+        with self._lock:
+            if self._process is process:
+                self._process = None
+            orphaned = [entry[1] for entry in self._pending.values() if entry[0] is process]
+            self._pending = {
+                request_id: entry for request_id, entry in self._pending.items() if entry[0] is not process
+            }
+        for pending in orphaned:
+            pending.ok = False
+            pending.text = "script host exited"
+            pending.event.set()
+
+    def run(self, script, timeout):
+        pending = _PendingRequest()
+        with self._lock:
+            process = self._ensure_process()
+            request_id = next(self._ids)
+            self._pending[request_id] = (process, pending)
+            try:
+                process.stdin.write(json.dumps({"id": request_id, "script": script}) + "\n")
+                process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                self._pending.pop(request_id, None)
+                self._process = None
+                raise subprocess.CalledProcessError(1, self.command, stderr=str(e).encode())
+
+        if not pending.event.wait(timeout):
+            with self._lock:
+                self._pending.pop(request_id, None)
+                if self._process is process:
+                    self._process = None
+            process.kill()
+            raise subprocess.TimeoutExpired(self.command, timeout)
+
+        if not pending.ok:
+            raise subprocess.CalledProcessError(1, self.command, stderr=pending.text.encode("utf-8"))
+        return pending.text.strip()
+
+    def close(self):
+        with self._lock:
+            process = self._process
+            self._process = None
+        if process is not None:
+            try:
+                process.stdin.close()
+                process.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                process.kill()
+
+
+class AsyncPersistentScriptRunner:
+    """asyncio counterpart of PersistentScriptRunner, bound to one event loop
+
+    Uses asyncio subprocess pipes, so awaiting a script never blocks the
+    loop or needs a thread. Cancelling or timing out a request kills the
+    host, which is respawned on the next run.
+    """
+
+    def __init__(self, command=None):
+        self.command = list(command or osascript_host_command())
+        self._process = None
+        self._reader = None
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._write_lock = None
+        self.spawn_count = 0
+
+    async def _ensure_process(self):
+        process = self._process
+        if process is not None and process.returncode is None:
+            return process
+
+        process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        self._process = process
+        self.spawn_count += 1
+        count_spawn("osascript-host")
+        self._reader = asyncio.get_running_loop().create_task(self._read_responses(process))
+        return process
+
+    async def _read_responses(self, process):
+        try:
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                entry = self._pending.pop(message.get("id"), None)
+                if entry is None or entry[1].done():
+                    continue
+                entry[1].set_result((bool(message.get("ok")), message.get("result") or message.get("error") or ""))
+        finally:
+            if self._process is process:
+                self._process = None
+            for request_id, (owner, future) in list(self._pending.items()):
+                if owner is process:
+                    del self._pending[request_id]
+                    if not future.done():
+                        future.set_result((False, "script host exited"))
+
+    def _kill(self, process):
+        if self._process is process:
+            self._process = None
+        if process.returncode is None:
+            process.kill()
+
+    async def run(self, script, timeout):
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+
+        future = asyncio.get_running_loop().create_future()
+        async with self._write_lock:
+            process = await self._ensure_process()
+            request_id = next(self._ids)
+            self._pending[request_id] = (process, future)
+            try:
+                process.stdin.write((json.dumps({"id": request_id, "script": script}) + "\n").encode("utf-8"))
+                await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError, OSError) as e:
+                self._pending.pop(request_id, None)
+                self._kill(process)
+                raise subprocess.CalledProcessError(1, self.command, stderr=str(e).encode())
+
+        try:
+            ok, text = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(request_id, None)
+            self._kill(process)
+            raise subprocess.TimeoutExpired(self.command, timeout)
+        except asyncio.CancelledError:
+            # The AppleScript in flight cannot be interrupted; drop the host instead
+            self._pending.pop(request_id, None)
+            self._kill(process)
+            raise
+
+        if not ok:
+            raise subprocess.CalledProcessError(1, self.command, stderr=text.encode("utf-8"))
+        return text.strip()
+
+    async def close(self):
+        process = self._process
+        self._process = None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+            await asyncio.wait_for(process.wait(), 1)
+        except (OSError, asyncio.TimeoutError):
+            process.kill()
+
+
+_runner = None
+
+
+def get_script_runner():
+    global _runner
+    if _runner is None:
+        _runner = PersistentScriptRunner()
+    return _runner
+
+
+def set_script_runner(runner):
+    """Swap the process-wide runner (e.g. a stand-in host on Linux)"""
+    global _runner
+    if _runner is not None and _runner is not runner:
+        _runner.close()
+    _runner = runner
+
+
+def run_applescript(script, timeout):
+    """Run AppleScript source, returning its result as a string
+
+    Raises subprocess.CalledProcessError on script errors (stderr holds the
+    message), subprocess.TimeoutExpired on timeout and FileNotFoundError
+    when no interpreter is available. If the warm host cannot be started
+    the script falls back to a one-off osascript process.
+    """
+    runner = get_script_runner()
+    try:
+        return runner.run(script, timeout)
+    except FileNotFoundError:
+        if isinstance(runner, SubprocessScriptRunner):
+            raise
+        return SubprocessScriptRunner().run(script, timeout)
@@ -0,0 +1,181 @@
+"""Unlock password retrieval with a short-lived, zeroable in-memory cache"""
+import getpass
+import os
+import subprocess
+import threading
+import time
+
+from config import get_config
+from metrics import time_spawn
+
+
+class KeychainSecretBackend:
+    """Reads the password from the login keychain with the `security` CLI"""
+
+    def fetch(self):
+        try:
+            with time_spawn("security"):
+                result = subprocess.run([
+                    "security",
+                    "find-generic-password",
+                    "-w",
+                    "-a", getpass.getuser(),
+                    "-s", get_config().keychain_item
+                ], check=True, capture_output=True, timeout=2)
+            return bytearray(result.stdout.strip())
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+            return None
+
+
+class EnvSecretBackend:
+    """Stand-in for Linux tests: password from an environment variable"""
+
+    def __init__(self, variable="PROXI_LOCK_PASSWORD"):
+        self.variable = variable
+
+    def fetch(self):
+        value = os.environ.get(self.variable)
+        return bytearray(value.encode("utf-8")) if value else None
+
+
+class FileSecretBackend:
+    """Stand-in for Linux tests: password from the first line of a file"""
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+    def fetch(self):
+        try:
+            with open(self.path, "rb") as f:
+                value = f.readline().rstrip(b"\r\n")
+        except OSError:
+            return None
+        return bytearray(value) if value else None
+
+
+def _zero(buffer):
+    for i in range(len(buffer)):
+        buffer[i] = 0
+
+
+class SecretProvider:
+    """Caches the password between a script lock and the following unlock
+
+    prefetch() loads the password into a bytearray when the script locks
+    the screen, so unlocking does not pay for a keychain lookup. The buffer
+    is zeroed as soon as take() hands it out, when the TTL expires, or on
+    invalidate(). The str returned by take() is immutable and cannot be
+    wiped; callers should drop it promptly.
+    """
+
+    def __init__(self, backend, ttl=900.0):
+        self.backend = backend
+        self.ttl = ttl
+        self._buffer = None
+        self._expires_at = 0.0
+        self._timer = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.fetch_count = 0
+
+    def _fetch(self):
+        self.fetch_count += 1
+        return self.backend.fetch()
+
+    def prefetch(self, blocking=False):
+        """Load the password into the cache, in the background unless blocking"""
+        if not blocking:
+            threading.Thread(target=self.prefetch, args=(True,), daemon=True).start()
+            return
+
+        with self._lock:
+            generation = self._generation
+        secret = self._fetch()
+        if secret is None:
+            return
+
+        with self._lock:
+            if generation != self._generation:
+                # Invalidated while fetching (e.g. password changed); drop the stale value
+                _zero(secret)
+                return
+            self._clear_locked()
+            self._buffer = secret
+            self._expires_at = time.monotonic() + self.ttl
+            self._timer = threading.Timer(self.ttl, self._expire, args=(secret,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def take_cached(self):
+        """Return the cached password and wipe the cache, or None without fetching"""
+        with self._lock:
+            buffer = self._buffer
+            password = None
+            if buffer is not None and time.monotonic() < self._expires_at:
+                password = buffer.decode("utf-8", errors="replace")
+            self._clear_locked()
+            return password
+
+    def take(self):
+        """Return the password (cached if available) and wipe the cache"""
+        password = self.take_cached()
+        if password is not None:
+            return password
+
+        secret = self._fetch()
+        if secret is None:
+            return None
+        password = secret.decode("utf-8", errors="replace")
+        _zero(secret)
+        return password
+
+    def invalidate(self):
+        """Wipe the cache; any prefetch still in flight is discarded"""
+        with self._lock:
+            self._generation += 1
+            self._clear_locked()
+
+    def is_cached(self):
+        with self._lock:
+            return self._buffer is not None and time.monotonic() < self._expires_at
+
+    def _expire(self, secret):
+        with self._lock:
+            if self._buffer is secret:
+                self._clear_locked()
+
+    def _clear_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._buffer is not None:
+            _zero(self._buffer)
+            self._buffer = None
+        self._expires_at = 0.0
+
+
+_provider = None
+
+
+def _on_config_change(snapshot, changed):
+    if "password_cache_ttl" in changed and _provider is not None:
+        _provider.ttl = snapshot.password_cache_ttl
+    if "keychain_item" in changed and _provider is not None:
+        _provider.invalidate()
+
+
+def get_secret_provider():
+    global _provider
+    if _provider is None:
+        config = get_config()
+        _provider = SecretProvider(KeychainSecretBackend(), ttl=config.password_cache_ttl)
+        config.subscribe(_on_config_change)
+    return _provider
+
+
+def set_secret_provider(provider):
+    """Swap the process-wide provider (e.g. an EnvSecretBackend on Linux)"""
+    global _provider
+    if _provider is not None and _provider is not provider:
+        _provider.invalidate()
+    _provider = provider
@@ -37,6 +37,25 @@ OPTIONS = {
         'main',
         'native_dialogs',
         'sleep_watcher',
+        'ble_trace',
+        'filters',
+        'lock_state',
+        'script_executor',
+        'secret_provider',
+        'action_executor',
+        'async_lock_manager',
+        'device_table',
+        'menu_model',
+        'scanner_hub',
+        'device_group',
+        'duty_cycle',
+        'metrics',
+        'ring_log',
+        'tracing',
+        'distance',
+        'predictor',
+        'hysteresis',
+        'absence',
     ],
     'includes': [
         'rumps',
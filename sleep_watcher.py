@@ -1,16 +1,21 @@
 """Sleep/wake event detection using NSWorkspace notifications"""
-from AppKit import NSWorkspace, NSObject
-from Foundation import NSLog
 import time
 
-class SleepWatcher(NSObject):
-    def receiveSleepNote_(self, notification):
-        NSLog("Mac is going to sleep")
-        on_system_sleep()
-    
-    def receiveWakeNote_(self, notification):
-        NSLog("Mac woke up")
-        on_system_wake()
+try:
+    from AppKit import NSWorkspace, NSObject
+    from Foundation import NSLog
+except ImportError:
+    # Not on macOS (e.g. replaying traces on Linux); wake events are never delivered
+    NSWorkspace = None
+else:
+    class SleepWatcher(NSObject):
+        def receiveSleepNote_(self, notification):
+            NSLog("Mac is going to sleep")
+            on_system_sleep()
+        
+        def receiveWakeNote_(self, notification):
+            NSLog("Mac woke up")
+            on_system_wake()
 
 _watcher = None
 _sleep_time = 0
@@ -47,7 +52,7 @@ def get_time_since_wake():
 def setup_sleep_watcher():
     global _watcher
     
-    if _watcher is not None:
+    if _watcher is not None or NSWorkspace is None:
         return  
     workspace = NSWorkspace.sharedWorkspace()
     center = workspace.notificationCenter()
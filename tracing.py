@@ -0,0 +1,249 @@
+"""Per-decision span tracing written as a Chrome trace (chrome://tracing, ui.perfetto.dev)
+
+Every target advert gets a decision ID in ProximityScanner; the ID rides
+along on the thread that handles the advert and on the ActionExecutor
+intent it submits, so the spans for the FAR window, the queue wait and
+each lock/unlock stage carry the ID of the advert that triggered them,
+and a flow arrow links the decision to the action on the worker thread.
+
+Tracing is off unless trace_path is set in ProxiLockConfig, and can be
+switched on and off while running. Off, callers pay one attribute check
+(tracer.enabled) or, for span(), a call returning a shared no-op.
+"""
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+CATEGORY = "proxilock"
+
+# Chrome trace timestamps are microseconds; perf_counter is the time base
+_MICROS = 1_000_000
+
+
+def now():
+    return time.perf_counter()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "decision", "started")
+
+    def __init__(self, tracer, name, args, decision):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.decision = decision
+
+    def __enter__(self):
+        self.started = now()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.complete(self.name, self.started, now(), self.decision, **self.args)
+        return False
+
+    def set(self, **args):
+        """Attach results known only inside the span (e.g. whether it succeeded)"""
+        self.args.update(args)
+
+
+class TraceWriter:
+    """Appends events to a JSON array file, one compact object per line
+
+    The closing bracket is never written: the trace event format allows it
+    to be missing, so the file stays valid however the process ends.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._file.write("[\n")
+
+    def write(self, events):
+        self._file.write("".join(json.dumps(e, separators=(",", ":")) + ",\n" for e in events))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class Tracer:
+    """Collects spans in memory and hands them to a writer thread every flush_interval seconds"""
+
+    def __init__(self, flush_interval=1.0):
+        self.enabled = False
+        self.flush_interval = flush_interval
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._events = deque()
+        self._writer = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread_names = {}
+        self._pid = os.getpid()
+
+    def start(self, path):
+        """Start (or restart) writing a new trace to path"""
+        self.stop()
+        with self._lock:
+            self._writer = TraceWriter(path)
+            self._thread_names = {}
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="tracing", daemon=True)
+            self._thread.start()
+            self.enabled = True
+        print(f"Tracing decisions to {self._writer.path}")
+
+    def stop(self):
+        with self._lock:
+            self.enabled = False
+            thread = self._thread
+            self._thread = None
+            self._stop.set()
+        if thread is not None:
+            thread.join(timeout=2.0)
+        with self._lock:
+            if self._writer is not None:
+                self._flush()
+                self._writer.close()
+                self._writer = None
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            with self._lock:
+                self._flush()
+
+    def _flush(self):
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        if events and self._writer is not None:
+            try:
+                self._writer.write(events)
+            except OSError as e:
+                print(f"Trace write failed: {e}")
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    # Decisions
+
+    def new_decision(self):
+        """Allocate a decision ID and make it current on this thread"""
+        decision = next(self._ids)
+        self._local.decision = decision
+        return decision
+
+    def current(self):
+        return getattr(self._local, "decision", None)
+
+    def set_current(self, decision):
+        self._local.decision = decision
+
+    # Events
+
+    def _tid(self):
+        ident = threading.get_ident()
+        if ident not in self._thread_names:
+            name = threading.current_thread().name
+            self._thread_names[ident] = name
+            self._events.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": ident,
+                                 "args": {"name": name}})
+        return ident
+
+    def span(self, name, decision=None, **args):
+        """Context manager timing a stage under decision, by default this thread's current one
+
+        Pass decision explicitly where the stage runs on an event loop
+        shared by many decisions (async_lock_manager on the monitor loop).
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args, self.current() if decision is None else decision)
+
+    def complete(self, name, started, ended, decision=None, **args):
+        """Record a span from perf_counter times started to ended"""
+        if not self.enabled:
+            return
+        if decision is not None:
+            args["decision"] = decision
+        self._events.append({
+            "name": name, "cat": CATEGORY, "ph": "X", "pid": self._pid, "tid": self._tid(),
+            "ts": started * _MICROS, "dur": (ended - started) * _MICROS, "args": args,
+        })
+
+    def instant(self, name, decision=None, **args):
+        if not self.enabled:
+            return
+        if decision is not None:
+            args["decision"] = decision
+        self._events.append({
+            "name": name, "cat": CATEGORY, "ph": "i", "s": "t", "pid": self._pid, "tid": self._tid(),
+            "ts": now() * _MICROS, "args": args,
+        })
+
+    def flow_start(self, decision, at=None):
+        """Start of an arrow from this thread to wherever flow_end(decision) is called"""
+        if self.enabled and decision is not None:
+            self._events.append({"name": "decision", "cat": CATEGORY, "ph": "s", "id": decision,
+                                 "pid": self._pid, "tid": self._tid(), "ts": (at or now()) * _MICROS})
+
+    def flow_end(self, decision, at=None):
+        if self.enabled and decision is not None:
+            self._events.append({"name": "decision", "cat": CATEGORY, "ph": "f", "bp": "e", "id": decision,
+                                 "pid": self._pid, "tid": self._tid(), "ts": (at or now()) * _MICROS})
+
+
+_tracer = Tracer()
+_configured = False
+
+
+def _apply(snapshot, changed):
+    if "trace_path" not in changed:
+        return
+    if snapshot.trace_path:
+        try:
+            _tracer.start(snapshot.trace_path)
+        except OSError as e:
+            print(f"Could not start tracing to {snapshot.trace_path}: {e}")
+    elif _tracer.enabled:
+        _tracer.stop()
+        print("Tracing stopped")
+
+
+def configure_tracing(snapshot):
+    """Follow trace_path: tracing runs while it is set"""
+    global _configured
+    if not _configured:
+        from config import get_config
+        get_config().subscribe(_apply)
+        _configured = True
+    if snapshot.trace_path and not _tracer.enabled:
+        _apply(snapshot, {"trace_path"})
+
+
+def get_tracer():
+    return _tracer
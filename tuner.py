@@ -0,0 +1,250 @@
+"""Offline threshold tuning over labelled advertisement traces
+
+A labelled trace is a ble_trace recording plus a sidecar JSON file
+(`<trace>.labels.json` by default) marking when the user was away:
+
+    {"address": "AA:BB:CC:DD:EE:FF", "away": [[120.0, 300.5], [900.0, 1250.0]]}
+
+Times are seconds from the first advert in the trace. Every candidate
+locking threshold and consecutive-FAR count is replayed through
+ProximityController and the consecutive-FAR lock logic, and the tuner
+picks the one with the lowest lock latency that stays within the
+false-lock budget and misses no absence. Only locking is scored: NEAR
+never unlocks (auto-unlock is not enabled), so the unlocking thresholds
+change nothing it could measure. Requires NumPy.
+
+    python tuner.py office.trace --budget 0.5
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from controller import FAR, ProximityController
+from filters import FILTER_KINDS, create_filter
+
+CONSECUTIVE_FAR_CHOICES = tuple(range(1, 11))
+RSSI_NEAR_CHOICES = (-20, -30, -40, -50, -60, -70, -80, -90, -100)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        sys.exit("tuner.py requires NumPy (pip install numpy)")
+    return numpy
+
+
+class LabelledTrace:
+    """RSSI samples from one device with ground-truth away intervals"""
+
+    def __init__(self, name, times, rssi, away):
+        np = _numpy()
+        self.name = name
+        self.times = np.asarray(times, dtype=np.float64)
+        self.rssi = np.asarray(rssi, dtype=np.float64)
+        self.away = [(float(start), float(end)) for start, end in away]
+
+        at_desk = np.ones(len(self.times), dtype=bool)
+        for start, end in self.away:
+            at_desk &= ~((self.times >= start) & (self.times < end))
+        self.at_desk = at_desk
+
+        if len(self.times):
+            span = float(self.times[-1] - self.times[0])
+            away_seconds = sum(min(end, self.times[-1]) - max(start, self.times[0]) for start, end in self.away)
+            self.desk_hours = max(span - away_seconds, 0.0) / 3600.0
+        else:
+            self.desk_hours = 0.0
+
+
+def load_labelled_trace(path, labels_path=None, rssi_filter="none"):
+    from ble_trace import read_trace
+
+    labels_path = labels_path or f"{path}.labels.json"
+    with open(labels_path, "r") as f:
+        labels = json.load(f)
+
+    adverts = list(read_trace(path))
+    if not adverts:
+        raise ValueError(f"{path} contains no advertisements")
+    start = adverts[0][1].timestamp
+
+    address = labels.get("address")
+    if address is None:
+        counts = {}
+        for device, _ in adverts:
+            counts[device.address] = counts.get(device.address, 0) + 1
+        address = max(counts, key=counts.get)
+
+    smoother = create_filter(rssi_filter)
+    times = []
+    rssi = []
+    for device, advertisement_data in adverts:
+        if device.address != address:
+            continue
+        times.append(advertisement_data.timestamp - start)
+        value = advertisement_data.rssi
+        rssi.append(float("nan") if value is None else smoother.update(value))
+
+    return LabelledTrace(os.path.basename(path), times, rssi, labels.get("away", []))
+
+
+def evaluate(trace, rssi_far, consecutive_far_choices):
+    """Replay one (threshold, N...) family over a trace
+
+    Returns {N: (false_locks, lock_latencies, missed_locks)}.
+    """
+    np = _numpy()
+    times = trace.times
+    # Where MID ends and NEAR begins does not affect locking
+    states = np.asarray(ProximityController(rssi_far, rssi_far, rssi_far).classify_batch(trace.rssi))
+    is_far = states == FAR
+
+    # Position of each sample inside its run of consecutive FAR readings
+    index = np.arange(len(states))
+    last_break = np.maximum.accumulate(np.where(is_far, -1, index))
+    run_position = index - last_break
+
+    results = {}
+    for required in consecutive_far_choices:
+        # The counter resets after every lock, so a lock fires at every multiple of N
+        fired = is_far & (run_position % required == 0)
+        false_locks = int(np.count_nonzero(fired & trace.at_desk))
+        lock_times = times[fired]
+
+        lock_latencies = []
+        missed = 0
+        for start, end in trace.away:
+            i = np.searchsorted(lock_times, start)
+            if i >= len(lock_times) or lock_times[i] >= end:
+                missed += 1
+                continue
+            lock_latencies.append(lock_times[i] - start)
+
+        results[required] = (false_locks, lock_latencies, missed)
+    return results
+
+
+_worker_traces = None
+
+
+def _init_worker(traces):
+    global _worker_traces
+    _worker_traces = traces
+
+
+def _evaluate_thresholds(thresholds, consecutive_far_choices):
+    """Evaluate locking thresholds over every trace"""
+    candidates = []
+    desk_hours = sum(trace.desk_hours for trace in _worker_traces)
+    for rssi_far in thresholds:
+        totals = {n: [0, [], 0] for n in consecutive_far_choices}
+        for trace in _worker_traces:
+            for required, (false_locks, lock_lat, missed) in evaluate(trace, rssi_far, consecutive_far_choices).items():
+                total = totals[required]
+                total[0] += false_locks
+                total[1].extend(lock_lat)
+                total[2] += missed
+
+        for required, (false_locks, lock_lat, missed) in totals.items():
+            candidates.append({
+                "rssi_far": rssi_far,
+                "consecutive_far_required": required,
+                "false_locks_per_hour": false_locks / desk_hours if desk_hours else float(false_locks),
+                "mean_lock_latency": sum(lock_lat) / len(lock_lat) if lock_lat else float("inf"),
+                "max_lock_latency": max(lock_lat) if lock_lat else float("inf"),
+                "missed_locks": missed,
+            })
+    return candidates
+
+
+def threshold_grid(far_range=(-100, -40), step=1):
+    """Every locking threshold in far_range that leaves a menu value for rssi_near above it"""
+    low, high = far_range
+    return [rssi_far for rssi_far in range(low, high + 1, step) if rssi_far < max(RSSI_NEAR_CHOICES)]
+
+
+def tune(traces, false_lock_budget=0.5, step=1, far_range=(-100, -40),
+         consecutive_far_choices=CONSECUTIVE_FAR_CHOICES, workers=None):
+    """Return (best candidate or None, all candidates sorted best first)"""
+    thresholds = threshold_grid(far_range, step)
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, len(thresholds) // (workers * 4))
+    chunks = [thresholds[i:i + chunk_size] for i in range(0, len(thresholds), chunk_size)]
+
+    candidates = []
+    if workers == 1:
+        _init_worker(traces)
+        for chunk in chunks:
+            candidates.extend(_evaluate_thresholds(chunk, consecutive_far_choices))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(traces,)) as pool:
+            futures = [pool.submit(_evaluate_thresholds, chunk, consecutive_far_choices) for chunk in chunks]
+            for future in futures:
+                candidates.extend(future.result())
+
+    def rank(c):
+        feasible = c["false_locks_per_hour"] <= false_lock_budget and c["missed_locks"] == 0
+        return (not feasible, c["mean_lock_latency"], c["false_locks_per_hour"])
+
+    candidates.sort(key=rank)
+    best = candidates[0] if candidates and not rank(candidates[0])[0] else None
+    return best, candidates
+
+
+def _print_candidates(candidates, limit):
+    print(f"{'far':>5} {'N':>3} {'FL/h':>7} {'lock s':>7} {'max s':>7} {'miss':>5}")
+    for c in candidates[:limit]:
+        print(
+            f"{c['rssi_far']:>5} {c['consecutive_far_required']:>3} {c['false_locks_per_hour']:>7.2f} "
+            f"{c['mean_lock_latency']:>7.2f} {c['max_lock_latency']:>7.2f} {c['missed_locks']:>5}"
+        )
+
+
+def main(argv=None):
+    import time
+
+    parser = argparse.ArgumentParser(description="Tune proximity thresholds over labelled traces")
+    parser.add_argument("traces", nargs="+", help="trace files with <trace>.labels.json next to them")
+    parser.add_argument("--budget", type=float, default=0.5, help="allowed false locks per hour at the desk")
+    parser.add_argument("--step", type=int, default=1, help="dBm step of the threshold grid")
+    parser.add_argument("--far-range", type=int, nargs=2, default=(-100, -40), metavar=("LOW", "HIGH"))
+    parser.add_argument("--filter", choices=FILTER_KINDS, default="none", help="RSSI smoothing to apply first")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--top", type=int, default=10, help="candidates to print")
+    parser.add_argument("--apply", action="store_true", help="write the best setting to the Proxi-Lock config")
+    args = parser.parse_args(argv)
+
+    traces = [load_labelled_trace(path, rssi_filter=args.filter) for path in args.traces]
+    started = time.perf_counter()
+    best, candidates = tune(traces, args.budget, args.step, tuple(args.far_range), workers=args.workers)
+    elapsed = time.perf_counter() - started
+
+    print(f"Evaluated {len(candidates)} candidates over {len(traces)} trace(s) in {elapsed:.2f}s")
+    _print_candidates(candidates, args.top)
+
+    if best is None:
+        print("No setting meets the false-lock budget without missed locks")
+        return 1
+
+    settings = {key: best[key] for key in ("rssi_far", "consecutive_far_required")}
+    print(json.dumps(settings, indent=2))
+
+    if args.apply:
+        from config import get_config
+
+        config = get_config()
+        # The unlocking thresholds are left alone unless rssi_near must move
+        # above the new locking threshold, so the config never sees near <= far
+        if settings["rssi_far"] >= config.rssi_near:
+            config.rssi_near = min(v for v in RSSI_NEAR_CHOICES if v > settings["rssi_far"])
+        config.rssi_far = settings["rssi_far"]
+        config.consecutive_far_required = settings["consecutive_far_required"]
+        print(f"Saved to {config.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())